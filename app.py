@@ -1,77 +1,440 @@
-# app.py — Manual QA (RAG: FAISS + Whoosh + bge-m3 + LLM Extractive JSON)
+# app.py — Manual QA (RAG: FAISS + BM25 + bge-m3 + LLM Extractive JSON)
 # 실행: python -m uvicorn app:app --reload --port 8000
 # 필요 패키지:
-#   pip install fastapi "uvicorn[standard]" requests sentence-transformers faiss-cpu numpy pymupdf whoosh
+#   pip install fastapi "uvicorn[standard]" httpx sentence-transformers faiss-cpu numpy pymupdf whoosh
 
 from fastapi import FastAPI, UploadFile, File, Form, HTTPException
+from fastapi.responses import JSONResponse, StreamingResponse, PlainTextResponse
 from pydantic import BaseModel
-from typing import List, Dict
-import os, re, json, logging, requests
+from typing import List, Dict, Optional, Iterable, Iterator, Tuple
+from concurrent.futures import ThreadPoolExecutor
+import os, re, json, time, asyncio, logging, functools, threading, zipfile, tempfile, itertools, contextvars, zlib
 import numpy as np
-from FlagEmbedding import FlagReranker
-RERANKER = FlagReranker('BAAI/bge-reranker-base', use_fp16=False)  # CPU면 False
+
+from models import ModelSlot, MicroBatcher, MODEL_BACKEND, load_embedding_model, load_reranker
+from caches import LRUCache, SemanticCache, SingleFlight
+from jobs import Job, JobQueue
+from llm import OllamaClient
+import metrics
+from metrics import stage, timed
+import store
+from store import Chunk, DocStore, CorpusView, content_hash
+import partitions
+from partitions import Partitions, PartitionVersion
 
 
 # ---------- Logging ----------
 logging.basicConfig(level=logging.INFO)
 log = logging.getLogger("qa")
 
-# ---------- (선택) PDF 추출 ----------
-try:
-    import fitz  # PyMuPDF
-except Exception:
-    fitz = None
+# ---------- (선택) PDF 추출 (페이지 구간 병렬, pdfx.py) ----------
+import pdfx
+
+# ---------- Embedding / Reranker (지연 로딩) ----------
+from vindex import VectorIndex
+
+EMB_MODEL_NAME = "BAAI/bge-m3"
+RERANKER_NAME = "BAAI/bge-reranker-base"
+DIM = int(os.environ.get("EMB_DIM", "1024"))   # bge-m3 = 1024 (로드 시 검증)
+# QA_PRELOAD=1: 기동 직후 백그라운드 로드 / 0: 첫 요청에서 로드
+PRELOAD_MODELS = os.environ.get("QA_PRELOAD", "1") == "1"
+
+# QA_INFER_ADDR 가 있으면 모델을 이 프로세스에 올리지 않고 공유 추론 프로세스(infer.py)를 호출
+# (uvicorn --workers N 에서도 모델은 1벌, serve.py 참고)
+INFER_ADDR = os.environ.get("QA_INFER_ADDR", "")
+if INFER_ADDR:
+    from infer import InferClient, RemoteEmbedder, RemoteReranker
+    INFER = InferClient(INFER_ADDR)
+    _load_emb_model = lambda: RemoteEmbedder(INFER)
+    _load_reranker = lambda: RemoteReranker(INFER)
+else:
+    INFER = None
+    _load_emb_model = functools.partial(load_embedding_model, EMB_MODEL_NAME, DIM)
+    _load_reranker = functools.partial(load_reranker, RERANKER_NAME)
 
-# ---------- Embedding / FAISS ----------
-from sentence_transformers import SentenceTransformer
-import faiss
+EMB = ModelSlot("bge-m3", _load_emb_model,
+                warmup=lambda m: m.encode(["query: 워밍업"], normalize_embeddings=True))
+RERANK = ModelSlot("bge-reranker-base", _load_reranker,
+                   warmup=lambda m: m.compute_score([["워밍업", "워밍업 문장입니다."]]))
+MODEL_SLOTS = [EMB, RERANK]
 
-# 임베딩 모델 (한국어/다국어 강함)
-EMB_MODEL = SentenceTransformer("BAAI/bge-m3")
-DIM = EMB_MODEL.get_sentence_embedding_dimension()
-FAISS_INDEX = faiss.IndexFlatIP(DIM)   # normalized + inner-product = cosine
-INDEX2DOC: List[int] = []              # FAISS row -> DOCS index 매핑
+# flat → (코퍼스가 QA_ANN_THRESHOLD 를 넘으면) HNSW/IVF 자동 승격, vindex.py 참고
+FAISS_INDEX = VectorIndex(DIM)        # 벡터 id = DOCS row
 
 # bge 프리픽스
 BGE_QUERY_PREFIX   = "query: "
 BGE_PASSAGE_PREFIX = "passage: "
 
+# 문서 임베딩 배치 크기 (CPU 는 16~64 근처가 처리량 최대, bench.py ingest 로 확인)
+EMB_BATCH_SIZE = int(os.environ.get("QA_EMB_BATCH_SIZE", "32"))
+
 def embed_passages(texts: List[str]) -> np.ndarray:
     inputs = [BGE_PASSAGE_PREFIX + (t or "") for t in texts]
-    return EMB_MODEL.encode(inputs, normalize_embeddings=True).astype("float32")
+    return EMB.get().encode(inputs, batch_size=EMB_BATCH_SIZE, normalize_embeddings=True).astype("float32")
 
 def embed_queries(texts: List[str]) -> np.ndarray:
     inputs = [BGE_QUERY_PREFIX + (t or "") for t in texts]
-    return EMB_MODEL.encode(inputs, normalize_embeddings=True).astype("float32")
+    return EMB.get().encode(inputs, normalize_embeddings=True).astype("float32")
+
+# ---------- 요청 간 마이크로 배칭 (질의 임베딩 / 리랭크) ----------
+# 동시 요청의 입력을 QA_BATCH_WINDOW_MS 동안(또는 QA_BATCH_MAX 개까지) 모아 한 번의 forward 로 처리
+# 추론 프로세스 모드(QA_INFER_ADDR)면 infer.py 가 워커 전체 요청을 모으므로 여기서는 모으지 않는다 (창을 두 번 기다리지 않게)
+MICROBATCH = os.environ.get("QA_MICROBATCH", "1") == "1" and not INFER_ADDR
+BATCH_WINDOW_MS = float(os.environ.get("QA_BATCH_WINDOW_MS", "5"))
+RERANK_BATCH_SIZE = int(os.environ.get("QA_RERANK_BATCH_SIZE", "32"))   # compute_score 내부 배치
+
+def _rerank_batch(pair_lists: List[List[List[str]]]) -> List[List[float]]:
+    # 여러 요청의 (질의, 청크) 쌍을 이어 붙여 compute_score 1회 → 요청별로 다시 분할
+    flat = [p for pl in pair_lists for p in pl]
+    scores = RERANK.get().compute_score(flat, batch_size=RERANK_BATCH_SIZE)
+    if not isinstance(scores, list):   # 쌍이 1개면 float 반환
+        scores = [scores]
+    out, pos = [], 0
+    for pl in pair_lists:
+        out.append(scores[pos:pos + len(pl)])
+        pos += len(pl)
+    return out
 
-# ---------- Whoosh (BM25 키워드 검색) ----------
+QUERY_BATCHER = MicroBatcher("query-embed", lambda texts: list(embed_queries(texts)),
+                             max_items=int(os.environ.get("QA_BATCH_MAX", "32")),
+                             window_ms=BATCH_WINDOW_MS, enabled=MICROBATCH)
+RERANK_BATCHER = MicroBatcher("rerank", _rerank_batch,
+                              max_items=int(os.environ.get("QA_RERANK_BATCH_MAX", "128")),
+                              window_ms=BATCH_WINDOW_MS, size_fn=len, enabled=MICROBATCH)
+
+# ---------- 캐시 (질의 임베딩 LRU / 답변 캐시) ----------
+# 질의 임베딩: normalize_query_kor 결과 문자열 → 벡터 (코퍼스와 무관)
+QUERY_EMB_CACHE = LRUCache(int(os.environ.get("QA_QEMB_CACHE_SIZE", "4096")),
+                           ttl=float(os.environ.get("QA_QEMB_CACHE_TTL", "3600")))
+# 답변: (정규화 질의, top_k, 코퍼스 generation) → /ask 응답. ingest 시 비움
+ANSWER_CACHE = LRUCache(int(os.environ.get("QA_ANSWER_CACHE_SIZE", "1024")),
+                        ttl=float(os.environ.get("QA_ANSWER_CACHE_TTL", "600")))
+# 의미 캐시: 과거 질의 벡터와 코사인 유사도 ≥ threshold 면 답변 재사용 (근거 청크 단위 무효화 + TTL)
+# 값은 /ask 응답 그대로라 source/fallback 이 함께 남는다 (fallback 답은 cacheable() 에서 걸러 넣지 않음)
+SEMANTIC_CACHE = SemanticCache(DIM, threshold=float(os.environ.get("QA_SEMCACHE_THRESHOLD", "0.95")),
+                               maxsize=int(os.environ.get("QA_SEMCACHE_SIZE", "2048")),
+                               ttl=float(os.environ.get("QA_SEMCACHE_TTL", "3600")) or None)
+
+@timed("embed_query")
+def embed_query(qn: str) -> np.ndarray:
+    """정규화된 질의 1개의 벡터 (DIM,). LRU 캐시 → 미스면 요청 간 마이크로 배칭으로 임베딩"""
+    v = QUERY_EMB_CACHE.get(qn)
+    if v is None:
+        v = QUERY_BATCHER(qn)
+        v.setflags(write=False)
+        QUERY_EMB_CACHE.put(qn, v)
+    return v
+
+@timed("embed_query")
+def embed_query_batch(qns: List[str]) -> np.ndarray:
+    """정규화된 질의 여러 개 → (n, DIM). 캐시 미스만 모아 encode 1회 (/ask_batch, 이미 배치이므로 마이크로 배칭 생략)"""
+    vecs = [QUERY_EMB_CACHE.get(q) for q in qns]
+    miss = [i for i, v in enumerate(vecs) if v is None]
+    if miss:
+        for i, v in zip(miss, embed_queries([qns[i] for i in miss])):
+            v.setflags(write=False)
+            QUERY_EMB_CACHE.put(qns[i], v)
+            vecs[i] = v
+    return np.stack(vecs) if vecs else np.zeros((0, DIM), dtype="float32")
+
+# ---------- 키워드 검색 (인메모리 BM25 기본 / QA_KEYWORD=whoosh 로 이전 방식) ----------
 from whoosh.fields import Schema, TEXT, ID
 from whoosh.index import create_in, open_dir
 from whoosh.qparser import MultifieldParser
 from whoosh import scoring
+from bm25 import BM25Index
+
+KEYWORD_ENGINE = os.environ.get("QA_KEYWORD", "bm25")   # bm25 | whoosh
+BM25 = BM25Index()   # 문서 번호 = DOCS row, 기동 시 DOCS 에서 구축
+# title(컬렉션)별 파티션: AskReq.collections 로 범위를 좁힌 질의는 그 title 의 row 만 검색 (partitions.py)
+PARTITIONS = Partitions(keyword=KEYWORD_ENGINE == "bm25")
 
 WHOOSH_DIR = "whoosh_index"
-os.makedirs(WHOOSH_DIR, exist_ok=True)
 SCHEMA = Schema(id=ID(stored=True), title=TEXT(stored=True), text=TEXT(stored=True))
-IX = create_in(WHOOSH_DIR, SCHEMA) if not os.listdir(WHOOSH_DIR) else open_dir(WHOOSH_DIR)
+IX = None
+if KEYWORD_ENGINE == "whoosh":
+    os.makedirs(WHOOSH_DIR, exist_ok=True)
+    IX = create_in(WHOOSH_DIR, SCHEMA) if not os.listdir(WHOOSH_DIR) else open_dir(WHOOSH_DIR)
 
-def add_to_whoosh(new_docs: List[Dict]):
+def add_to_whoosh(new_docs: List[Chunk]):
     writer = IX.writer()
     for d in new_docs:
-        writer.add_document(id=d["id"], title=d["title"], text=d["text"])
+        writer.add_document(id=d.id, title=d.title, text=d.text)
     writer.commit()
 
-def search_keyword(query: str, top_k=12):
+def delete_from_whoosh(chunk_ids: List[str]):
+    writer = IX.writer()
+    for cid in chunk_ids:
+        writer.delete_by_term("id", cid)
+    writer.commit()
+
+def search_keyword_whoosh(query: str, top_k=12, view: Optional[CorpusView] = None):
     with IX.searcher(weighting=scoring.BM25F()) as searcher:
         q = MultifieldParser(["title", "text"], schema=IX.schema).parse(query)
-        hits = list(searcher.search(q, limit=top_k))
-        return [(float(h.score), h["id"]) for h in hits]
+        hits = [(float(h.score), h["id"]) for h in searcher.search(q, limit=top_k)]
+    if view is None:
+        return hits
+    # Whoosh 는 자체 커밋 단위로 보이므로 view 에 없는 청크(그 뒤에 추가/삭제된 것)는 거른다
+    out = []
+    for score, cid in hits:
+        row = DOCS.find(cid)
+        if row is not None and view.visible(row):
+            out.append((score, cid))
+    return out
+
+def search_keyword_bm25(query: str, top_k=12, view: Optional[CorpusView] = None, collections=None):
+    view = pin_view() if view is None else view
+    if collections:
+        hits = partitions.search_keyword(collection_parts(view, collections), query, top_k)
+    else:
+        hits = BM25.search(query, top_k, state=view.keyword)
+    out = []
+    for score, row in hits:
+        c = DOCS[row] if view.visible(row) else None
+        if c is not None:
+            out.append((score, c.id))
+    return out
+
+@timed("search_keyword")
+def search_keyword(query: str, top_k=12, view: Optional[CorpusView] = None, collections=None):
+    """키워드 후보 [(score, chunk id)]. collections: 이 title 들의 파티션만"""
+    if KEYWORD_ENGINE == "bm25":
+        return search_keyword_bm25(query, top_k, view, collections)
+    if not collections:
+        return search_keyword_whoosh(query, top_k, view)
+    # Whoosh 는 키워드 파티션이 없어 넉넉히 뽑은 뒤 title 로 거른다
+    wanted, out = set(collections), []
+    for score, cid in search_keyword_whoosh(query, top_k * 4, view):
+        c = view_chunk(view, cid)
+        if c is not None and c.title in wanted:
+            out.append((score, cid))
+    return out[:top_k]
+
+def view_chunk(view: CorpusView, chunk_id: str) -> Optional[Chunk]:
+    # id → view 에 보이는 청크 (view 를 잡은 뒤 삭제/교체된 청크도 그 view 에서는 그대로 보인다)
+    row = DOCS.find(chunk_id)
+    return DOCS[row] if row is not None and view.visible(row) else None
+
+def keyword_text(d: Chunk) -> str:
+    # Whoosh 의 title/text 멀티필드 검색과 같게 title 도 함께 색인
+    return f"{d.title}\n{d.text}"
+
+def add_to_keyword(new_docs: List[Chunk]):
+    if KEYWORD_ENGINE == "whoosh":
+        add_to_whoosh(new_docs)
+    else:
+        BM25.add([DOCS.row(d.id) for d in new_docs], [keyword_text(d) for d in new_docs])
+
+def delete_from_keyword(chunk_ids: List[str], rows: List[int], texts: List[str]):
+    # texts: 삭제 청크의 keyword_text (BM25 포스팅에서 뺄 term)
+    if KEYWORD_ENGINE == "whoosh":
+        delete_from_whoosh(chunk_ids)
+    else:
+        BM25.remove(rows, texts)
+
+def add_to_partitions(rows: List[int]):
+    texts = (keyword_text(DOCS[r]) for r in rows) if PARTITIONS.keyword else itertools.repeat("")
+    PARTITIONS.add(rows, (DOCS[r].title for r in rows), texts)
+
+def collection_parts(view: CorpusView, collections: Iterable[str]) -> List[PartitionVersion]:
+    # view 시점에 있는 컬렉션만 (요청 도중 삭제된 title 은 빈 결과)
+    return [view.partitions[t] for t in collections if t in view.partitions]
 
 # ---------- App ----------
 app = FastAPI(title="Manual QA (RAG + bge-m3 + Hybrid + LLM-JSON)")
 
-# In-memory 문서 저장
-DOCS: List[Dict] = []   # {"id": str, "title": str, "chunk_idx": int, "text": str}
+@app.on_event("startup")
+def start_model_loading():
+    # 바인딩을 막지 않도록 백그라운드에서 로드 (+ 워밍업 추론)
+    if PRELOAD_MODELS:
+        for slot in MODEL_SLOTS:
+            slot.start(background=True)
+    if SHARED:
+        threading.Thread(target=follow_store, name="store-sync", daemon=True).start()
+
+@app.on_event("shutdown")
+async def close_clients():
+    await OLLAMA.aclose()
+    pdfx.shutdown()
+    WRITE_POOL.shutdown(wait=False)
+
+# CPU 구간(임베딩/검색/리랭크)은 이벤트 루프 밖의 제한된 스레드풀에서 실행
+CPU_POOL = ThreadPoolExecutor(max_workers=int(os.environ.get("QA_CPU_WORKERS", str((os.cpu_count() or 4) + 4))),
+                              thread_name_prefix="cpu")
+# 동일 질문(정규화 질의, top_k, 코퍼스 버전) 동시 요청 합치기
+ASK_FLIGHT = SingleFlight()
+
+# 업로드 저장/ingest/삭제는 전용 스레드 1개에서 (INGEST_LOCK 을 기다리는 쓰기 요청이 CPU_POOL 스레드를 붙잡아
+# /ask 의 임베딩/검색/리랭크가 멈추지 않게). 쓰기는 어차피 락으로 한 번에 하나라 스레드를 늘려도 빨라지지 않는다
+WRITE_POOL = ThreadPoolExecutor(max_workers=1, thread_name_prefix="write")
+
+async def run_cpu(fn, *args, pool: ThreadPoolExecutor = CPU_POOL):
+    # 요청 컨텍스트(구간 타이머 breakdown)를 스레드까지 넘긴다
+    ctx = contextvars.copy_context()
+    return await asyncio.get_running_loop().run_in_executor(pool, ctx.run, functools.partial(fn, *args))
+
+async def run_write(fn, *args):
+    return await run_cpu(fn, *args, pool=WRITE_POOL)
+
+# ---------- 메트릭 (/metrics, Prometheus 텍스트 포맷) ----------
+# 구간별 시간은 metrics.STAGE_SECONDS (qa_stage_seconds{stage=...}), 요청 전체는 아래 히스토그램
+REQUEST_SECONDS = metrics.Histogram("qa_request_seconds", "엔드포인트별 전체 처리 시간", ("endpoint",))
+CACHE_HITS = metrics.Counter("qa_cache_hits_total", "답변 캐시 적중 (exact | semantic)", ("cache",))
+LLM_FALLBACKS = metrics.Counter("qa_llm_fallback_total",
+                                "LLM 답 대신 extractive_answer 로 답한 횟수 (error: 호출/파싱 실패, invalid: 근거 검증 실패)",
+                                ("reason",))
+INGESTED_CHUNKS = metrics.Counter("qa_ingested_chunks_total", "등록한 청크 수")
+DELETED_CHUNKS = metrics.Counter("qa_deleted_chunks_total", "삭제한 청크 수")
+metrics.Gauge("qa_docs", "살아있는 청크 수", lambda: len(DOCS))
+metrics.Gauge("qa_faiss_rows", "벡터 인덱스의 살아있는 벡터 수", lambda: FAISS_INDEX.ntotal)
+metrics.Gauge("qa_faiss_delta", "base 에 아직 합치지 않은 delta 벡터 수", lambda: FAISS_INDEX.version.n_delta)
+metrics.Gauge("qa_store_generation", "스냅샷 generation", lambda: corpus_version())
+
+# In-memory 문서 저장 (row 순서 청크 + id → row 인덱스)
+DOCS = DocStore()
+
+# ---------- 온디스크 스냅샷 (재시작 시 재임베딩 없이 복원) ----------
+
+STORE_DIR = os.environ.get("QA_STORE_DIR", "index_store")
+STORE_MANIFEST: Dict = {}
+# 스냅샷 float 벡터 (row 순, mmap). 양자화 인덱스의 후보 재계산(rescore)과 ANN 재구축에 사용
+STORE_VECS = np.zeros((0, DIM), dtype="float32")
+# 기동 시 삭제된 row 비율이 이 값 이상이면 스냅샷을 살아있는 row 만으로 다시 쓴다
+COMPACT_RATIO = float(os.environ.get("QA_COMPACT_RATIO", "0.3"))
+# QA_SHARED=1: uvicorn --workers N 이 같은 STORE_DIR 을 공유. 쓰기는 파일 락으로 한 번에 한 워커,
+# 나머지 워커는 QA_SYNC_INTERVAL 초마다 manifest 를 보고 추가/삭제분만 따라 읽는다 (벡터/ANN 은 mmap 으로 공유)
+SHARED = os.environ.get("QA_SHARED", "0") == "1"
+SYNC_INTERVAL = float(os.environ.get("QA_SYNC_INTERVAL", "0.5"))
+
+def rebuild_whoosh(docs: List[Chunk]):
+    # 스냅샷과 어긋난 Whoosh 인덱스는 청크 본문에서 다시 만든다 (임베딩 불필요)
+    global IX
+    IX = create_in(WHOOSH_DIR, SCHEMA)
+    if docs:
+        add_to_whoosh(docs)
+
+def restore_from_store():
+    global STORE_MANIFEST, STORE_VECS
+    t0 = time.perf_counter()
+    # 공유 모드에서는 compaction(row 번호 변경 + 디렉터리 교체)을 하지 않는다: 다른 워커의 row 가 어긋난다
+    if not SHARED:
+        store.recover_compaction(STORE_DIR)
+        if store.compact_snapshot(STORE_DIR, DIM, EMB_MODEL_NAME, COMPACT_RATIO):
+            log.info(f"restore: snapshot compacted, {time.perf_counter() - t0:.2f}s")
+    docs, vecs, manifest = store.load_snapshot(STORE_DIR, DIM, EMB_MODEL_NAME)
+    if docs:
+        DOCS.extend(docs)
+        DOCS.remove_rows(store.load_deleted(STORE_DIR, manifest))
+    FAISS_INDEX.load(STORE_DIR, vecs, DOCS.live_rows())
+    STORE_MANIFEST, STORE_VECS = manifest, vecs
+    if KEYWORD_ENGINE == "whoosh":
+        if IX.doc_count() != len(DOCS):
+            log.info(f"restore: whoosh docs={IX.doc_count()} != snapshot={len(DOCS)} → rebuild")
+            rebuild_whoosh(DOCS)
+    else:
+        t1 = time.perf_counter()
+        live = DOCS.live_rows()
+        BM25.add(live.tolist(), (keyword_text(DOCS[r]) for r in live))
+        log.info(f"restore: bm25 docs={len(BM25)}, terms={BM25.stats()['terms']}, {time.perf_counter() - t1:.2f}s")
+    t1 = time.perf_counter()
+    add_to_partitions(DOCS.live_rows().tolist())
+    log.info(f"restore: partitions={len(PARTITIONS)}, {time.perf_counter() - t1:.2f}s")
+    publish_view()
+    log.info(f"restore: docs={len(DOCS)}, generation={manifest['generation']}, "
+             f"index={FAISS_INDEX.kind}/{FAISS_INDEX.storage}, {time.perf_counter() - t0:.2f}s")
+
+def persist_snapshot(new_docs: List[Chunk], vecs: np.ndarray, deleted_rows: List[int] = ()):
+    global STORE_MANIFEST, STORE_VECS
+    if not new_docs and not deleted_rows:
+        return
+    sent_row = int(STORE_MANIFEST.get("sent_count", 0))
+    STORE_MANIFEST = store.append_snapshot(STORE_DIR, STORE_MANIFEST, new_docs, vecs, deleted_rows)
+    STORE_VECS = store.load_vectors(STORE_DIR, STORE_MANIFEST)
+    store.map_sent_vectors(STORE_DIR, STORE_MANIFEST, new_docs, sent_row)   # 문장 벡터도 힙 → mmap
+    ANSWER_CACHE.clear()   # 코퍼스가 바뀌었으므로 이전 답변 무효화 (키에도 generation 포함)
+    # 코퍼스 크기가 임계치를 넘으면 스냅샷 벡터(mmap)로 ANN/양자화 재구축, 아니면 필요 시 재저장
+    if not FAISS_INDEX.maybe_promote(STORE_VECS, DOCS.live_rows(), STORE_DIR):
+        FAISS_INDEX.maybe_save(STORE_DIR)
+
+def corpus_version() -> int:
+    # 스냅샷 generation: ingest/삭제마다 1 증가 (답변 캐시 키)
+    return int(STORE_MANIFEST.get("generation", 0))
+
+# ---------- 읽기용 코퍼스 버전 (snapshot isolation) ----------
+# 요청은 시작할 때 pin_view() 로 view 하나를 잡고 검색/폴백/캐시 키를 모두 그 버전으로 처리한다.
+# writer(INGEST_LOCK 보유)는 DOCS/FAISS/BM25/스냅샷을 모두 반영한 뒤 publish_view() 로 참조만 교체한다.
+CORPUS_VIEW = CorpusView(0, np.zeros(0, dtype=bool), FAISS_INDEX.version, BM25.state)
+
+def pin_view() -> CorpusView:
+    return CORPUS_VIEW
+
+def publish_view(removed_rows: Iterable[int] = ()):
+    """이전 view 의 alive 에 새 row 를 붙이고 removed_rows 를 지운 새 view 게시 (INGEST_LOCK 안에서)"""
+    global CORPUS_VIEW
+    old = CORPUS_VIEW
+    alive = np.zeros(DOCS.n_rows, dtype=bool)
+    alive[:old.rows] = old.alive
+    alive[old.rows:] = [DOCS.alive(r) for r in range(old.rows, DOCS.n_rows)]
+    removed = np.asarray(list(removed_rows), dtype="int64")
+    alive[removed] = False
+    CORPUS_VIEW = CorpusView(corpus_version(), alive, FAISS_INDEX.version,
+                             BM25.state if KEYWORD_ENGINE == "bm25" else None, PARTITIONS.versions(),
+                             seq=old.seq + 1)
+    del old   # 이전 view 는 그것을 잡은 요청이 끝나면 풀린다 → 그 view 만 보던 삭제 청크도 다음 publish 에서 놓는다
+    DOCS.publish(CORPUS_VIEW)
+
+def sync_from_store():
+    """(공유 모드, INGEST_LOCK 획득 시) 다른 워커가 스냅샷에 쓴 추가/삭제분을 DOCS/벡터/키워드 인덱스/캐시에 반영.
+    Whoosh 는 디렉터리를 공유하므로 건드리지 않는다."""
+    global STORE_MANIFEST, STORE_VECS
+    if not STORE_MANIFEST:   # restore_from_store() 전
+        return
+    tail = store.load_tail(STORE_DIR, STORE_MANIFEST)
+    if tail is None:
+        return
+    t0 = time.perf_counter()
+    docs, vecs, deleted, manifest = tail
+    for title in {d.title for d in docs}:
+        SEMANTIC_CACHE.invalidate_chunks(c.id for c in DOCS.by_title(title))
+    new_rows = DOCS.extend(docs)
+    gone = {int(r): DOCS[r] for r in deleted if DOCS.alive(int(r))}
+    SEMANTIC_CACHE.invalidate_chunks(c.id for c in gone.values())
+    DOCS.remove(c.id for c in gone.values())
+    removed = [r for r in gone if r < new_rows.start]   # 이번에 추가됐다가 바로 삭제된 row 는 인덱스에 넣지 않는다
+    removed_texts = [keyword_text(gone[r]) for r in removed]
+    added = [r for r in new_rows if DOCS.alive(r)]
+    if KEYWORD_ENGINE == "bm25":
+        BM25.add(added, [keyword_text(DOCS[r]) for r in added])
+        BM25.remove(removed, removed_texts)
+    STORE_MANIFEST, STORE_VECS = manifest, vecs
+    FAISS_INDEX.follow(vecs, np.asarray(added, dtype="int64"), np.asarray(removed, dtype="int64"),
+                       DOCS.live_rows())
+    PARTITIONS.remove(removed, removed_texts)
+    add_to_partitions(added)
+    ANSWER_CACHE.clear()
+    publish_view(removed)
+    log.info(f"sync: +{len(added)} -{len(removed)} → generation={manifest['generation']}, "
+             f"{time.perf_counter() - t0:.2f}s")
+
+# DOCS/FAISS/키워드 인덱스/스냅샷 쓰기는 한 번에 하나만 (청크 id 의 전역 순번도 이 락 안에서 배정).
+# 공유 모드: 워커 간 파일 락 + 잡은 직후 sync_from_store() 로 다른 워커의 변경분부터 반영 (row 번호 일치)
+INGEST_LOCK = store.WriteLock(STORE_DIR, shared=SHARED, on_acquire=sync_from_store)
+
+def follow_store():
+    # 공유 모드 백그라운드 스레드: manifest generation 이 바뀌면 락을 잡아(→ sync_from_store) 따라잡는다
+    while True:
+        time.sleep(SYNC_INTERVAL)
+        try:
+            manifest = store.read_manifest(STORE_DIR)
+            if manifest is not None and manifest.get("generation") != STORE_MANIFEST.get("generation"):
+                with INGEST_LOCK:
+                    pass
+        except Exception:
+            log.exception("sync: failed")
+
+# 공유 모드에서 여러 워커가 동시에 떠도 ANN 구축/저장은 한 워커만 (뒤 워커는 저장본을 mmap 으로 연다)
+with INGEST_LOCK:
+    restore_from_store()
 
 # ---------- Utils ----------
 def normalize(text: str) -> str:
@@ -105,15 +468,50 @@ def split_sentences(text: str):
             out.append(p)
     return [x for x in out if len(x) >= 2 and not is_header_like(x)]
 
+# 청크 경계: 줄/문장 단위로 채우되 자르는 자리는 내용으로 정한다 (고정 400자 창이면 앞에서 한 글자만 늘어도
+# 뒤 청크가 전부 밀려 해시가 달라지고 전부 재임베딩된다). 문단 끝이나 해시가 맞는 문장 끝에서 자르므로
+# 고친 곳 이후로는 곧 같은 경계로 돌아와, 바뀐 부분의 청크만 새 해시가 된다.
+CHUNK_CUT_EVERY = 4   # 문장 crc32 % 4 == 0 이면 (청크가 절반 이상 찼을 때) 그 뒤에서 자른다
+
+def chunk_units(txt: str, size: int) -> Iterator[Tuple[str, bool]]:
+    """원문 → (문장, 문단 끝 여부). 빈 줄/헤더 줄 앞은 문단 끝, size 보다 긴 문장은 size 씩 자른다"""
+    prev = None
+    for line in txt.splitlines():
+        ln = normalize(line)
+        if not ln or is_header_like(ln):
+            if prev is not None:
+                yield prev, True
+                prev = None
+            if not ln:
+                continue
+        for sent in re.split(r"(?<=[.!?])\s+", ln):
+            for i in range(0, len(sent), size):
+                if prev is not None:
+                    yield prev, False
+                prev = sent[i:i + size]
+    if prev is not None:
+        yield prev, True
+
 def chunk_text(txt: str, size: int = 400, overlap: int = 80):
-    t = normalize(txt)
-    chunks, start = [], 0
-    while start < len(t):
-        end = min(start + size, len(t))
-        chunks.append(t[start:end])
-        if end >= len(t):
-            break
-        start = end - overlap
+    """내용 기준 경계로 청크 분할 (위 CHUNK_CUT_EVERY 참고). 청크는 최대 size 자 (문장 사이 공백 포함).
+    overlap: 앞 청크의 마지막 문장이 이 길이 이하면 다음 청크 앞에 붙여 문맥을 잇는다."""
+    limit = max(size - overlap - 1, size // 2)
+    chunks, cur, n, tail = [], [], 0, None
+    def flush():
+        nonlocal cur, n, tail
+        head = [tail] if tail is not None else []
+        chunks.append(" ".join(head + cur))
+        tail = cur[-1] if len(cur[-1]) <= overlap else None
+        cur, n = [], 0
+    for sent, para_end in chunk_units(txt, limit):
+        if cur and n + 1 + len(sent) > limit:
+            flush()
+        n += len(sent) + (1 if cur else 0)
+        cur.append(sent)
+        if n >= limit // 2 and (para_end or zlib.crc32(sent.encode("utf-8")) % CHUNK_CUT_EVERY == 0):
+            flush()
+    if cur:
+        flush()
     return chunks
 
 def score_chunk(query: str, chunk: str) -> int:
@@ -122,13 +520,54 @@ def score_chunk(query: str, chunk: str) -> int:
     tokens = re.findall(r"[\w가-힣]+", q)
     return sum(c.count(tok) for tok in tokens)
 
-def add_to_index(new_docs: List[Dict]):
+# ---------- 문장 분리/임베딩 사전 계산 (ingest 시 1회, 질의 시에는 내적만) ----------
+def sentence_offsets(text: str) -> np.ndarray:
+    """split_sentences 결과를 청크 본문 내 (start, end) 오프셋으로 변환 (청크 본문은 이미 normalize 됨)"""
+    spans, pos = [], 0
+    for sent in split_sentences(text):
+        i = text.find(sent, pos)
+        if i < 0:
+            i = text.find(sent)
+        if i < 0:
+            continue
+        spans.append((i, i + len(sent)))
+        pos = i + len(sent)
+    return np.asarray(spans, dtype="int32").reshape(-1, 2)
+
+def chunk_sentences(c: Chunk) -> List[str]:
+    if c.sents is None:
+        return split_sentences(c.text)
+    return [c.text[s:e] for s, e in c.sents]
+
+@timed("ingest.sentences")
+def prepare_sentences(new_docs: List[Chunk]):
+    # 모든 청크의 문장을 한 번에 임베딩한 뒤 청크별 구간(view)으로 나눠 붙인다 (이미 있는 청크는 건너뜀)
+    new_docs = [c for c in new_docs if c.sents is None or c.sent_vecs is None]
+    for c in new_docs:
+        c.sents = sentence_offsets(c.text)
+    flat = [c.text[s:e] for c in new_docs for s, e in c.sents]
+    vecs = embed_passages(flat) if flat else np.zeros((0, DIM), dtype="float32")
+    pos = 0
+    for c in new_docs:
+        c.sent_vecs = vecs[pos:pos + len(c.sents)]
+        pos += len(c.sents)
+
+def add_to_index(new_docs: List[Chunk], reused: Optional[Dict[int, int]] = None) -> np.ndarray:
+    """DOCS 에 들어간 청크를 FAISS 에 추가 (id = DOCS row).
+    reused: new_docs 위치 → 본문이 같은 기존 청크의 스냅샷 row (임베딩하지 않고 벡터 복사)"""
     if not new_docs:
-        return
-    vecs = embed_passages([d["text"] for d in new_docs])
-    FAISS_INDEX.add(vecs)
-    start = len(DOCS) - len(new_docs)
-    INDEX2DOC.extend([start + i for i in range(len(new_docs))])
+        return np.zeros((0, DIM), dtype="float32")
+    reused = reused or {}
+    vecs = np.zeros((len(new_docs), DIM), dtype="float32")
+    fresh = [i for i in range(len(new_docs)) if i not in reused]
+    if fresh:
+        with stage("ingest.embed"):
+            vecs[fresh] = embed_passages([new_docs[i].text for i in fresh])
+    if reused:
+        pos = list(reused)
+        vecs[pos] = STORE_VECS[[reused[i] for i in pos]]
+    with stage("ingest.faiss_add"):
+        FAISS_INDEX.add(vecs, [DOCS.row(d.id) for d in new_docs])
     try:
         log.info(
             f"add_to_index: n={len(new_docs)}, vecs={vecs.shape}, dtype={vecs.dtype}, "
@@ -136,71 +575,121 @@ def add_to_index(new_docs: List[Dict]):
         )
     except Exception:
         pass
+    return vecs
 
-def search_vector(query: str, top_k: int = 4) -> List[Dict]:
+def vector_search(qv: np.ndarray, k: int, view: CorpusView, collections=None):
+    """전역 인덱스 검색 → (D, I), I = DOCS row. collections 가 있으면 그 컬렉션 row 만 (selector / 작으면 전수 내적).
+    양자화 저장이면 후보를 스냅샷 float 벡터로 재계산 (QA_VEC_RESCORE)"""
+    rows = partitions.collection_rows(collection_parts(view, collections)) if collections else None
+    return FAISS_INDEX.search(qv, k, exact=STORE_VECS, version=view.vectors, rows=rows)
+
+@timed("search_vector")
+def search_vector(query: str, top_k: int = 4, view: Optional[CorpusView] = None, collections=None) -> List[Chunk]:
+    view = pin_view() if view is None else view
     try:
-        if FAISS_INDEX.ntotal == 0:
+        if view.vectors.ntotal == 0:
             log.info("search_vector: index empty")
             return []
-        qv = embed_queries([query])
-        if qv.ndim == 1:
-            qv = qv.reshape(1, -1)
-        D, I = FAISS_INDEX.search(qv, max(top_k * 3, 6))
+        qv = embed_query(query).reshape(1, -1)
+        # 벡터 id = DOCS row (삭제된 청크는 인덱스에서도 빠져 있음), view 가 잡은 인덱스 버전으로 검색
+        D, I = vector_search(qv, top_k, view, collections)
         try:
             log.info(f"search_vector: q_norm≈{float(np.linalg.norm(qv[0])):.3f}, topI={I[0][:5].tolist()}")
         except Exception:
             pass
-        seen, picked = set(), []
-        for idx in I[0]:
-            if idx == -1:
-                continue
-            doc_idx = INDEX2DOC[idx]
-            if doc_idx in seen:
-                continue
-            seen.add(doc_idx)
-            picked.append(DOCS[doc_idx])
-            if len(picked) >= top_k:
-                break
-        return picked
+        return vector_hits(I[0], top_k, view)
     except Exception as e:
         log.exception(f"search_vector error: {e}")
         return []
 
-def search_hybrid(query: str, top_k=4, alpha=0.6) -> List[Dict]:
+@timed("search_vector")
+def search_vector_batch(qvs: np.ndarray, top_k: int, view: CorpusView, collections=None) -> List[List[Chunk]]:
+    """질의 벡터 행렬 (n, DIM) → 질의별 후보. FAISS 검색 1회 (컬렉션 필터면 파티션마다 1회)"""
+    try:
+        if view.vectors.ntotal == 0 or not len(qvs):
+            return [[] for _ in range(len(qvs))]
+        D, I = vector_search(np.ascontiguousarray(qvs, dtype="float32"), top_k, view, collections)
+        return [vector_hits(row, top_k, view) for row in I]
+    except Exception as e:
+        log.exception(f"search_vector_batch error: {e}")
+        return [[] for _ in range(len(qvs))]
+
+def vector_hits(ids: np.ndarray, top_k: int, view: CorpusView) -> List[Chunk]:
+    # FAISS 결과 1행 (row 번호) → view 에 보이는 청크 top_k
+    seen, picked = set(), []
+    for idx in ids:
+        if idx == -1 or not view.visible(int(idx)):
+            continue
+        doc = DOCS[int(idx)]
+        if doc is None or doc.id in seen:
+            continue
+        seen.add(doc.id)
+        picked.append(doc)
+        if len(picked) >= top_k:
+            break
+    return picked
+
+@timed("search_hybrid")
+def search_hybrid(query: str, top_k=4, alpha=0.6, view: Optional[CorpusView] = None,
+                  collections=None) -> List[Chunk]:
+    view = pin_view() if view is None else view
     # 1) 벡터 후보
-    vec_docs = search_vector(query, top_k=max(top_k*3, 12))
+    vec_docs = search_vector(query, top_k=max(top_k*3, 12), view=view, collections=collections)
     # 2) 키워드 후보
-    kw_hits = search_keyword(query, top_k=max(top_k*6, 24))
+    kw_hits = search_keyword(query, top_k=max(top_k*6, 24), view=view, collections=collections)
     # 3) 가중 결합
+    return fuse_hybrid(vec_docs, kw_hits, top_k, alpha, view)
+
+def fuse_hybrid(vec_docs: List[Chunk], kw_hits, top_k: int, alpha: float, view: CorpusView) -> List[Chunk]:
+    """벡터 순위(RRF) × alpha + 키워드 점수 × (1 - alpha) → 상위 top_k (모자라면 벡터 후보로 채움).
+    키워드 후보 id 는 view 로 찾는다 (요청 도중 삭제/교체된 청크도 view 에 있으면 그대로)"""
     pool = {}
     for rank, d in enumerate(vec_docs, start=1):
-        pool[d["id"]] = pool.get(d["id"], 0.0) + alpha * (1.0 / (60.0 + rank))
+        pool[d.id] = pool.get(d.id, 0.0) + alpha * (1.0 / (60.0 + rank))
     for score, did in kw_hits:
         pool[did] = pool.get(did, 0.0) + (1.0 - alpha) * (score / 100.0)
     ranked = sorted(pool.items(), key=lambda x: x[1], reverse=True)
-    out = []
+    out, seen = [], set()
     for did, _ in ranked:
-        doc = next((x for x in DOCS if x["id"] == did), None)
-        if doc and doc not in out:
+        doc = view_chunk(view, did)   # O(1) id → chunk
+        if doc is not None and did not in seen:
+            seen.add(did)
             out.append(doc)
         if len(out) >= top_k:
             break
     for d in vec_docs:
         if len(out) >= top_k: break
-        if d not in out: out.append(d)
+        if d.id not in seen:
+            seen.add(d.id)
+            out.append(d)
     return out
 
-def rerank(query: str, docs: List[Dict], top_k=4) -> List[Dict]:
+@timed("rerank")
+def rerank(query: str, docs: List[Chunk], top_k=4) -> List[Chunk]:
     # 하이브리드 상위 후보를 교차-인코더로 정밀 재정렬
     if not docs:
         return []
-    pairs = [[query, d["text"]] for d in docs]
-    scores = RERANKER.compute_score(pairs, batch_size=16)
+    pairs = [[query, d.text] for d in docs]
+    scores = RERANK_BATCHER(pairs)
     ranked = sorted(zip(scores, docs), key=lambda x: x[0], reverse=True)
     return [d for _, d in ranked[:top_k]]
 
+@timed("rerank")
+def rerank_batch(queries: List[str], doc_lists: List[List[Chunk]], top_k=4) -> List[List[Chunk]]:
+    """질의별 후보를 한꺼번에 재정렬: 모든 (질의, 청크) 쌍을 compute_score 1회로"""
+    todo = [i for i, docs in enumerate(doc_lists) if docs]
+    out: List[List[Chunk]] = [[] for _ in doc_lists]
+    if not todo:
+        return out
+    score_lists = _rerank_batch([[[queries[i], d.text] for d in doc_lists[i]] for i in todo])
+    for i, scores in zip(todo, score_lists):
+        ranked = sorted(zip(scores, doc_lists[i]), key=lambda x: x[0], reverse=True)
+        out[i] = [d for _, d in ranked[:top_k]]
+    return out
+
 
 # ---------- 질의 정규화 / 의도 ----------
+@timed("normalize_query")
 def normalize_query_kor(q: str) -> str:
     s = normalize(q)
     repl = [
@@ -227,12 +716,13 @@ def intent_hint(q: str) -> str:
     return "generic"
 
 # ---------- 추출 요약 ----------
-def extractive_answer(query: str, contexts: List[Dict], topn: int = 2) -> str:
+@timed("extractive_answer")
+def extractive_answer(query: str, contexts: List[Chunk], topn: int = 2) -> str:
     intent = intent_hint(query)
     q_tokens = re.findall(r"[\w가-힣]+", normalize(query).lower())
     cands = []
     for c in contexts:
-        for sent in split_sentences(c["text"]):
+        for sent in chunk_sentences(c):
             if is_header_like(sent):  # 안전
                 continue
             tok_score = sum(sent.lower().count(t) for t in q_tokens)
@@ -252,8 +742,8 @@ def extractive_answer(query: str, contexts: List[Dict], topn: int = 2) -> str:
             if re.search(r"\d+\s*(영업)?일", s):
                 picked = [s]; break
     if not picked and contexts:
-        first_ctx_sents = split_sentences(contexts[0]["text"])
-        picked = first_ctx_sents[:1] if first_ctx_sents else [contexts[0]["text"]]
+        first_ctx_sents = chunk_sentences(contexts[0])
+        picked = first_ctx_sents[:1] if first_ctx_sents else [contexts[0].text]
     summary = " ".join(picked).strip()
     if not summary.endswith(("입니다.", "니다.", "요.", ".")):
         summary += "입니다."
@@ -265,96 +755,176 @@ LLM_PROVIDER = os.environ.get("QA_LLM", "ollama")   # "ollama" | "none"
 OLLAMA_URL  = os.environ.get("OLLAMA_URL", "http://127.0.0.1:11434")
 OLLAMA_MODEL = os.environ.get("OLLAMA_MODEL", "llama3.1:8b")
 OLLAMA_TIMEOUT = int(os.environ.get("OLLAMA_TIMEOUT", "300"))
+# chat: 고정 지시문(LLM_SYS_PROMPT)을 system 메시지로 → 요청 간 같은 토큰 프리픽스라 Ollama 가 KV 캐시를 재사용
+# generate: 지시문 + 질문/근거를 한 프롬프트로 (이전 방식, 비교용)
+LLM_API = os.environ.get("QA_LLM_API", "chat")
+LLM_PROMPT_TOKENS = metrics.Histogram("qa_llm_prompt_tokens", "요청마다 Ollama 가 prompt eval 한 토큰 수 (프리픽스 캐시 재사용분 제외)",
+                                      buckets=(8, 16, 32, 64, 128, 256, 512, 1024, 2048, 4096))
 
-def select_top_sentences_semantic_filtered(text: str, query: str, intent: str,
-                                           max_sents=2, max_chars=240):
-    sents = split_sentences(text)
+def record_llm_stats(st: Dict):
+    # Ollama 응답의 시간(ns) → 구간 타이머 (qa_stage_seconds / debug.stages_ms 의 llm.prompt_eval, llm.eval, llm.load)
+    for field, name in (("prompt_eval_duration", "llm.prompt_eval"), ("eval_duration", "llm.eval"),
+                        ("load_duration", "llm.load")):
+        if st.get(field):
+            metrics.record(name, st[field] / 1e9)
+    if "prompt_eval_count" in st:
+        LLM_PROMPT_TOKENS.observe(st["prompt_eval_count"])
+
+OLLAMA = OllamaClient(OLLAMA_URL, OLLAMA_MODEL, OLLAMA_TIMEOUT, on_stats=record_llm_stats)   # keep-alive 커넥션 풀
+# 요청 지연 예산 기본값 (ms, 0=없음). 넘기면 LLM 을 취소하고 추출요약으로 답한다 (AskReq.deadline_ms 로 요청별 지정)
+DEADLINE_MS = int(os.environ.get("QA_DEADLINE_MS", "0"))
+
+def request_deadline(deadline_ms: Optional[int]) -> Optional[float]:
+    """요청 시작 시점에 호출 → time.monotonic() 기준 마감 시각 (예산 없으면 None)"""
+    ms = DEADLINE_MS if deadline_ms is None else deadline_ms
+    return time.monotonic() + ms / 1000.0 if ms > 0 else None
+
+def remaining(deadline: Optional[float]) -> Optional[float]:
+    return None if deadline is None else max(deadline - time.monotonic(), 0.0)
+
+@timed("select_sentences")
+def rank_sentences(chunk: Chunk, qv: np.ndarray, intent: str) -> List[str]:
+    """청크 문장을 질의와 가까운 순으로 (의도 키워드가 있는 문장만, 없으면 전부)
+    qv: 정규화된 질의 벡터 (질의당 1회 계산). 문장 벡터는 ingest 때 계산된 것을 사용"""
+    sents = chunk_sentences(chunk)
     if not sents:
-        return ""
+        return []
     # 의도별 키워드 필터
     pat = None
     if intent == "shipping_time":
         pat = r"(배송|소요|도착)"
     elif intent == "return_window":
         pat = r"(반품|반환)"
-    cand = [s for s in sents if (pat is None or re.search(pat, s))]
-    if not cand:
-        cand = sents
-    vecs = EMB_MODEL.encode([BGE_PASSAGE_PREFIX + s for s in cand], normalize_embeddings=True)
-    qv = EMB_MODEL.encode([BGE_QUERY_PREFIX + query], normalize_embeddings=True)[0]
+    keep = [i for i, s in enumerate(sents) if (pat is None or re.search(pat, s))]
+    if not keep:
+        keep = list(range(len(sents)))
+    if chunk.sent_vecs is not None:
+        vecs = chunk.sent_vecs[keep]
+    else:   # 사전 계산 이전(format 1) 스냅샷의 청크
+        vecs = embed_passages([sents[i] for i in keep])
     scores = np.dot(vecs, qv)
-    idxs = np.argsort(-scores)[:max_sents]
-    picked = [cand[i] for i in idxs]
-    txt = " ".join(picked)
-    return (txt[:max_chars] + "…") if len(txt) > max_chars else txt
+    return [sents[keep[i]] for i in np.argsort(-scores)]
+
+# ---------- LLM 근거: 토큰 예산 안에서 채우기 ----------
+# 입력이 num_ctx 를 넘으면 Ollama 가 프롬프트를 잘라내므로 (어디가 잘릴지 알 수 없음),
+# 근거는 num_ctx - num_predict - 지시문 - 질문 - 여유분 안에서만 넣는다.
+LLM_TOKENIZER = os.environ.get("QA_LLM_TOKENIZER", "")   # HF 토크나이저 이름 (정확히 셈), 없으면 추정
+TOKENS_PER_HANGUL = float(os.environ.get("QA_TOKENS_PER_HANGUL", "1.2"))
+LLM_PROMPT_MARGIN = int(os.environ.get("QA_LLM_PROMPT_MARGIN", "48"))     # 채팅 템플릿 토큰 등
+LLM_EVIDENCE_TOKENS = int(os.environ.get("QA_LLM_EVIDENCE_TOKENS", "0"))  # 근거 상한 (0: num_ctx 에 맞춰 최대)
+LLM_MAX_SENTS = int(os.environ.get("QA_LLM_MAX_SENTS", "3"))              # 근거 청크당 최대 문장 수
+_tokenizer = None
+
+def count_tokens(text: str) -> int:
+    """LLM 토큰 수. QA_LLM_TOKENIZER 가 없으면 추정 (한글 음절 1개 ≈ QA_TOKENS_PER_HANGUL, 그 외 공백 아닌 문자 3개 ≈ 1)"""
+    global _tokenizer
+    if LLM_TOKENIZER:
+        if _tokenizer is None:
+            from transformers import AutoTokenizer
+            _tokenizer = AutoTokenizer.from_pretrained(LLM_TOKENIZER)
+        return len(_tokenizer.encode(text, add_special_tokens=False))
+    hangul = sum(1 for ch in text if "가" <= ch <= "힣")
+    other = sum(1 for ch in text if not ch.isspace()) - hangul
+    return int(hangul * TOKENS_PER_HANGUL + 0.999) + (other + 2) // 3
 
-def llm_answer_extractive_json(query: str, contexts: List[Dict]) -> (str, List[str]):
+@functools.lru_cache(maxsize=1)
+def system_prompt_tokens() -> int:
+    return count_tokens(LLM_SYS_PROMPT)
+
+def evidence_budget(user_head: str) -> int:
+    budget = (LLM_OPTIONS["num_ctx"] - LLM_OPTIONS["num_predict"] - system_prompt_tokens()
+              - count_tokens(user_head) - LLM_PROMPT_MARGIN)
+    return min(budget, LLM_EVIDENCE_TOKENS) if LLM_EVIDENCE_TOKENS > 0 else budget
+
+def pack_evidence(contexts: List[Chunk], qv: np.ndarray, intent: str, budget: int) -> List[Dict]:
+    """근거 목록 [{"id", "text"}]. 리랭크 순 청크마다 질의와 가까운 문장을 돌아가며 하나씩 (1위 청크 1순위 → 2위 청크 1순위 → …
+    → 1위 청크 2순위 …) 예산 안에서 추가. 첫 문장이 안 들어가는 청크는 빠지고, 1위 청크 첫 문장은 예산에 맞게 잘라서라도 넣는다."""
+    ids = [f"{c.title}#{c.chunk_idx}" for c in contexts]
+    ranked = [rank_sentences(c, qv, intent)[:LLM_MAX_SENTS] or [c.text] for c in contexts]
+    picked: List[List[str]] = [[] for _ in contexts]
+    left = budget
+    for r in range(LLM_MAX_SENTS):
+        for i, sents in enumerate(ranked):
+            if r >= len(sents) or (r > 0 and not picked[i]):
+                continue
+            # 문장 + 구분 공백, 청크 첫 문장이면 {"id": ..., "text": ...} 자리까지
+            overhead = 1 if picked[i] else count_tokens(f'{{"id": "{ids[i]}", "text": ""}}, ')
+            cost = count_tokens(sents[r]) + overhead
+            if cost <= left:
+                picked[i].append(sents[r])
+                left -= cost
+            elif i == 0 and r == 0:
+                n = len(sents[0]) * (left - overhead) // max(cost - overhead, 1)
+                if n > 1:
+                    picked[0].append(sents[0][:n - 1] + "…")
+                    left = 0
+    return [{"id": ids[i], "text": " ".join(p)} for i, p in enumerate(picked) if p]
+
+LLM_SYS_PROMPT = (
+    "당신은 고객지원 에이전트입니다. 반드시 '근거 텍스트'에서만 답을 추출하세요. "
+    "출력은 JSON 한 줄만, 다른 말 금지.\n"
+    "요구사항:\n"
+    "- final_answer에는 근거에서 발견한 정확한 숫자/단위(예: 7일, 2~3영업일)를 그대로 포함하세요.\n"
+    "- 근거에 없으면 '메뉴얼에 근거가 없어 답변드리기 어렵습니다.'로 하세요.\n"
+    "JSON 스키마:\n"
+    "{"
+    "\"final_answer\": \"한국어 존댓말 한 문장, 50자 이내\","
+    "\"support\": [\"근거에서 그대로 복사한 문장 1개\"],"
+    "\"citations\": [\"문장이 나온 근거 id(예: 문서명#청크)\"]"
+    "}"
+)
+LLM_OPTIONS = {
+    "num_predict": 64,
+    "temperature": 0.1,
+    "top_p": 0.9,
+    "num_ctx": 1024,
+    "num_thread": os.cpu_count() or 4
+}
+
+@timed("build_prompt")
+def build_llm_prompt(query: str, contexts: List[Chunk]) -> str:
+    """LLM 에 보낼 질문 + 근거 (지시문 LLM_SYS_PROMPT 는 llm_generate 가 앞에 붙임)
+    CPU 구간 (질의 임베딩 + 문장 선택) → run_cpu 로 호출"""
     qn = normalize_query_kor(query)
     intent = intent_hint(qn)
-    bullets = []
-    for c in contexts:
-        snippet = select_top_sentences_semantic_filtered(c["text"], qn, intent, max_sents=2, max_chars=200)
-        bullets.append({"id": f"{c['title']}#{c['chunk_idx']}", "text": snippet or c["text"][:200]})
-
-    sys_prompt = (
-        "당신은 고객지원 에이전트입니다. 반드시 '근거 텍스트'에서만 답을 추출하세요. "
-        "출력은 JSON 한 줄만, 다른 말 금지.\n"
-        "요구사항:\n"
-        "- final_answer에는 근거에서 발견한 정확한 숫자/단위(예: 7일, 2~3영업일)를 그대로 포함하세요.\n"
-        "- 근거에 없으면 '메뉴얼에 근거가 없어 답변드리기 어렵습니다.'로 하세요.\n"
-        "JSON 스키마:\n"
-        "{"
-        "\"final_answer\": \"한국어 존댓말 한 문장, 50자 이내\","
-        "\"support\": [\"근거에서 그대로 복사한 문장 1개\"],"
-        "\"citations\": [\"문장이 나온 근거 id(예: 문서명#청크)\"]"
-        "}"
-    )
-    prompt = f"{sys_prompt}\n\n질문:\n{qn}\n\n근거:\n{json.dumps(bullets, ensure_ascii=False)}\n\nJSON:"
+    qv = embed_query(qn)
+    head = f"질문:\n{qn}\n\n근거:\n"
+    bullets = pack_evidence(contexts, qv, intent, evidence_budget(head))
+    return f"{head}{json.dumps(bullets, ensure_ascii=False)}\n\nJSON:"
 
-    try:
-        r = requests.post(
-            f"{OLLAMA_URL}/api/generate",
-            json={
-                "model": OLLAMA_MODEL,
-                "prompt": prompt,
-                "stream": False,
-                "keep_alive": "1h",
-                "options": {
-                    "num_predict": 64,
-                    "temperature": 0.1,
-                    "top_p": 0.9,
-                    "num_ctx": 1024,
-                    "num_thread": os.cpu_count() or 4
-                }
-            },
-            timeout=OLLAMA_TIMEOUT,
-        )
-        r.raise_for_status()
-        raw = r.json().get("response", "").strip()
-
-        # Fence 제거 및 JSON 블록 추출
-        if raw.startswith("```"):
-            raw = raw.strip("` \n")
-            if raw.lower().startswith("json"):
-                raw = raw[4:].strip()
-        if not raw.startswith("{"):
-            m = re.search(r"\{.*\}", raw, flags=re.DOTALL)
-            if m:
-                raw = m.group(0)
-
-        data = json.loads(raw)
-    except Exception as e:
-        log.warning(f"llm JSON parse fallback: {e}")
-        return extractive_answer(query, contexts, topn=2), []
+async def llm_generate(prompt: str, options: Dict) -> str:
+    """prompt: build_llm_prompt 결과 → LLM 원문 (QA_LLM_API 에 따라 지시문을 system 메시지 / 프롬프트 앞에)"""
+    if LLM_API == "chat":
+        return await OLLAMA.chat(LLM_SYS_PROMPT, prompt, options)
+    return await OLLAMA.generate(f"{LLM_SYS_PROMPT}\n\n{prompt}", options)
+
+def llm_stream(prompt: str, options: Dict):
+    if LLM_API == "chat":
+        return OLLAMA.chat_stream(LLM_SYS_PROMPT, prompt, options)
+    return OLLAMA.generate_stream(f"{LLM_SYS_PROMPT}\n\n{prompt}", options)
 
-    # support 검증 + 의도 키워드 검증
+def parse_llm_json(raw: str) -> Dict:
+    raw = raw.strip()
+    # Fence 제거 및 JSON 블록 추출
+    if raw.startswith("```"):
+        raw = raw.strip("` \n")
+        if raw.lower().startswith("json"):
+            raw = raw[4:].strip()
+    if not raw.startswith("{"):
+        m = re.search(r"\{.*\}", raw, flags=re.DOTALL)
+        if m:
+            raw = m.group(0)
+    return json.loads(raw)
+
+def finalize_llm_answer(query: str, contexts: List[Chunk], data: Dict) -> (str, List[str], bool):
+    # support 검증 + 의도 키워드 검증 → (답, 출처, 검증 통과 여부). 실패 시 답은 추출요약
     final = (data.get("final_answer") or "").strip()
     if len(final) > 60:
         final = final[:60].rstrip() + "..."
     if not final.endswith(("입니다.", "니다.", "요.", ".")):
         final += "입니다."
 
-    corpus = " ".join([c["text"] for c in contexts])
+    corpus = " ".join([c.text for c in contexts])
     support_ok = any((s and s in corpus) for s in data.get("support", []) if isinstance(s, str))
 
     need_pat = None
@@ -364,97 +934,791 @@ def llm_answer_extractive_json(query: str, contexts: List[Dict]) -> (str, List[s
     elif intent == "return_window":
         need_pat = r"(반품|반환)"
 
-    if (need_pat and not re.search(need_pat, final)) or not support_ok:
+    valid = not ((need_pat and not re.search(need_pat, final)) or not support_ok)
+    if not valid:
         final = extractive_answer(query, contexts, topn=1)
 
     cites = [str(c) for c in data.get("citations", []) if isinstance(c, str)]
-    return final, cites
+    return final, cites, valid
+
+async def llm_answer_extractive_json(query: str, contexts: List[Chunk], generate=None,
+                                     deadline: Optional[float] = None) -> (str, List[str], Optional[str]):
+    """→ (답, 출처, fallback). fallback: None(LLM 답) | "timeout" | "error" | "invalid" (이때 답은 추출요약)
+    generate(prompt, options) → LLM 원문. 기본은 llm_generate (eval_rag.py --inproc 는 캐시 래퍼를 넘긴다)
+    deadline 이 있으면 추출요약을 LLM 과 동시에 만들어 두고, 마감까지 LLM 이 안 끝나면 호출을 취소(연결을 끊어
+    Ollama 도 생성을 멈춤)하고 추출요약을 반환한다."""
+    generate = generate or llm_generate
+    backup = asyncio.ensure_future(run_cpu(extractive_answer, query, contexts, 2)) if deadline is not None else None
+    try:
+        prompt = await run_cpu(build_llm_prompt, query, contexts)
+        with stage("llm"):
+            raw = await asyncio.wait_for(generate(prompt, LLM_OPTIONS), remaining(deadline))
+        data = parse_llm_json(raw)
+    except asyncio.TimeoutError:
+        log.warning(f"llm deadline exceeded → extractive: '{query}'")
+        fallback = "timeout"
+    except Exception as e:
+        log.warning(f"llm JSON parse fallback: {e}")
+        fallback = "error"
+    else:
+        if backup is not None:
+            backup.cancel()
+        final, cites, valid = finalize_llm_answer(query, contexts, data)
+        if valid:
+            return final, cites, None
+        LLM_FALLBACKS.inc(reason="invalid")
+        return final, cites, "invalid"
+    LLM_FALLBACKS.inc(reason=fallback)
+    brief = await backup if backup is not None else extractive_answer(query, contexts, topn=2)
+    return brief, [], fallback
+
+# ---------- Ingest 공통 ----------
+# 쓰기는 모두 INGEST_LOCK 안에서 (위 스냅샷 절 참고)
+# 파일마다 커밋하지 않고 청크를 QA_INGEST_BATCH_CHUNKS 개씩 모아 임베딩 1회 + 키워드 인덱스(Whoosh 커밋) 1회 + 스냅샷 1회
+INGEST_BATCH_CHUNKS = int(os.environ.get("QA_INGEST_BATCH_CHUNKS", "256"))
+
+@timed("ingest.batch")
+def ingest_chunks(new_docs: List[Chunk], reused: Optional[Dict[int, int]] = None):
+    """청크 등록: 문장 사전 계산 → DOCS/FAISS/키워드 인덱스 추가 → 스냅샷 저장 → 캐시 무효화"""
+    if not new_docs:
+        return
+    with INGEST_LOCK:
+        # 같은 title 재업로드: 기존 청크를 근거로 한 의미 캐시 항목 제거
+        for title in {d.title for d in new_docs}:
+            SEMANTIC_CACHE.invalidate_chunks(c.id for c in DOCS.by_title(title))
+        prepare_sentences(new_docs)
+        DOCS.extend(new_docs)
+        vecs = add_to_index(new_docs, reused)
+        with stage("ingest.keyword"):
+            add_to_keyword(new_docs)
+        with stage("ingest.snapshot"):
+            persist_snapshot(new_docs, vecs)
+        with stage("ingest.partitions"):
+            add_to_partitions([DOCS.row(d.id) for d in new_docs])
+        publish_view()   # 여기서부터 새 요청에 보인다 (진행 중인 요청은 이전 view 그대로)
+    INGESTED_CHUNKS.inc(len(new_docs))
+
+def delete_chunks(chunks: List[Chunk]) -> int:
+    """청크 삭제: DOCS/FAISS/키워드 인덱스에서 제거 + 스냅샷에 tombstone 기록 → 삭제한 청크 수"""
+    if not chunks:
+        return 0
+    with INGEST_LOCK, stage("delete"):
+        chunks = [c for c in chunks if DOCS.row(c.id) is not None]
+        ids = [c.id for c in chunks]
+        texts = [keyword_text(c) for c in chunks]
+        SEMANTIC_CACHE.invalidate_chunks(ids)
+        rows = DOCS.remove(ids)   # chunks 순서 그대로
+        FAISS_INDEX.remove(rows)
+        PARTITIONS.remove(rows, texts)
+        delete_from_keyword(ids, rows, texts)
+        persist_snapshot([], np.zeros((0, DIM), dtype="float32"), rows)
+        publish_view(rows)
+    DELETED_CHUNKS.inc(len(rows))
+    return len(rows)
+
+def delete_title(title: str) -> int:
+    with INGEST_LOCK:
+        return delete_chunks(DOCS.by_title(title))
+
+def text_pieces(raw: str) -> Iterator[tuple]:
+    """텍스트 → (page, chunk) (page 없음)"""
+    for ch in chunk_text(raw, size=400, overlap=80):
+        yield None, ch
+
+def pdf_pieces(path: str, n_pages: Optional[int] = None) -> Iterator[tuple]:
+    """PDF 파일 → (page, chunk). 페이지 구간을 프로세스 풀에서 병렬 추출하면서 순서대로 흘려보낸다"""
+    for pi, page_text in pdfx.iter_pages(path, n_pages):
+        for ch in chunk_text(page_text, size=400, overlap=80):
+            yield pi, ch
+
+# 업로드 한도: 파일 1개(zip 멤버는 압축 해제 후 크기) / /ingest_batch 요청 합계 / zip 안 파일 수 (zip bomb 방지)
+UPLOAD_MAX_BYTES = int(float(os.environ.get("QA_UPLOAD_MAX_MB", "200")) * 2**20)
+UPLOAD_TOTAL_BYTES = int(float(os.environ.get("QA_UPLOAD_TOTAL_MB", "2048")) * 2**20)
+ZIP_MAX_FILES = int(os.environ.get("QA_ZIP_MAX_FILES", "1000"))
+
+class UploadTooLarge(ValueError):
+    pass
+
+def spool_to_disk(src, suffix: str = "", limit: Optional[int] = None) -> str:
+    """업로드(파일 객체)를 1MB 씩 임시 파일로 (통째로 메모리에 올리지 않음). 호출자가 지운다.
+    limit: 최대 바이트. 넘으면 쓰던 파일을 지우고 UploadTooLarge (zip 멤버의 선언 크기는 믿지 않고 실제로 센다)"""
+    fd, path = tempfile.mkstemp(suffix=suffix, prefix="qa_upload_")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            n = 0
+            while True:
+                buf = src.read(1 << 20)
+                if not buf:
+                    break
+                n += len(buf)
+                if limit is not None and n > limit:
+                    raise UploadTooLarge(f"업로드 크기 한도 초과 ({limit} bytes, QA_UPLOAD_MAX_MB / QA_UPLOAD_TOTAL_MB)")
+                f.write(buf)
+    except BaseException:
+        os.remove(path)
+        raise
+    return path
+
+def remove_quietly(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+class UploadSpool:
+    """/ingest_batch 요청 하나의 임시 파일들 (파일 1개 UPLOAD_MAX_BYTES, 합계 UPLOAD_TOTAL_BYTES).
+    실패하면 cleanup() 으로 모두 지우고, 성공하면 경로 목록을 작업에 넘긴다 (작업이 처리하면서 지운다)."""
+
+    def __init__(self):
+        self.paths: List[str] = []
+        self.total = 0
+
+    def add(self, src, suffix: str = "") -> str:
+        path = spool_to_disk(src, suffix, min(UPLOAD_MAX_BYTES, UPLOAD_TOTAL_BYTES - self.total))
+        self.paths.append(path)
+        self.total += os.path.getsize(path)
+        return path
+
+    def drop(self, path: str):
+        # 펼친 뒤 필요 없는 원본(zip)
+        self.total -= os.path.getsize(path)
+        self.paths.remove(path)
+        os.remove(path)
+
+    def cleanup(self):
+        for path in self.paths:
+            remove_quietly(path)
+        self.paths, self.total = [], 0
+
+def batched(it: Iterable, n: int) -> Iterator[List]:
+    it = iter(it)
+    while True:
+        batch = list(itertools.islice(it, n))
+        if not batch:
+            return
+        yield batch
+
+def ingest_pieces(pieces: List[tuple]) -> List[Chunk]:
+    """(title, page, chunk, src) 목록을 한 번에 등록. src: 본문이 같은 기존 청크(벡터 재사용) 또는 None.
+    chunk_idx 는 단조 증가 번호 (txt: title:idx, pdf: title:p{page}:idx)"""
+    with INGEST_LOCK:
+        new_docs: List[Chunk] = []
+        reused: Dict[int, int] = {}
+        for title, page, text, src in pieces:
+            idx = DOCS.next_idx + len(new_docs)
+            cid = f"{title}:{idx}" if page is None else f"{title}:p{page}:{idx}"
+            c = Chunk(cid, title, idx, text, page=page)
+            if src is not None:
+                c.sents, c.sent_vecs = src.sents, src.sent_vecs
+                reused[len(new_docs)] = DOCS.row(src.id)
+            new_docs.append(c)
+        ingest_chunks(new_docs, reused)
+    return new_docs
+
+def ingest_stream(pieces: Iterable[tuple], on_batch=None) -> Dict[str, int]:
+    """(title, page, chunk) 스트림을 title 단위로 반영 (같은 title 재업로드 = 갱신).
+    - 본문 해시가 같은 기존 청크는 그대로 둔다 (페이지만 바뀌었으면 벡터를 복사해 다시 등록, 재임베딩 없음)
+    - 새/바뀐 청크만 INGEST_BATCH_CHUNKS 개씩 임베딩/인덱싱 (메모리에는 배치 1개 분량만)
+    - 업로드에 없는 기존 청크는 마지막에 삭제"""
+    stats = {"added": 0, "unchanged": 0, "deleted": 0}
+    old: Dict[str, Dict[str, List[Chunk]]] = {}   # title → hash → 아직 대응되지 않은 기존 청크
+    replaced: List[Chunk] = []
+
+    def changed():
+        for title, page, text in pieces:
+            if title not in old:
+                by_hash: Dict[str, List[Chunk]] = {}
+                for c in DOCS.by_title(title):
+                    by_hash.setdefault(c.hash, []).append(c)
+                old[title] = by_hash
+            same = old[title].get(content_hash(text))
+            src = same.pop() if same else None
+            if src is not None and src.page == page:
+                stats["unchanged"] += 1
+                continue
+            if src is not None:
+                replaced.append(src)
+            yield title, page, text, src
+
+    # 같은 title 의 갱신이 섞이지 않도록 스트림 전체를 쓰기 락 안에서
+    with INGEST_LOCK:
+        for batch in batched(changed(), INGEST_BATCH_CHUNKS):
+            stats["added"] += len(ingest_pieces(batch))
+            if on_batch is not None:
+                on_batch(len(batch))
+        stale = [c for by_hash in old.values() for cs in by_hash.values() for c in cs]
+        stats["deleted"] = delete_chunks(stale + replaced)
+    return stats
+
+def ingest_pdf_file(title: str, path: str, n_pages: int) -> Dict[str, int]:
+    return ingest_stream((title, page, ch) for page, ch in pdf_pieces(path, n_pages))
+
+# ---------- 대량 ingest 작업 (/ingest_batch → /jobs/{id}) ----------
+INGEST_SUFFIXES = {".txt": "text", ".md": "text", ".pdf": "pdf"}
+
+def file_kind(name: str) -> Optional[str]:
+    return INGEST_SUFFIXES.get(os.path.splitext(name)[1].lower())
+
+def title_of(name: str) -> str:
+    return os.path.splitext(os.path.basename(name))[0]
+
+def expand_upload(name: str, path: str, title: Optional[str], spool: UploadSpool) -> List[tuple]:
+    """임시 파일로 받은 업로드 1개 → (title, kind, 임시 파일 경로) 목록.
+    zip 은 안의 txt/md/pdf 를 멤버마다 임시 파일로 풀어 각각 문서 1개로 (멤버 수 ZIP_MAX_FILES, 크기는 spool 한도)"""
+    if not name.lower().endswith(".zip"):
+        return [(title or title_of(name), file_kind(name) or "text", path)]
+    out = []
+    with zipfile.ZipFile(path) as zf:
+        members = [info for info in zf.infolist() if not info.is_dir() and file_kind(info.filename)]
+        if len(members) > ZIP_MAX_FILES:
+            raise UploadTooLarge(f"zip 안 파일 {len(members)}개 > QA_ZIP_MAX_FILES={ZIP_MAX_FILES}")
+        for info in members:
+            if info.file_size > UPLOAD_MAX_BYTES:   # 선언 크기로 먼저 거르고, 실제 크기는 spool 에서 센다
+                raise UploadTooLarge(f"{info.filename}: {info.file_size} bytes > QA_UPLOAD_MAX_MB")
+            with zf.open(info) as src:
+                out.append((title_of(info.filename), file_kind(info.filename),
+                            spool.add(src, os.path.splitext(info.filename)[1])))
+    spool.drop(path)
+    return out
+
+def file_pieces(kind: str, path: str) -> Iterator[tuple]:
+    if kind == "pdf":
+        yield from pdf_pieces(path)
+        return
+    with open(path, "rb") as f:   # 파일당 UPLOAD_MAX_BYTES 이하
+        raw = f.read().decode("utf-8", errors="ignore")
+    yield from text_pieces(raw)
+
+def run_ingest_job(job: Job):
+    files = job.payload   # (title, kind, 임시 파일 경로), 처리한 파일은 바로 지운다
+    prog = job.progress
+    prog.update(files_total=len(files), files_read=0, chunks=0, batches=0, unchanged=0, deleted=0,
+                chunks_per_sec=0.0, errors=[])
+    t0 = time.perf_counter()
+
+    def job_pieces():
+        # 여러 파일의 청크를 이어 붙여 배치를 채운다 (작은 파일이 많아도 커밋 횟수는 배치 수)
+        for title, kind, path in files:
+            try:
+                for page, text in file_pieces(kind, path):
+                    yield title, page, text
+            except Exception as e:
+                prog["errors"].append({"title": title, "error": str(e)})
+            finally:
+                remove_quietly(path)
+            prog["files_read"] += 1
+
+    def on_batch(n):
+        prog["chunks"] += n
+        prog["batches"] += 1
+        prog["chunks_per_sec"] = round(prog["chunks"] / max(time.perf_counter() - t0, 1e-9), 2)
+
+    try:
+        stats = ingest_stream(job_pieces(), on_batch)
+    finally:
+        for _, _, path in files:   # 중간에 실패하면 남은 임시 파일
+            remove_quietly(path)
+    prog["unchanged"], prog["deleted"] = stats["unchanged"], stats["deleted"]
+    log.info(f"ingest job {job.id}: files={len(files)}, chunks={prog['chunks']}, "
+             f"batches={prog['batches']}, {prog['chunks_per_sec']} chunks/s")
+
+INGEST_JOBS = JobQueue("ingest", run_ingest_job)
 
 # ---------- API ----------
 class AskReq(BaseModel):
     query: str
     top_k: int = 4
+    semantic_cache: bool = True   # False: 의미 캐시 조회 생략 (평가 시 정확도 비교용)
+    debug: bool = False           # True: 응답에 구간별 소요 시간(debug.stages_ms) 포함
+    deadline_ms: Optional[int] = None   # 지연 예산 (None: QA_DEADLINE_MS, 0: 없음). 넘기면 추출요약으로 답함
+    collections: Optional[List[str]] = None   # 검색할 컬렉션(= ingest 때 title) 목록. None/빈 목록: 전체
+
+# /ask_batch: 요청당 질의 수 상한, 배치 안에서 동시에 돌릴 LLM 호출 수
+ASK_BATCH_MAX = int(os.environ.get("QA_ASK_BATCH_MAX", "1000"))
+ASK_BATCH_LLM = int(os.environ.get("QA_ASK_BATCH_LLM", "4"))
+
+class AskBatchReq(BaseModel):
+    queries: List[str]
+    top_k: int = 4
+    semantic_cache: bool = True
+    collections: Optional[List[str]] = None   # 배치 전체에 같은 컬렉션 필터
+
+def collection_scope(collections: Optional[List[str]]) -> Optional[tuple]:
+    """컬렉션 필터 → 정렬된 title 튜플 (검색 인자 + 답변/의미 캐시 키의 범위). 없으면 None = 전체"""
+    return tuple(sorted(set(collections))) if collections else None
+
+def check_collections(collections: Optional[List[str]]):
+    # 오타 등으로 없는 컬렉션을 주면 "근거 없음" 대신 404
+    missing = sorted(set(collections or ()) - set(pin_view().partitions))
+    if missing:
+        raise HTTPException(status_code=404, detail=f"컬렉션 없음: {', '.join(missing)}")
 
 @app.get("/health")
+@app.get("/health/live")
 def health():
-    return {"status": "ok", "docs": len(DOCS), "faiss_rows": FAISS_INDEX.ntotal}
+    # liveness: 프로세스가 응답하는지만 확인 (모델 로드와 무관)
+    return {"status": "ok", "docs": len(DOCS), "faiss_rows": FAISS_INDEX.ntotal,
+            "index_kind": FAISS_INDEX.kind, "index_storage": FAISS_INDEX.storage,
+            "store_generation": STORE_MANIFEST.get("generation", 0),
+            "pid": os.getpid(), "shared": SHARED, "infer": INFER_ADDR or None,
+            "model_backend": None if INFER_ADDR else MODEL_BACKEND}   # infer 모드면 /health/ready 의 infer.backend
+
+@app.get("/health/ready")
+def ready():
+    # readiness: 모든 모델이 로드 + 워밍업 완료되어야 200
+    models = {slot.name: slot.status() for slot in MODEL_SLOTS}
+    ok = all(slot.ready for slot in MODEL_SLOTS)
+    body = {"status": "ready" if ok else "not_ready", "models": models,
+            "docs": len(DOCS), "faiss_rows": FAISS_INDEX.ntotal}
+    return JSONResponse(body, status_code=200 if ok else 503)
+
+class IndexParamsReq(BaseModel):
+    ef_search: Optional[int] = None   # HNSW
+    nprobe: Optional[int] = None      # IVF
+    rescore: Optional[int] = None     # 양자화 저장(sq8/pq): float 재계산 후보 배수, 0=끔
+
+@app.get("/index")
+def index_status():
+    keyword = {"engine": KEYWORD_ENGINE}
+    if KEYWORD_ENGINE == "bm25":
+        keyword.update(BM25.stats())
+    return dict(FAISS_INDEX.status(), keyword=keyword)
+
+@app.post("/index/params")
+def index_params(req: IndexParamsReq):
+    # 재시작 없이 recall/latency 트레이드오프 조정 (bench.py recall 결과 참고). 컬렉션 필터 검색도 같은 인덱스
+    FAISS_INDEX.set_search_params(ef_search=req.ef_search, nprobe=req.nprobe, rescore=req.rescore)
+    return FAISS_INDEX.status()
+
+@app.get("/collections")
+def collections_status():
+    # title → 파티션 청크 수 / BM25 term 수
+    return {"count": len(PARTITIONS), "collections": PARTITIONS.status()}
+
+@app.get("/cache")
+def cache_stats():
+    # 캐시 크기 조정용 hit/miss/eviction 카운터
+    return {"query_embedding": QUERY_EMB_CACHE.stats(), "answer": ANSWER_CACHE.stats(),
+            "semantic": SEMANTIC_CACHE.stats(), "single_flight": ASK_FLIGHT.stats(),
+            "corpus_version": corpus_version()}
+
+@app.get("/metrics")
+def metrics_export():
+    # Prometheus scrape 대상 (워커 프로세스별 값)
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/batching")
+def batching_stats():
+    if INFER is not None:   # 배칭은 추론 프로세스에서
+        return {"infer": INFER.call("status")["batching"]}
+    return {"query_embed": QUERY_BATCHER.stats(), "rerank": RERANK_BATCHER.stats()}
+
+async def ingest_text_upload(title: str, file: UploadFile) -> Dict:
+    data = await file.read(UPLOAD_MAX_BYTES + 1)
+    if len(data) > UPLOAD_MAX_BYTES:
+        raise HTTPException(status_code=413, detail="파일이 너무 큽니다 (QA_UPLOAD_MAX_MB)")
+    raw = data.decode("utf-8", errors="ignore")
+    stats = await run_write(ingest_stream, ((title, page, ch) for page, ch in text_pieces(raw)))
+    return {"ok": True, **stats, "total_docs": len(DOCS), "faiss_rows": FAISS_INDEX.ntotal}
+
+async def ingest_pdf_upload(title: str, file: UploadFile) -> Dict:
+    if pdfx.fitz is None:
+        raise HTTPException(status_code=500, detail="pymupdf 미설치: pip install pymupdf")
+    # 업로드를 디스크로 옮긴 뒤 페이지 구간 병렬 추출 → 배치 단위로 바로 임베딩/인덱싱
+    try:
+        path = await run_write(spool_to_disk, file.file, ".pdf", UPLOAD_MAX_BYTES)
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    try:
+        try:
+            n_pages = await run_write(pdfx.page_count, path)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        stats = await run_write(ingest_pdf_file, title, path, n_pages)
+    finally:
+        os.remove(path)
+    return {"ok": True, **stats, "pages": n_pages, "total_docs": len(DOCS),
+            "faiss_rows": FAISS_INDEX.ntotal}
 
 @app.post("/ingest")
 async def ingest(title: str = Form(...), file: UploadFile = File(...)):
-    raw = (await file.read()).decode("utf-8", errors="ignore")
-    chunks = chunk_text(raw, size=400, overlap=80)
-    new_docs: List[Dict] = []
-    start_idx = len(DOCS)
-    for i, ch in enumerate(chunks):
-        new_docs.append({"id": f"{title}:{start_idx+i}", "title": title, "chunk_idx": start_idx+i, "text": ch})
-    DOCS.extend(new_docs)
-    add_to_index(new_docs)
-    add_to_whoosh(new_docs)
-    return {"ok": True, "added": len(new_docs), "total_docs": len(DOCS), "faiss_rows": FAISS_INDEX.ntotal}
+    # 같은 title 을 다시 올리면 바뀐 청크만 반영 (added / unchanged / deleted)
+    return await ingest_text_upload(title, file)
 
 @app.post("/ingest_pdf")
 async def ingest_pdf(title: str = Form(...), file: UploadFile = File(...)):
-    if fitz is None:
-        raise HTTPException(status_code=500, detail="pymupdf 미설치: pip install pymupdf")
-    data = await file.read()
-    try:
-        doc = fitz.open(stream=data, filetype="pdf")
-    except Exception as e:
-        raise HTTPException(status_code=400, detail=f"PDF 열기 실패: {e}")
+    return await ingest_pdf_upload(title, file)
 
-    new_docs: List[Dict] = []
-    start_idx = len(DOCS)
-    added = 0
-    for pi, page in enumerate(doc):
-        page_text = page.get_text("text") or ""
-        for ch in chunk_text(page_text, size=400, overlap=80):
-            new_docs.append({
-                "id": f"{title}:p{pi}:{start_idx+added}",
-                "title": title,
-                "chunk_idx": start_idx + added,
-                "text": ch
-            })
-            added += 1
-    DOCS.extend(new_docs)
-    add_to_index(new_docs)
-    add_to_whoosh(new_docs)
-    return {"ok": True, "added": added, "total_docs": len(DOCS), "faiss_rows": FAISS_INDEX.ntotal}
+@app.get("/documents")
+def docs_list():
+    return {"titles": DOCS.titles(), "total_docs": len(DOCS), "faiss_rows": FAISS_INDEX.ntotal}
 
-@app.post("/ask")
-def ask(req: AskReq):
-    if not DOCS:
-        return {"answer": "먼저 /ingest 또는 /ingest_pdf 로 메뉴얼을 업로드해 주세요.", "contexts": []}
+@app.put("/documents/{title}")
+async def docs_update(title: str, file: UploadFile = File(...)):
+    """title 문서를 새 파일로 교체 (txt/md/pdf, 파일명 확장자로 판별). 바뀐 청크만 임베딩, 없어진 청크는 삭제"""
+    if not DOCS.by_title(title):
+        raise HTTPException(status_code=404, detail=f"문서 없음: {title}")
+    if file_kind(file.filename or "") == "pdf":
+        return await ingest_pdf_upload(title, file)
+    return await ingest_text_upload(title, file)
 
-    # 1) 질의 정규화 후 하이브리드 검색
-    qn = normalize_query_kor(req.query)
-    # 넉넉히 뽑아서
-    cands = search_hybrid(qn, top_k=max(req.top_k, 12))
-    # 정밀 재정렬 후 최종 top_k만 사용
-    contexts = rerank(qn, cands, top_k=req.top_k)
+@app.delete("/documents/{title}")
+async def docs_delete(title: str):
+    deleted = await run_write(delete_title, title)
+    if not deleted:
+        raise HTTPException(status_code=404, detail=f"문서 없음: {title}")
+    return {"ok": True, "deleted": deleted, "total_docs": len(DOCS), "faiss_rows": FAISS_INDEX.ntotal}
 
-    # 2) 백업: 토큰 스코어 기반
-    if not contexts:
-        scored = sorted([(score_chunk(qn, d["text"]), d) for d in DOCS],
-                        key=lambda x: x[0], reverse=True)
-        contexts = [d for s, d in scored[:req.top_k] if s > 0]
+@app.post("/ingest_batch", status_code=202)
+async def ingest_batch(files: List[UploadFile] = File(...), titles: List[str] = Form(default=[])):
+    """여러 파일(txt/md/pdf) 또는 zip 을 받아 job id 를 바로 반환. 진행 상황은 /jobs/{id}
+    titles 를 주면 파일 순서대로 title 로 쓰고, 없으면 파일명(확장자 제외)을 쓴다."""
+    # 업로드/zip 멤버는 임시 파일로 받아 경로만 작업에 넘긴다 (메모리에 올리지 않음, 크기/개수 한도)
+    items: List[tuple] = []
+    spool = UploadSpool()
+    try:
+        for i, f in enumerate(files):
+            name = f.filename or f"file{i}"
+            path = await run_write(spool.add, f.file, os.path.splitext(name)[1])
+            items.extend(await run_write(expand_upload, name, path, titles[i] if i < len(titles) else None, spool))
+    except zipfile.BadZipFile as e:
+        spool.cleanup()
+        raise HTTPException(status_code=400, detail=f"zip 열기 실패: {f.filename}: {e}")
+    except UploadTooLarge as e:
+        spool.cleanup()
+        raise HTTPException(status_code=413, detail=f"{f.filename}: {e}")
+    except BaseException:
+        spool.cleanup()
+        raise
+    if not items:
+        spool.cleanup()
+        raise HTTPException(status_code=400, detail="ingest 할 파일(txt/md/pdf)이 없습니다")
+    job = INGEST_JOBS.submit("ingest_batch", items)
+    return {"job_id": job.id, "files": len(items), "status_url": f"/jobs/{job.id}"}
 
-    if not contexts:
-        return {"answer": "관련 근거를 찾지 못했습니다. 담당자에게 확인 후 안내드립니다.", "contexts": []}
+@app.get("/jobs")
+def jobs_list():
+    return {"stats": INGEST_JOBS.stats(), "jobs": [j.status() for j in INGEST_JOBS.list()]}
 
-    # 3) 최종 답 생성 (LLM JSON → 실패 시 추출요약)
-    if USE_LLM and LLM_PROVIDER == "ollama":
-        brief, cites = llm_answer_extractive_json(req.query, contexts)
-    else:
-        brief, cites = extractive_answer(req.query, contexts, topn=2), []
+@app.get("/jobs/{job_id}")
+def job_status(job_id: str):
+    job = INGEST_JOBS.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="job not found")
+    return job.status()
 
-    # 4) 응답 구성
-    ctx_texts = "\n\n".join([f"[근거 {i+1}] {d['text']}" for i, d in enumerate(contexts)])
+def default_citations(contexts: List[Chunk]) -> List[str]:
+    return [f"{d.title}#{d.chunk_idx}" for d in contexts]
+
+def compose_answer(brief: str, cites: List[str], contexts: List[Chunk]) -> Dict:
+    # /ask 응답 형식 (요약 + 출처 + 근거 원문)
+    ctx_texts = "\n\n".join([f"[근거 {i+1}] {d.text}" for i, d in enumerate(contexts)])
     if not cites:
-        cites = [f"{d['title']}#{d['chunk_idx']}" for d in contexts]
+        cites = default_citations(contexts)
 
     answer = (
         f"답변(요약, ~합니다): {brief}\n"
         f"- 근거 출처: {', '.join(cites)}\n\n"
         f"아래는 인용된 근거입니다.\n\n{ctx_texts}"
     )
-    return {"answer": answer, "contexts": contexts}
+    return {"answer": answer, "final_answer": brief, "citations": cites, "contexts": [d.to_dict() for d in contexts]}
+
+@timed("retrieve")
+def retrieve_contexts(qn: str, top_k: int, view: Optional[CorpusView] = None, alpha: float = 0.6,
+                      collections=None) -> List[Chunk]:
+    """하이브리드 검색(alpha: 벡터 가중치) → 리랭크 → (결과 없으면) 토큰 스코어 백업. CPU 구간이므로 run_cpu 로 호출
+    collections: 검색할 컬렉션(title) 목록, None 이면 전체"""
+    view = pin_view() if view is None else view
+    # 넉넉히 뽑아서
+    cands = search_hybrid(qn, top_k=max(top_k, 12), alpha=alpha, view=view, collections=collections)
+    # 정밀 재정렬 후 최종 top_k만 사용
+    contexts = rerank(qn, cands, top_k=top_k)
+
+    # 백업: 토큰 스코어 기반
+    if not contexts:
+        contexts = token_fallback(qn, top_k, view, collections)
+    return contexts
+
+def token_fallback(qn: str, top_k: int, view: CorpusView, collections=None) -> List[Chunk]:
+    if collections:
+        rows = (int(r) for pv in collection_parts(view, collections) for r in pv.live if view.visible(int(r)))
+    else:
+        rows = view.live_rows()
+    docs = (DOCS[r] for r in rows)
+    scored = sorted([(score_chunk(qn, d.text), d) for d in docs if d is not None],
+                    key=lambda x: x[0], reverse=True)
+    return [d for s, d in scored[:top_k] if s > 0]
+
+async def retrieve_contexts_batch(qns: List[str], qvs: np.ndarray, top_k: int, view: CorpusView,
+                                  alpha: float = 0.6, collections=None) -> List[List[Chunk]]:
+    """retrieve_contexts 의 배치판 (/ask_batch): FAISS 행렬 검색 1회 ∥ 질의별 키워드 검색(스레드풀 병렬)
+    → 가중 결합 → 리랭크 compute_score 1회. 후보 수는 retrieve_contexts 와 같다"""
+    k = max(top_k, 12)
+    vec_lists, *kw_lists = await asyncio.gather(
+        run_cpu(search_vector_batch, qvs, max(k * 3, 12), view, collections),
+        *(run_cpu(search_keyword, q, max(k * 6, 24), view, collections) for q in qns))
+    cands = [fuse_hybrid(v, kw, k, alpha, view) for v, kw in zip(vec_lists, kw_lists)]
+    out = await run_cpu(rerank_batch, qns, cands, top_k)
+    for i, contexts in enumerate(out):
+        if not contexts:
+            out[i] = await run_cpu(token_fallback, qns[i], top_k, view, collections)
+    return out
+
+async def generate_answer(query: str, contexts: List[Chunk], generate=None, deadline: Optional[float] = None) -> Dict:
+    """근거 → 최종 답 (LLM JSON → 실패/마감 초과 시 추출요약) → /ask 응답. 캐시는 호출자가 처리
+    source: "llm" | "extractive" | "none", fallback: LLM 을 거쳤지만 추출요약으로 답한 이유 (timeout | error | invalid)"""
+    if not contexts:
+        return {"answer": "관련 근거를 찾지 못했습니다. 담당자에게 확인 후 안내드립니다.", "contexts": [], "source": "none"}
+    fallback = None
+    if USE_LLM and LLM_PROVIDER == "ollama":
+        brief, cites, fallback = await llm_answer_extractive_json(query, contexts, generate, deadline)
+        source = "llm" if fallback is None else "extractive"
+    else:
+        brief, cites, source = extractive_answer(query, contexts, topn=2), [], "extractive"
+    resp = dict(compose_answer(brief, cites, contexts), source=source)
+    if fallback is not None:
+        resp["fallback"] = fallback
+    return resp
+
+def cacheable(resp: Dict) -> bool:
+    # LLM 을 거쳐 추출요약으로 대체된 답(timeout/error/invalid)은 캐시하지 않는다: 예산 초과나 Ollama 장애는 일시적이라
+    # 캐시해 두면 LLM 이 돌아온 뒤에도 (의미 캐시는 비슷한 질문까지) 대체 답이 계속 나간다
+    return resp.get("fallback") is None
+
+async def answer_query(req: AskReq, qn: str, akey, view: CorpusView, deadline: Optional[float] = None) -> Dict:
+    # 의미적으로 거의 같은 과거 질문이면 검색/리랭크/LLM 없이 그 답변을 재사용
+    scope = collection_scope(req.collections)
+    qv = await run_cpu(embed_query, qn)
+    if req.semantic_cache:
+        hit = SEMANTIC_CACHE.lookup(qv, scope)
+        if hit is not None:
+            resp, score, src = hit
+            log.info(f"semantic cache hit: sim={score:.3f} '{qn}' ≈ '{src}'")
+            CACHE_HITS.inc(cache="semantic")
+            return dict(resp, cache="semantic")
+
+    # 1) 하이브리드 검색 + 리랭크
+    contexts = await run_cpu(retrieve_contexts, qn, req.top_k, view, 0.6, scope)
+    # 2) 최종 답 생성 + 응답 구성
+    resp = await generate_answer(req.query, contexts, deadline=deadline)
+    if not cacheable(resp):
+        return resp
+    ANSWER_CACHE.put(akey, resp)
+    if contexts:
+        SEMANTIC_CACHE.add(qv, qn, resp, [d.id for d in contexts], scope)
+    return resp
+
+async def ask_pipeline(req: AskReq) -> Dict:
+    deadline = request_deadline(req.deadline_ms)
+    view = pin_view()   # 요청 끝까지 같은 코퍼스 버전 (중간에 ingest 가 끝나도 섞이지 않음)
+    if not view.n_live:
+        return {"answer": "먼저 /ingest 또는 /ingest_pdf 로 메뉴얼을 업로드해 주세요.", "contexts": []}
+
+    qn = normalize_query_kor(req.query)
+    akey = (qn, req.top_k, view.generation, collection_scope(req.collections))
+    cached = ANSWER_CACHE.get(akey)
+    if cached is not None:
+        CACHE_HITS.inc(cache="exact")
+        return dict(cached, cache="exact")
+    if req.debug:   # breakdown 이 이 요청의 것이 되도록 합치지 않는다
+        return await answer_query(req, qn, akey, view, deadline)
+    # 같은 질문이 동시에 여러 개 들어오면 검색/LLM 은 한 번만 하고 결과를 공유 (예산이 다른 요청끼리는 합치지 않음)
+    return await ASK_FLIGHT.do((akey, req.semantic_cache, req.deadline_ms),
+                               lambda: answer_query(req, qn, akey, view, deadline))
+
+@app.post("/ask")
+async def ask(req: AskReq):
+    check_collections(req.collections)
+    t0 = time.perf_counter()
+    stages = metrics.start_request()
+    resp = await ask_pipeline(req)
+    total = time.perf_counter() - t0
+    REQUEST_SECONDS.observe(total, endpoint="ask")
+    if req.debug:
+        # 중첩 구간(retrieve ⊃ search_hybrid ⊃ search_vector …)은 각각 따로 합산된 값
+        resp = dict(resp, debug={"total_ms": round(total * 1e3, 2),
+                                 "stages_ms": {k: round(v * 1e3, 2) for k, v in stages.items()}})
+    return resp
+
+# ---------- 스트리밍 (SSE): 근거 먼저 → LLM 토큰 → 최종 답 ----------
+def sse(event: str, data: Dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+async def ask_stream_events(req: AskReq):
+    """이벤트 순서: contexts(근거/출처) → token*(LLM 조각) → final(검증된 답 또는 추출요약) | error
+    예산(deadline_ms)을 넘기면 토큰 수신을 멈추고(스트림을 닫아 Ollama 생성도 취소) final 은 추출요약"""
+    deadline = request_deadline(req.deadline_ms)
+    view = pin_view()
+    if not view.n_live:
+        yield sse("final", {"final_answer": "먼저 /ingest 또는 /ingest_pdf 로 메뉴얼을 업로드해 주세요.",
+                            "citations": [], "source": "none", "answer": ""})
+        return
+    qn = normalize_query_kor(req.query)
+    scope = collection_scope(req.collections)
+    akey = (qn, req.top_k, view.generation, scope)
+    cached, kind = ANSWER_CACHE.get(akey), "exact"
+    qv = None
+    if cached is not None:
+        CACHE_HITS.inc(cache="exact")
+    else:
+        qv = await run_cpu(embed_query, qn)
+        if req.semantic_cache:
+            hit = SEMANTIC_CACHE.lookup(qv, scope)
+            cached, kind = (hit[0] if hit is not None else None), "semantic"
+            if cached is not None:
+                CACHE_HITS.inc(cache="semantic")
+    if cached is not None:
+        # source/fallback 은 캐시에 넣을 때의 답 그대로 (어떤 캐시에서 왔는지는 cache)
+        yield sse("contexts", {"contexts": cached["contexts"], "citations": [], "cache": True})
+        yield sse("final", {"final_answer": cached["final_answer"], "citations": cached["citations"],
+                            "source": cached.get("source"), "fallback": cached.get("fallback"),
+                            "cache": kind, "answer": cached["answer"]})
+        return
+
+    contexts = await run_cpu(retrieve_contexts, qn, req.top_k, view, 0.6, scope)
+    yield sse("contexts", {"contexts": [d.to_dict() for d in contexts],
+                           "citations": default_citations(contexts), "cache": False})
+    if not contexts:
+        msg = "관련 근거를 찾지 못했습니다. 담당자에게 확인 후 안내드립니다."
+        yield sse("final", {"final_answer": msg, "citations": [], "source": "none", "answer": msg})
+        return
+
+    brief, cites, source, fallback, backup = None, [], "extractive", None, None
+    if USE_LLM and LLM_PROVIDER == "ollama":
+        raw = []
+        tokens = None
+        # /ask 와 같이 추출요약을 스트림과 동시에 만들어 두어 마감 후 바로 final 을 보낸다
+        if deadline is not None:
+            backup = asyncio.ensure_future(run_cpu(extractive_answer, req.query, contexts, 2))
+        try:
+            prompt = await run_cpu(build_llm_prompt, req.query, contexts)
+            with stage("llm_stream"):   # 클라이언트가 토큰을 받아가는 시간 포함
+                tokens = llm_stream(prompt, LLM_OPTIONS)
+                while True:
+                    try:
+                        tok = await asyncio.wait_for(tokens.__anext__(), remaining(deadline))
+                    except StopAsyncIteration:
+                        break
+                    raw.append(tok)
+                    yield sse("token", {"text": tok})
+            data = parse_llm_json("".join(raw))
+            brief, cites, valid = finalize_llm_answer(req.query, contexts, data)
+            source = "llm" if valid else "extractive"
+            if not valid:
+                fallback = "invalid"
+        except asyncio.TimeoutError:
+            log.warning(f"llm stream deadline exceeded → extractive: '{req.query}'")
+            fallback = "timeout"
+        except Exception as e:
+            log.warning(f"llm stream fallback: {e}")
+            fallback = "error"
+        finally:
+            if tokens is not None:
+                await tokens.aclose()
+            if backup is not None and fallback is None:   # LLM 답 또는 클라이언트 연결 끊김
+                backup.cancel()
+        if fallback is not None:
+            LLM_FALLBACKS.inc(reason=fallback)
+    if brief is None:
+        brief = await backup if backup is not None else extractive_answer(req.query, contexts, topn=2)
+    elif backup is not None:
+        backup.cancel()
+
+    resp = dict(compose_answer(brief, cites, contexts), source=source)
+    if fallback is not None:
+        resp["fallback"] = fallback
+    if cacheable(resp):
+        ANSWER_CACHE.put(akey, resp)
+        SEMANTIC_CACHE.add(qv, qn, resp, [d.id for d in contexts], scope)
+    yield sse("final", {"final_answer": brief, "citations": resp["citations"],
+                        "source": source, "fallback": fallback, "answer": resp["answer"]})
+
+async def timed_stream(events, endpoint: str):
+    t0 = time.perf_counter()
+    metrics.start_request()
+    try:
+        async for ev in events:
+            yield ev
+    finally:
+        REQUEST_SECONDS.observe(time.perf_counter() - t0, endpoint=endpoint)
+
+@app.post("/ask_stream")
+async def ask_stream(req: AskReq):
+    check_collections(req.collections)
+    return StreamingResponse(timed_stream(ask_stream_events(req), "ask_stream"), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+# ---------- 배치 질의 (NDJSON): 임베딩/FAISS/리랭크를 질의 묶음 단위로 ----------
+def ndjson(obj: Dict) -> str:
+    return json.dumps(obj, ensure_ascii=False) + "\n"
+
+async def ask_batch_events(req: AskBatchReq):
+    """질의마다 한 줄 {"index", "query", "answer", "contexts", ["cache"]} (끝난 순서대로, index 로 대응).
+    캐시 적중은 바로, 나머지는 embed_query_batch → retrieve_contexts_batch 를 한 번에 거친 뒤
+    LLM 은 ASK_BATCH_LLM 개씩 동시에. 배치 안의 같은 질문(정규화 후)은 한 번만 처리한다."""
+    view = pin_view()
+    if not view.n_live:
+        for i, q in enumerate(req.queries):
+            yield ndjson({"index": i, "query": q, "answer": "먼저 /ingest 또는 /ingest_pdf 로 메뉴얼을 업로드해 주세요.",
+                          "contexts": []})
+        return
+
+    scope = collection_scope(req.collections)
+    groups: Dict[str, List[int]] = {}   # 정규화 질의 → 원래 index 들
+    for i, q in enumerate(req.queries):
+        qn = normalize_query_kor(q)
+        cached = ANSWER_CACHE.get((qn, req.top_k, view.generation, scope))
+        if cached is not None:
+            CACHE_HITS.inc(cache="exact")
+            yield ndjson({"index": i, "query": q, **cached, "cache": "exact"})
+        else:
+            groups.setdefault(qn, []).append(i)
+    if not groups:
+        return
+
+    qns = list(groups)
+    qvs = await run_cpu(embed_query_batch, qns)
+    todo = []   # 의미 캐시 미스
+    for j, qn in enumerate(qns):
+        hit = SEMANTIC_CACHE.lookup(qvs[j], scope) if req.semantic_cache else None
+        if hit is None:
+            todo.append(j)
+            continue
+        CACHE_HITS.inc(cache="semantic")
+        for i in groups[qn]:
+            yield ndjson({"index": i, "query": req.queries[i], **hit[0], "cache": "semantic"})
+    if not todo:
+        return
+
+    contexts = await retrieve_contexts_batch([qns[j] for j in todo], qvs[todo], req.top_k, view,
+                                             collections=scope)
+    sem = asyncio.Semaphore(ASK_BATCH_LLM)
+
+    async def answer(j: int, ctx: List[Chunk]):
+        qn = qns[j]
+        async with sem:
+            try:
+                resp = await generate_answer(req.queries[groups[qn][0]], ctx)
+            except Exception as e:
+                log.exception(f"ask_batch: '{qn}' failed")
+                return j, None, f"{type(e).__name__}: {e}"
+        if not cacheable(resp):
+            return j, resp, None
+        ANSWER_CACHE.put((qn, req.top_k, view.generation, scope), resp)
+        if ctx:
+            SEMANTIC_CACHE.add(qvs[j], qn, resp, [d.id for d in ctx], scope)
+        return j, resp, None
+
+    for fut in asyncio.as_completed([answer(j, ctx) for j, ctx in zip(todo, contexts)]):
+        j, resp, err = await fut
+        for i in groups[qns[j]]:
+            q = req.queries[i]
+            yield ndjson({"index": i, "query": q, **resp} if err is None else {"index": i, "query": q, "error": err})
+
+@app.post("/ask_batch")
+async def ask_batch(req: AskBatchReq):
+    if len(req.queries) > ASK_BATCH_MAX:
+        raise HTTPException(status_code=413, detail=f"질의는 요청당 {ASK_BATCH_MAX}개까지 (QA_ASK_BATCH_MAX)")
+    check_collections(req.collections)
+    return StreamingResponse(timed_stream(ask_batch_events(req), "ask_batch"), media_type="application/x-ndjson",
+                             headers={"X-Accel-Buffering": "no"})
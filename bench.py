@@ -0,0 +1,795 @@
+# bench.py — 성능 측정 스크립트 모음
+# 사용 예:
+#   python bench.py startup --query "배송은 며칠 걸리나요?"
+#   python bench.py docstore --n 100000
+#   python bench.py sentences --file data/eval_v2.jsonl
+#   python bench.py microbatch --threads 16 --requests 400
+#   python bench.py ingest --files 40 --port 8000
+#   python bench.py keyword --file data/eval_v2.jsonl
+#   python bench.py isolation --chunks 5000 --threads 4
+#   python bench.py recall --file data/eval_v2.jsonl --k 10 --ef 16 32 64 128 --nprobe 4 8 16 32
+#   python bench.py quant --storage float sq8 pq --rescore 2 4 8 --out quant.json
+#   python bench.py askbatch --file data/eval_v2.jsonl --n 500
+#   python bench.py prompt --api chat generate --evidence-tokens 0 300   (OLLAMA_URL: 로컬 소형 모델 또는 mock_ollama)
+#   QA_MODEL_THREADS=8 python bench.py backend --backend torch onnx   (onnx 는 먼저 python onnx_backend.py export ...)
+#   python bench.py collections --fraction 0.5 0.25 0.1
+import argparse, json, re, sys, time, random, subprocess, tracemalloc
+from pathlib import Path
+import requests
+
+
+def _wait_http(url: str, deadline: float, ok_codes=(200,)):
+    """url 이 ok_codes 로 응답할 때까지 폴링 → (성공 시각(perf_counter), status_code)"""
+    while time.perf_counter() < deadline:
+        try:
+            r = requests.get(url, timeout=1)
+            if r.status_code in ok_codes:
+                return time.perf_counter(), r.status_code
+        except requests.RequestException:
+            pass
+        time.sleep(0.05)
+    raise TimeoutError(f"timeout waiting for {url}")
+
+
+def bench_startup(args):
+    """uvicorn 기동 → 바인딩(/health) → readiness → 첫 답변까지 시간 측정.
+    /health/ready 가 없는 이전 버전도 측정할 수 있도록 404 면 첫 /ask 완료를 준비 완료로 본다."""
+    base = f"http://127.0.0.1:{args.port}"
+    cmd = [sys.executable, "-m", "uvicorn", "app:app", "--port", str(args.port)]
+    t0 = time.perf_counter()
+    proc = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        deadline = t0 + args.timeout
+        t_bind, _ = _wait_http(f"{base}/health", deadline)
+        t_ready, code = _wait_http(f"{base}/health/ready", deadline, ok_codes=(200, 404))
+        if code == 404:
+            t_ready = None
+        r = requests.post(f"{base}/ask", json={"query": args.query, "top_k": 4}, timeout=args.timeout)
+        t_answer = time.perf_counter()
+        result = {
+            "bind_s": round(t_bind - t0, 3),
+            "ready_s": round(t_ready - t0, 3) if t_ready else None,
+            "first_answer_s": round(t_answer - t0, 3),
+            "ask_status": r.status_code,
+        }
+    finally:
+        proc.terminate()
+        proc.wait(timeout=30)
+    print(json.dumps(result, ensure_ascii=False))
+    return result
+
+
+def bench_docstore(args):
+    """청크 n개: list[dict] + 선형 탐색 vs DocStore(__slots__ + id 인덱스) 메모리/조회 비교.
+    본문 문자열은 양쪽이 공유하므로 컨테이너/레코드 오버헤드만 비교된다."""
+    from store import Chunk, DocStore
+
+    texts = [f"청크 본문 {i} " * 20 for i in range(args.n)]
+
+    def build_dicts():
+        return [{"id": f"manual:{i}", "title": "manual", "chunk_idx": i, "text": texts[i]}
+                for i in range(args.n)]
+
+    def build_store():
+        ds = DocStore()
+        ds.extend(Chunk(f"manual:{i}", "manual", i, texts[i]) for i in range(args.n))
+        return ds
+
+    result = {"n": args.n}
+    for name, build in (("dict_list", build_dicts), ("docstore", build_store)):
+        tracemalloc.start()
+        obj = build()
+        cur, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        result[f"{name}_mb"] = round(cur / 2**20, 2)
+        ids = [f"manual:{random.randrange(args.n)}" for _ in range(args.lookups)]
+        t0 = time.perf_counter()
+        if name == "dict_list":
+            for did in ids:
+                next((x for x in obj if x["id"] == did), None)
+        else:
+            for did in ids:
+                obj.get(did)
+        result[f"{name}_lookup_us"] = round((time.perf_counter() - t0) / len(ids) * 1e6, 2)
+        del obj
+    print(json.dumps(result, ensure_ascii=False))
+    return result
+
+
+def _timed_search(index, qv, k):
+    t0 = time.perf_counter()
+    _, I = index.search(qv, k)
+    return I, (time.perf_counter() - t0) / len(qv) * 1e3
+
+
+def _recall(I, gt, k):
+    hit = sum(len(set(a[:k]) & set(b[:k]) - {-1}) for a, b in zip(I.tolist(), gt.tolist()))
+    return hit / (len(gt) * k)
+
+
+def _eval_query_vectors(app, files, vecs, sample_docs):
+    """eval 파일들의 query (normalize_query_kor 적용) 임베딩 + 선택적으로 코퍼스 벡터 sample_docs 개"""
+    import numpy as np
+    queries = []
+    for file in files:
+        for line in Path(file).read_text(encoding="utf-8").splitlines():
+            if line.strip():
+                queries.append(app.normalize_query_kor(json.loads(line)["query"]))
+    qv = app.embed_queries(queries)
+    if sample_docs:
+        rng = np.random.default_rng(0)
+        pick = rng.choice(vecs.shape[0], size=min(sample_docs, vecs.shape[0]), replace=False)
+        qv = np.vstack([qv, vecs[pick]])
+    return qv
+
+
+def bench_recall(args):
+    """스냅샷 벡터(QA_STORE_DIR)에 대해 flat 정답 대비 HNSW/IVF recall@k 와 질의당 지연(ms).
+    질의: eval 파일의 query (normalize_query_kor 적용) + 선택적으로 코퍼스 벡터 샘플."""
+    import numpy as np
+    import app, store
+    from vindex import IndexConfig, build_index
+
+    vecs = np.ascontiguousarray(store.load_vectors(app.STORE_DIR, app.STORE_MANIFEST))
+    if vecs.shape[0] == 0:
+        print("snapshot is empty: ingest manuals first")
+        return None
+    qv = _eval_query_vectors(app, [args.file], vecs, args.sample_docs)
+    k = args.k
+
+    cfg = IndexConfig()
+    flat = build_index("flat", vecs.shape[1], vecs, cfg)
+    gt, flat_ms = _timed_search(flat, qv, k)
+    rows = [{"kind": "flat", "param": None, "recall": 1.0, "ms_per_query": round(flat_ms, 3)}]
+
+    t0 = time.perf_counter()
+    hnsw = build_index("hnsw", vecs.shape[1], vecs, cfg)
+    build_s = time.perf_counter() - t0
+    for ef in args.ef:
+        hnsw.hnsw.efSearch = ef
+        I, ms = _timed_search(hnsw, qv, k)
+        rows.append({"kind": "hnsw", "param": f"efSearch={ef}", "recall": round(_recall(I, gt, k), 4),
+                     "ms_per_query": round(ms, 3), "build_s": round(build_s, 2)})
+
+    if vecs.shape[0] >= 39:
+        t0 = time.perf_counter()
+        ivf = build_index("ivf", vecs.shape[1], vecs, cfg)
+        build_s = time.perf_counter() - t0
+        for nprobe in args.nprobe:
+            ivf.nprobe = nprobe
+            I, ms = _timed_search(ivf, qv, k)
+            rows.append({"kind": "ivf", "param": f"nlist={ivf.nlist},nprobe={nprobe}",
+                         "recall": round(_recall(I, gt, k), 4), "ms_per_query": round(ms, 3),
+                         "build_s": round(build_s, 2)})
+
+    print(f"n_vectors={vecs.shape[0]} n_queries={len(qv)} k={k}")
+    for r in rows:
+        print(json.dumps(r, ensure_ascii=False))
+    return rows
+
+
+def bench_quant(args):
+    """벡터 저장 방식(float / sq8 / pq)별 인덱스 메모리, 질의당 지연(ms), recall@k (float flat 정답 기준).
+    양자화는 재계산 없이 / 후보 k × R 을 스냅샷 float 벡터로 재계산(rescore)한 경우를 함께 잰다.
+    질의: eval 파일들의 query + 선택적으로 코퍼스 벡터 샘플."""
+    import numpy as np
+    import app, store
+    from vindex import IndexConfig, build_index, code_size, rescore, SQ_MIN_TRAIN, PQ_MIN_TRAIN
+
+    mm = store.load_vectors(app.STORE_DIR, app.STORE_MANIFEST)
+    live = app.DOCS.live_rows()
+    if len(live) == 0:
+        print("snapshot is empty: ingest manuals first")
+        return None
+    vecs = np.ascontiguousarray(mm[live])
+    qv = _eval_query_vectors(app, args.file, vecs, args.sample_docs)
+    k = args.k
+    cfg = IndexConfig()
+    cfg.pq_m = args.pq_m
+    gt, _ = _timed_search(build_index("flat", vecs.shape[1], vecs, cfg, ids=live), qv, k)
+
+    min_train = {"float": 0, "sq8": SQ_MIN_TRAIN, "pq": PQ_MIN_TRAIN}
+    rows = []
+    for storage in args.storage:
+        if len(live) < min_train[storage]:
+            rows.append({"kind": args.kind, "storage": storage, "skipped": f"n < {min_train[storage]}"})
+            continue
+        t0 = time.perf_counter()
+        index = build_index(args.kind, vecs.shape[1], vecs, cfg, ids=live, storage=storage)
+        build_s = time.perf_counter() - t0
+        base = {"kind": args.kind, "storage": storage, "bytes_per_vector": code_size(index),
+                "codes_mb": round(code_size(index) * len(live) / 2**20, 2), "build_s": round(build_s, 2)}
+        I, ms = _timed_search(index, qv, k)
+        rows.append(dict(base, rescore=0, recall=round(_recall(I, gt, k), 4), ms_per_query=round(ms, 3)))
+        if storage == "float":
+            continue
+        for r in args.rescore:
+            t0 = time.perf_counter()
+            D, I = index.search(qv, k * r)
+            _, I = rescore(qv, D, I, mm, k)
+            ms = (time.perf_counter() - t0) / len(qv) * 1e3
+            rows.append(dict(base, rescore=r, recall=round(_recall(I, gt, k), 4), ms_per_query=round(ms, 3)))
+
+    print(f"n_vectors={len(live)} n_queries={len(qv)} k={k} float_mb={round(vecs.nbytes / 2**20, 2)}")
+    for r in rows:
+        print(json.dumps(r, ensure_ascii=False))
+    if args.out:
+        Path(args.out).write_text(json.dumps(rows, ensure_ascii=False, indent=1), encoding="utf-8")
+    return rows
+
+
+def bench_sentences(args):
+    """근거 문장 선택 비용: 질의마다 문장 분리 + 청크당 encode 2회(이전 방식)
+    vs ingest 때 계산한 문장 벡터 + 질의 벡터 1회(현재 방식). 질의당 ms."""
+    import numpy as np
+    import app
+
+    queries = [app.normalize_query_kor(json.loads(l)["query"])
+               for l in Path(args.file).read_text(encoding="utf-8").splitlines() if l.strip()]
+    if not app.DOCS:
+        print("snapshot is empty: ingest manuals first")
+        return None
+    emb = app.EMB.get()
+    cases = [(q, app.search_hybrid(q, top_k=args.topk)) for q in queries]
+
+    def old_path(q, ctxs):
+        for c in ctxs:
+            sents = app.split_sentences(c.text)
+            if sents:
+                vecs = emb.encode([app.BGE_PASSAGE_PREFIX + x for x in sents], normalize_embeddings=True)
+                qv = emb.encode([app.BGE_QUERY_PREFIX + q], normalize_embeddings=True)[0]
+                np.dot(vecs, qv)
+
+    def new_path(q, ctxs):
+        qv = app.embed_queries([q])[0]
+        for c in ctxs:
+            app.rank_sentences(c, qv, app.intent_hint(q))[:2]
+
+    result = {"n_queries": len(cases), "top_k": args.topk}
+    for name, fn in (("old", old_path), ("precomputed", new_path)):
+        t0 = time.perf_counter()
+        for _ in range(args.repeat):
+            for q, ctxs in cases:
+                fn(q, ctxs)
+        result[f"{name}_ms_per_query"] = round((time.perf_counter() - t0) / (args.repeat * len(cases)) * 1e3, 2)
+    print(json.dumps(result, ensure_ascii=False))
+    return result
+
+
+def bench_keyword(args):
+    """키워드 검색: Whoosh(BM25F, 질의마다 searcher/parser) vs 인메모리 BM25(bigram, NumPy).
+    같은 코퍼스(스냅샷, 비어 있으면 sample_manual.txt)에서 질의당 지연 p50/p95 와
+    hit@k(상위 k 안에 required_spans 를 모두 담은 청크가 있는 비율)를 비교. 모델 불필요."""
+    import tempfile
+    from whoosh.index import create_in
+    import app
+    from bm25 import BM25Index
+
+    items = [json.loads(l) for l in Path(args.file).read_text(encoding="utf-8").splitlines() if l.strip()]
+    docs = list(app.DOCS)
+    if not docs:
+        text = Path(args.source).read_text(encoding="utf-8")
+        docs = [app.Chunk(f"src:{i}", "src", i, ch) for i, ch in enumerate(app.chunk_text(text, size=400, overlap=80))]
+    by_id = {d.id: d for d in docs}
+
+    t0 = time.perf_counter()
+    app.IX = create_in(tempfile.mkdtemp(prefix="bench_whoosh_"), app.SCHEMA)
+    app.add_to_whoosh(docs)
+    build_whoosh = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    bm = BM25Index()
+    bm.add(range(len(docs)), [app.keyword_text(d) for d in docs])
+    build_bm25 = time.perf_counter() - t0
+
+    def bm25_search(q, k):
+        return [(s, docs[r].id) for s, r in bm.search(q, k)]
+
+    def hit(ids, spans):
+        spans = [re.sub(r"\s+", "", x) for x in spans]
+        return any(all(sp in re.sub(r"\s+", "", by_id[i].text) for sp in spans) for i in ids)
+
+    result = {"docs": len(docs), "queries": len(items), "k": args.k,
+              "build_s": {"whoosh": round(build_whoosh, 3), "bm25": round(build_bm25, 3)}}
+    for name, fn in (("whoosh", app.search_keyword_whoosh), ("bm25", bm25_search)):
+        lats, hits = [], 0
+        for it in items:
+            q = app.normalize_query_kor(it["query"])
+            for _ in range(args.repeat):
+                t0 = time.perf_counter()
+                res = fn(q, args.k)
+                lats.append(time.perf_counter() - t0)
+            hits += hit([i for _, i in res], it.get("required_spans") or [it.get("answer_span", "")])
+        result[name] = {"p50_ms": round(_percentile(lats, 50) * 1e3, 3),
+                        "p95_ms": round(_percentile(lats, 95) * 1e3, 3),
+                        f"hit@{args.k}": round(hits / max(len(items), 1), 3)}
+    print(json.dumps(result, ensure_ascii=False))
+    return result
+
+
+def _percentile(xs, p):
+    xs = sorted(xs)
+    if not xs:
+        return 0.0
+    return xs[min(len(xs) - 1, int(round(p / 100.0 * (len(xs) - 1))))]
+
+
+def bench_microbatch(args):
+    """동시 스레드로 질의 임베딩 + 리랭크(= /ask 의 모델 구간)를 반복 호출.
+    마이크로 배칭 off / on 각각 QPS 와 지연 p50/p95 비교. 캐시를 피하려고 질의마다 번호를 붙인다."""
+    from concurrent.futures import ThreadPoolExecutor
+    import app
+
+    base = [app.normalize_query_kor(json.loads(l)["query"])
+            for l in Path(args.file).read_text(encoding="utf-8").splitlines() if l.strip()]
+    cands = list(app.DOCS)[:args.cands] or [app.Chunk("x:0", "x", 0, "기본 배송 소요 기간은 2~3영업일입니다.")]
+    app.EMB.get(); app.RERANK.get()
+
+    def one(i):
+        q = f"{base[i % len(base)]} #{i}"
+        t0 = time.perf_counter()
+        app.QUERY_BATCHER(q)
+        app.rerank(q, cands, top_k=4)
+        return time.perf_counter() - t0
+
+    results = {}
+    for mode in ("off", "on"):
+        app.QUERY_BATCHER.enabled = app.RERANK_BATCHER.enabled = (mode == "on")
+        t0 = time.perf_counter()
+        with ThreadPoolExecutor(args.threads) as ex:
+            lats = list(ex.map(one, range(args.requests)))
+        wall = time.perf_counter() - t0
+        results[mode] = {"qps": round(args.requests / wall, 2),
+                         "p50_ms": round(_percentile(lats, 50) * 1e3, 1),
+                         "p95_ms": round(_percentile(lats, 95) * 1e3, 1)}
+    results["batching"] = {"query_embed": app.QUERY_BATCHER.stats(), "rerank": app.RERANK_BATCHER.stats()}
+    print(json.dumps(results, ensure_ascii=False))
+    return results
+
+
+def bench_isolation(args):
+    """대량 ingest 중 검색 지연: 질의 스레드들이 retrieve_contexts(검색 + 리랭크)를 반복하는 동안
+    (a) 유휴, (b) 백그라운드 스레드에서 ingest_stream 으로 청크 n개 추가 → p50/p95/p99 비교.
+    응답마다 잡아 둔 view 에 없는 청크가 섞이면 inconsistent 로 센다. 끝나면 추가한 문서를 지운다."""
+    import threading
+    from concurrent.futures import ThreadPoolExecutor
+    import app
+
+    queries = [app.normalize_query_kor(json.loads(l)["query"])
+               for l in Path(args.file).read_text(encoding="utf-8").splitlines() if l.strip()]
+    src = app.chunk_text(Path(args.source).read_text(encoding="utf-8"), size=400, overlap=80)
+    app.EMB.get(); app.RERANK.get()
+    title = f"bench_isolation{args.tag}"
+
+    def pieces():
+        for i in range(args.chunks):
+            yield title, None, f"[{i}] {src[i % len(src)]}"
+
+    def consistent(view, c):
+        row = app.DOCS.row(c.id)
+        return row is not None and view.visible(row)
+
+    def run_queries(stop, n):
+        # n 개 질의 (n 이 None 이면 stop 될 때까지)
+        lats, bad, i = [], 0, 0
+        while (i < n) if n is not None else not stop.is_set():
+            q = f"{queries[i % len(queries)]} #{i}"   # 캐시를 피하려고 번호를 붙인다
+            view = app.pin_view()
+            t0 = time.perf_counter()
+            ctxs = app.retrieve_contexts(q, 4, view)
+            lats.append(time.perf_counter() - t0)
+            bad += sum(1 for c in ctxs if not consistent(view, c))
+            i += 1
+        return lats, bad
+
+    def measure(ingest: bool):
+        stop = threading.Event()
+        t_ingest = None
+        writer = None
+        if ingest:
+            def write():
+                nonlocal t_ingest
+                t0 = time.perf_counter()
+                app.ingest_stream(pieces())
+                t_ingest = time.perf_counter() - t0
+                stop.set()
+            writer = threading.Thread(target=write)
+            writer.start()
+        n = None if ingest else args.queries
+        with ThreadPoolExecutor(args.threads) as ex:
+            outs = list(ex.map(lambda _: run_queries(stop, n), range(args.threads)))
+        if writer is not None:
+            writer.join()
+        lats = [x for l, _ in outs for x in l]
+        row = {"requests": len(lats), "inconsistent": sum(b for _, b in outs),
+               "p50_ms": round(_percentile(lats, 50) * 1e3, 2), "p95_ms": round(_percentile(lats, 95) * 1e3, 2),
+               "p99_ms": round(_percentile(lats, 99) * 1e3, 2)}
+        if t_ingest is not None:
+            row.update(ingest_chunks=args.chunks, ingest_s=round(t_ingest, 2))
+        return row
+
+    result = {"idle": measure(False), "during_ingest": measure(True), "index": app.FAISS_INDEX.status()}
+    result["cleanup_deleted"] = app.delete_title(title)
+    print(json.dumps(result, ensure_ascii=False))
+    return result
+
+
+def bench_ingest(args):
+    """실행 중인 서버에 같은 분량의 문서를 (a) 파일마다 /ingest, (b) /ingest_batch 한 번(zip)으로 올려
+    chunks/s 비교. 코퍼스가 커지므로 빈 QA_STORE_DIR 로 띄운 테스트 서버에서 실행할 것."""
+    import io, zipfile
+    base = f"http://127.0.0.1:{args.port}"
+    src = Path(args.source).read_text(encoding="utf-8")
+    docs = [(f"bench{args.tag}_{i}", f"[문서 {i}]\n" + src * args.repeat) for i in range(args.files)]
+
+    def chunks_now():
+        return requests.get(f"{base}/health", timeout=10).json()["docs"]
+
+    results = {}
+    n0 = chunks_now()
+    t0 = time.perf_counter()
+    for title, text in docs:
+        r = requests.post(f"{base}/ingest", data={"title": title + "_file"},
+                          files={"file": ("a.txt", text.encode("utf-8"))}, timeout=600)
+        r.raise_for_status()
+    wall = time.perf_counter() - t0
+    n1 = chunks_now()
+    results["per_file"] = {"chunks": n1 - n0, "seconds": round(wall, 2),
+                           "chunks_per_sec": round((n1 - n0) / wall, 2)}
+
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w") as zf:
+        for title, text in docs:
+            zf.writestr(f"{title}_batch.txt", text)
+    t0 = time.perf_counter()
+    r = requests.post(f"{base}/ingest_batch", files=[("files", ("docs.zip", buf.getvalue()))], timeout=600)
+    r.raise_for_status()
+    job_id = r.json()["job_id"]
+    while True:
+        st = requests.get(f"{base}/jobs/{job_id}", timeout=10).json()
+        if st["state"] in ("done", "error"):
+            break
+        time.sleep(0.05)
+    wall = time.perf_counter() - t0
+    results["batch"] = {"chunks": st["progress"].get("chunks", 0), "seconds": round(wall, 2),
+                        "chunks_per_sec": round(st["progress"].get("chunks", 0) / wall, 2),
+                        "batches": st["progress"].get("batches"), "state": st["state"]}
+    print(json.dumps(results, ensure_ascii=False))
+    return results
+
+
+def bench_askbatch(args):
+    """같은 질의 n개를 (a) /ask 파이프라인을 하나씩, (b) /ask_batch 한 번으로 처리해 질의/초 비교 (스냅샷 기준, 서버 없이).
+    답변/의미 캐시를 피하려고 질의마다 번호를 붙인다. 기본은 LLM 끔 (--llm: 켜고 측정, LLM 시간이 대부분이 됨)."""
+    import asyncio
+    import app
+
+    app.USE_LLM = args.llm
+    app.EMB.get(); app.RERANK.get()
+    base = [json.loads(l)["query"] for l in Path(args.file).read_text(encoding="utf-8").splitlines() if l.strip()]
+
+    def queries(tag):
+        return [f"{base[i % len(base)]} {tag}{i}" for i in range(args.n)]
+
+    async def loop(qs):
+        return [await app.ask_pipeline(app.AskReq(query=q, top_k=args.topk, semantic_cache=False)) for q in qs]
+
+    async def batch(qs):
+        out = []
+        for i in range(0, len(qs), args.batch):
+            req = app.AskBatchReq(queries=qs[i:i + args.batch], top_k=args.topk, semantic_cache=False)
+            out += [json.loads(line) async for line in app.ask_batch_events(req)]
+        return out
+
+    results = {}
+    for mode, fn in (("loop", loop), ("batch", batch)):
+        qs = queries(f"#{mode}")
+        t0 = time.perf_counter()
+        out = asyncio.run(fn(qs))
+        wall = time.perf_counter() - t0
+        results[mode] = {"queries": len(out), "seconds": round(wall, 2), "qps": round(len(out) / wall, 2)}
+    results["speedup"] = round(results["batch"]["qps"] / max(results["loop"]["qps"], 1e-9), 2)
+    print(json.dumps(results, ensure_ascii=False))
+    return results
+
+
+def bench_prompt(args):
+    """질의마다 검색 → LLM 1회 (스냅샷 기준, 서버 없이). Ollama 가 보고한 prompt eval 토큰 수 / 시간과
+    추정 입력 토큰(지시문 + 질문 + 근거, num_ctx 대비)을 QA_LLM_API × 근거 예산별로 비교.
+    mock_ollama 로 잴 때는 MOCK_PROMPT_MS_PER_TOKEN 을 주고 띄운다 (프리픽스 재사용 흉내)."""
+    import asyncio
+    import app
+
+    app.EMB.get(); app.RERANK.get()
+    base = [json.loads(l)["query"] for l in Path(args.file).read_text(encoding="utf-8").splitlines() if l.strip()]
+    qs = [base[i % len(base)] for i in range(args.n)]
+    items = [(q, app.retrieve_contexts(app.normalize_query_kor(q), args.topk)) for q in qs]
+
+    def snap():
+        pe = app.metrics.STAGE_SECONDS.summary(stage="llm.prompt_eval")
+        llm = app.metrics.STAGE_SECONDS.summary(stage="llm")
+        return pe["sum"], llm["sum"], llm["count"], app.LLM_PROMPT_TOKENS.summary()["sum"]
+
+    async def run(batch):
+        for q, contexts in batch:
+            await app.llm_answer_extractive_json(q, contexts)
+        await app.OLLAMA.aclose()
+
+    results = []
+    for api in args.api:
+        for budget in args.evidence_tokens:
+            app.LLM_API, app.LLM_EVIDENCE_TOKENS = api, budget
+            asyncio.run(run(items[:1]))   # 워밍업 (모델 로드 / 슬롯 캐시 채우기)
+            est = [app.system_prompt_tokens() + app.count_tokens(app.build_llm_prompt(q, c)) for q, c in items]
+            s0 = snap()
+            asyncio.run(run(items))
+            pe, llm, n, toks = (b - a for a, b in zip(s0, snap()))
+            results.append({"api": api, "evidence_tokens": budget or "auto", "requests": n,
+                            "est_input_tokens": {"mean": round(sum(est) / len(est), 1), "max": max(est),
+                                                 "num_ctx": app.LLM_OPTIONS["num_ctx"]},
+                            "prompt_eval_tokens_mean": round(toks / max(n, 1), 1),
+                            "prompt_eval_ms_mean": round(pe / max(n, 1) * 1e3, 1),
+                            "llm_ms_mean": round(llm / max(n, 1) * 1e3, 1)})
+            print(json.dumps(results[-1], ensure_ascii=False))
+    return results
+
+
+def bench_backend(args):
+    """임베딩/리랭커 추론 백엔드 비교 (torch fp32 vs onnx int8, models 로더로 직접 로드, 서버/인덱스 불필요).
+    정확도는 첫 백엔드 기준: 질의·청크 임베딩 코사인, dense top-k 겹침, 같은 후보에 대한 리랭크 점수
+    Spearman/최대 차이/top-1 일치, 그리고 백엔드별 eval_v2 hit@k (dense 후보 → 리랭크 상위 k 에 required_spans).
+    속도: 로드 시간, 질의 1건 임베딩 p50/p95, 청크 임베딩 texts/s, 질의당 리랭크 p50/p95.
+    스레드 수는 QA_MODEL_THREADS, 최대 길이는 QA_EMB_MAX_SEQ_LEN / QA_RERANK_MAX_LEN."""
+    import gc
+    import numpy as np
+    import app, models
+
+    items = [json.loads(l) for l in Path(args.file).read_text(encoding="utf-8").splitlines() if l.strip()]
+    docs = list(app.DOCS)
+    if not docs:
+        text = Path(args.source).read_text(encoding="utf-8")
+        docs = [app.Chunk(f"src:{i}", "src", i, ch) for i, ch in enumerate(app.chunk_text(text, size=400, overlap=80))]
+    docs = docs[:args.max_docs] if args.max_docs else docs
+    qns = [app.normalize_query_kor(it["query"]) for it in items]
+    qtexts = [app.BGE_QUERY_PREFIX + q for q in qns]
+    ptexts = [app.BGE_PASSAGE_PREFIX + d.text for d in docs]
+    k, n_cands = args.k, max(args.cands, args.k)
+
+    def hit(ids, spans):
+        spans = [re.sub(r"\s+", "", x) for x in spans]
+        return any(all(sp in re.sub(r"\s+", "", docs[i].text) for sp in spans) for i in ids)
+
+    def ranks(x):
+        return np.argsort(np.argsort(x)).astype("float64")
+
+    result = {"docs": len(docs), "queries": len(items), "k": k, "cands": n_cands,
+              "threads": models.MODEL_THREADS or "default", "backends": {}}
+    ref = None
+    for backend in args.backend:
+        t0 = time.perf_counter()
+        emb = models.load_embedding_model(app.EMB_MODEL_NAME, app.DIM, backend)
+        t_emb = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        rr = models.load_reranker(app.RERANKER_NAME, backend)
+        t_rr = time.perf_counter() - t0
+        emb.encode(["query: 워밍업"], normalize_embeddings=True)
+        rr.compute_score([["워밍업", "워밍업 문장입니다."]])
+
+        q_lats = []
+        for q in qtexts:
+            for _ in range(args.repeat):
+                t0 = time.perf_counter()
+                emb.encode([q], normalize_embeddings=True)
+                q_lats.append(time.perf_counter() - t0)
+        t0 = time.perf_counter()
+        P = np.asarray(emb.encode(ptexts, batch_size=32, normalize_embeddings=True), dtype="float32")
+        t_pass = time.perf_counter() - t0
+        Q = np.asarray(emb.encode(qtexts, batch_size=32, normalize_embeddings=True), dtype="float32")
+        cands = np.argsort(-(Q @ P.T), axis=1)[:, :n_cands]
+
+        def score(cand_rows):
+            out, lats = [], []
+            for q, row in zip(qns, cand_rows):
+                t0 = time.perf_counter()
+                s = rr.compute_score([[q, docs[j].text] for j in row], batch_size=32)
+                lats.append(time.perf_counter() - t0)
+                out.append(np.atleast_1d(np.asarray(s, dtype="float64")))
+            return out, lats
+
+        scores, r_lats = score(cands)
+        hits = sum(hit([row[j] for j in np.argsort(-s)[:k]], it.get("required_spans") or [it.get("answer_span", "")])
+                   for row, s, it in zip(cands, scores, items))
+        r = {"load_s": {"embed": round(t_emb, 2), "rerank": round(t_rr, 2)},
+             "query_embed_ms": {"p50": round(_percentile(q_lats, 50) * 1e3, 2),
+                                "p95": round(_percentile(q_lats, 95) * 1e3, 2)},
+             "passage_texts_per_s": round(len(ptexts) / max(t_pass, 1e-9), 1),
+             "rerank_ms_per_query": {"p50": round(_percentile(r_lats, 50) * 1e3, 2),
+                                     "p95": round(_percentile(r_lats, 95) * 1e3, 2)},
+             f"hit@{k}": round(hits / max(len(items), 1), 3)}
+        if ref is None:
+            ref = {"backend": backend, "Q": Q, "P": P, "cands": cands, "scores": scores}
+        else:
+            # 같은 후보(기준 백엔드의 dense top-n)에 대한 리랭크 점수를 비교
+            same, _ = score(ref["cands"])
+            rho = [float(np.corrcoef(ranks(a), ranks(b))[0, 1]) if len(a) > 1 else 1.0
+                   for a, b in zip(ref["scores"], same)]
+            overlap = [len(set(a[:k]) & set(b[:k])) / k for a, b in zip(ref["cands"], cands)]
+            r["vs_" + ref["backend"]] = {
+                "query_cos": {"mean": round(float(np.sum(ref["Q"] * Q, axis=1).mean()), 4),
+                              "min": round(float(np.sum(ref["Q"] * Q, axis=1).min()), 4)},
+                "passage_cos": {"mean": round(float(np.sum(ref["P"] * P, axis=1).mean()), 4),
+                                "min": round(float(np.sum(ref["P"] * P, axis=1).min()), 4)},
+                f"dense_top{k}_overlap": round(float(np.mean(overlap)), 3),
+                "rerank_spearman_mean": round(float(np.nanmean(rho)), 4),
+                "rerank_max_abs_diff": round(max(float(np.abs(a - b).max()) for a, b in zip(ref["scores"], same)), 4),
+                "rerank_top1_agree": round(float(np.mean([np.argmax(a) == np.argmax(b)
+                                                          for a, b in zip(ref["scores"], same)])), 3)}
+        result["backends"][backend] = r
+        print(json.dumps({backend: r}, ensure_ascii=False))
+        del emb, rr
+        gc.collect()
+    print(json.dumps(result, ensure_ascii=False))
+    return result
+
+
+def bench_collections(args):
+    """컬렉션 필터 검색 지연 (스냅샷 기준, 서버 없이): 전체 vs 코퍼스의 일부 title 만.
+    --fraction 마다 큰 title 부터 청크 수 합이 그 비율을 넘지 않게 골라 collections 로 검색 (실제 비율을 함께 출력).
+    구간별 p50/p95: 벡터 검색 / 키워드 검색 / retrieve(하이브리드 + 리랭크). 질의 임베딩은 미리 캐시해 빼고 잰다."""
+    import app
+
+    view = app.pin_view()
+    sizes = sorted(((len(pv.live), t) for t, pv in view.partitions.items()), reverse=True)
+    if len(sizes) < 2:
+        print("need at least 2 collections (titles) in the snapshot")
+        return None
+    total = sum(n for n, _ in sizes)
+    app.EMB.get(); app.RERANK.get()
+    qns = [app.normalize_query_kor(json.loads(l)["query"])
+           for l in Path(args.file).read_text(encoding="utf-8").splitlines() if l.strip()]
+    for q in qns:
+        app.embed_query(q)
+
+    configs = [("all", None, total)]
+    for f in args.fraction:
+        picked, n = [], 0
+        for size, t in sizes:
+            if n + size <= f * total:
+                picked.append(t)
+                n += size
+        if not picked:
+            n, t = sizes[-1]
+            picked = [t]
+        configs.append((f"{f:g}", tuple(sorted(picked)), n))
+
+    k = max(args.topk, 12)
+    stages = {"search_vector": lambda q, c: app.search_vector(q, max(k * 3, 12), view, c),
+              "search_keyword": lambda q, c: app.search_keyword(q, max(k * 6, 24), view, c),
+              "retrieve": lambda q, c: app.retrieve_contexts(q, args.topk, view, 0.6, c)}
+    results = []
+    for name, cols, n in configs:
+        r = {"filter": name, "collections": len(cols) if cols else len(sizes), "chunks": n,
+             "fraction": round(n / max(total, 1), 3)}
+        for stage_name, fn in stages.items():
+            lats = []
+            for _ in range(args.repeat):
+                for q in qns:
+                    t0 = time.perf_counter()
+                    fn(q, cols)
+                    lats.append(time.perf_counter() - t0)
+            r[f"{stage_name}_ms"] = {"p50": round(_percentile(lats, 50) * 1e3, 3),
+                                     "p95": round(_percentile(lats, 95) * 1e3, 3)}
+        results.append(r)
+        print(json.dumps(r, ensure_ascii=False))
+    return results
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    sub = ap.add_subparsers(dest="cmd", required=True)
+
+    sp = sub.add_parser("startup", help="기동 시간 / 첫 답변 시간")
+    sp.add_argument("--port", type=int, default=8765)
+    sp.add_argument("--query", default="배송은 며칠 걸리나요?")
+    sp.add_argument("--timeout", type=float, default=600)
+    sp.set_defaults(func=bench_startup)
+
+    sp = sub.add_parser("docstore", help="청크 저장소 메모리 / id 조회 시간")
+    sp.add_argument("--n", type=int, default=100_000)
+    sp.add_argument("--lookups", type=int, default=200)
+    sp.set_defaults(func=bench_docstore)
+
+    sp = sub.add_parser("sentences", help="근거 문장 선택: 질의 시 임베딩 vs ingest 사전 계산")
+    sp.add_argument("--file", default="data/eval_v2.jsonl")
+    sp.add_argument("--topk", type=int, default=4)
+    sp.add_argument("--repeat", type=int, default=3)
+    sp.set_defaults(func=bench_sentences)
+
+    sp = sub.add_parser("microbatch", help="동시 요청: 마이크로 배칭 on/off QPS·지연")
+    sp.add_argument("--file", default="data/eval_v2.jsonl")
+    sp.add_argument("--threads", type=int, default=16)
+    sp.add_argument("--requests", type=int, default=400)
+    sp.add_argument("--cands", type=int, default=12, help="질의당 리랭크 후보 수")
+    sp.set_defaults(func=bench_microbatch)
+
+    sp = sub.add_parser("ingest", help="대량 ingest: 파일별 /ingest vs /ingest_batch chunks/s")
+    sp.add_argument("--port", type=int, default=8000)
+    sp.add_argument("--source", default="sample_manual.txt")
+    sp.add_argument("--files", type=int, default=40)
+    sp.add_argument("--repeat", type=int, default=5, help="문서 1개 = source 를 n번 반복")
+    sp.add_argument("--tag", default="", help="title 접두어 구분용")
+    sp.set_defaults(func=bench_ingest)
+
+    sp = sub.add_parser("isolation", help="대량 ingest 중 검색 지연 p50/p95/p99 (유휴 대비) + view 일관성")
+    sp.add_argument("--file", default="data/eval_v2.jsonl")
+    sp.add_argument("--source", default="sample_manual.txt")
+    sp.add_argument("--chunks", type=int, default=5000, help="백그라운드로 ingest 할 청크 수")
+    sp.add_argument("--threads", type=int, default=4)
+    sp.add_argument("--queries", type=int, default=200, help="유휴 측정 시 스레드당 질의 수")
+    sp.add_argument("--tag", default="")
+    sp.set_defaults(func=bench_isolation)
+
+    sp = sub.add_parser("keyword", help="키워드 검색: Whoosh vs 인메모리 BM25 지연 / hit@k")
+    sp.add_argument("--file", default="data/eval_v2.jsonl")
+    sp.add_argument("--source", default="sample_manual.txt", help="스냅샷이 비었을 때 쓸 코퍼스")
+    sp.add_argument("--k", type=int, default=4)
+    sp.add_argument("--repeat", type=int, default=20)
+    sp.set_defaults(func=bench_keyword)
+
+    sp = sub.add_parser("recall", help="ANN(HNSW/IVF) recall@k vs flat, 스냅샷 기준")
+    sp.add_argument("--file", default="data/eval_v2.jsonl")
+    sp.add_argument("--k", type=int, default=10)
+    sp.add_argument("--ef", type=int, nargs="*", default=[16, 32, 64, 128])
+    sp.add_argument("--nprobe", type=int, nargs="*", default=[4, 8, 16, 32])
+    sp.add_argument("--sample-docs", type=int, default=0, help="코퍼스 벡터 n개를 질의로 추가")
+    sp.set_defaults(func=bench_recall)
+
+    sp = sub.add_parser("quant", help="벡터 양자화(sq8/pq): 메모리 / 지연 / recall@k vs float, 스냅샷 기준")
+    sp.add_argument("--file", nargs="+", default=["data/eval.jsonl", "data/eval_v2.jsonl"])
+    sp.add_argument("--kind", choices=["flat", "hnsw", "ivf"], default="flat")
+    sp.add_argument("--storage", nargs="*", default=["float", "sq8", "pq"])
+    sp.add_argument("--k", type=int, default=10)
+    sp.add_argument("--pq-m", type=int, default=64, help="PQ 부분공간 수 (= 벡터당 바이트)")
+    sp.add_argument("--rescore", type=int, nargs="*", default=[2, 4, 8], help="float 재계산 후보 배수")
+    sp.add_argument("--sample-docs", type=int, default=0, help="코퍼스 벡터 n개를 질의로 추가")
+    sp.add_argument("--out", default="", help="결과 JSON 저장 경로")
+    sp.set_defaults(func=bench_quant)
+
+    sp = sub.add_parser("askbatch", help="/ask 반복 vs /ask_batch 처리량 (질의/초), 스냅샷 기준")
+    sp.add_argument("--file", default="data/eval_v2.jsonl")
+    sp.add_argument("--n", type=int, default=500)
+    sp.add_argument("--batch", type=int, default=500, help="/ask_batch 요청당 질의 수")
+    sp.add_argument("--topk", type=int, default=4)
+    sp.add_argument("--llm", action="store_true", help="LLM 포함 (기본: 추출요약만)")
+    sp.set_defaults(func=bench_askbatch)
+
+    sp = sub.add_parser("prompt", help="LLM prompt eval 토큰/시간: chat(system 프리픽스 재사용) vs generate, 근거 예산별")
+    sp.add_argument("--file", default="data/eval_v2.jsonl")
+    sp.add_argument("--n", type=int, default=30)
+    sp.add_argument("--topk", type=int, default=4)
+    sp.add_argument("--api", nargs="+", default=["chat", "generate"])
+    sp.add_argument("--evidence-tokens", type=int, nargs="+", default=[0], help="근거 토큰 상한 (0: num_ctx 에 맞춰 최대)")
+    sp.set_defaults(func=bench_prompt)
+
+    sp = sub.add_parser("collections", help="컬렉션(title) 필터 검색 지연: 전체 vs 코퍼스 일부, 스냅샷 기준")
+    sp.add_argument("--file", default="data/eval_v2.jsonl")
+    sp.add_argument("--fraction", type=float, nargs="+", default=[0.5, 0.25, 0.1], help="필터로 남길 코퍼스 비율")
+    sp.add_argument("--topk", type=int, default=4)
+    sp.add_argument("--repeat", type=int, default=5)
+    sp.set_defaults(func=bench_collections)
+
+    sp = sub.add_parser("backend", help="임베딩/리랭커 추론 백엔드 torch vs onnx(int8): 정확도(eval_v2 hit@k, 임베딩 코사인, 리랭크 상관) / 지연·처리량")
+    sp.add_argument("--file", default="data/eval_v2.jsonl")
+    sp.add_argument("--source", default="sample_manual.txt", help="스냅샷이 비었을 때 쓸 코퍼스")
+    sp.add_argument("--backend", nargs="+", default=["torch", "onnx"], help="첫 번째가 정확도 비교 기준")
+    sp.add_argument("--k", type=int, default=4)
+    sp.add_argument("--cands", type=int, default=12, help="질의당 리랭크 후보 수")
+    sp.add_argument("--max-docs", type=int, default=2000, help="임베딩할 청크 수 상한 (0: 전부)")
+    sp.add_argument("--repeat", type=int, default=3)
+    sp.set_defaults(func=bench_backend)
+
+    args = ap.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
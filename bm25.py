@@ -0,0 +1,149 @@
+# bm25.py — 인메모리 BM25 키워드 검색 (Whoosh 대체)
+# 토큰: 한글은 어절 내 문자 bigram ("반품은" → 반품, 품은 → "반품" 과 매칭), 영문/숫자는 단어 그대로.
+# 포스팅은 term 별 NumPy 배열 (row, tf), 점수는 term 단위로 벡터화해 누적한다.
+# 문서 번호 = DOCS row (FAISS id 와 동일). 삭제는 그 문서의 포스팅을 바로 빼서 df/term 목록이 새로 만든 색인과 같다.
+# 색인 상태는 copy-on-write: 요청은 BM25State 하나를 잡고 검색하고, 추가/삭제는 새 상태로 교체한다.
+
+import re, math, threading
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+import numpy as np
+
+HANGUL = re.compile(r"[가-힣]")
+WORD = re.compile(r"[0-9A-Za-z가-힣]+")
+
+
+def tokenize(text: str) -> List[str]:
+    out = []
+    for w in WORD.findall((text or "").lower()):
+        if HANGUL.search(w):
+            if len(w) == 1:
+                out.append(w)
+            else:
+                out.extend(w[i:i + 2] for i in range(len(w) - 1))
+        else:
+            out.append(w)
+    return out
+
+
+class BM25State:
+    """게시된 색인 상태 (읽기 전용). writer 는 새 상태를 만들어 참조만 바꾼다."""
+    __slots__ = ("post", "dl", "alive", "n_docs", "total_len")
+
+    def __init__(self, post: Dict[str, Tuple[np.ndarray, np.ndarray]], dl: np.ndarray, alive: np.ndarray,
+                 n_docs: int, total_len: float):
+        self.post = post          # term → (rows int32, tf float32)
+        self.dl = dl              # row → 문서 길이(토큰 수)
+        self.alive = alive
+        self.n_docs = n_docs
+        self.total_len = total_len
+
+
+class BM25Index:
+    """add(rows, texts) 로 배치 추가, remove(rows, texts) 로 삭제, search(query, k) → [(score, row)]
+    copy-on-write: 추가/삭제는 새 BM25State 를 만들어 교체하므로 검색은 락 없이 상태 하나를 본다."""
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.Lock()   # writer 직렬화
+        self.state = BM25State({}, np.zeros(0, dtype="float32"), np.zeros(0, dtype=bool), 0, 0.0)
+
+    def __len__(self) -> int:
+        return self.state.n_docs
+
+    def add(self, rows: Iterable[int], texts: Iterable[str]):
+        rows = list(rows)
+        if not rows:
+            return
+        grow: Dict[str, Tuple[List[int], List[int]]] = {}
+        lens = []
+        for r, text in zip(rows, texts):
+            tf = Counter(tokenize(text))
+            lens.append(sum(tf.values()))
+            for t, c in tf.items():
+                rs, cs = grow.setdefault(t, ([], []))
+                rs.append(r)
+                cs.append(c)
+        with self._lock:
+            old = self.state
+            n = max(len(old.dl), max(rows) + 1)
+            dl = np.zeros(n, dtype="float32")
+            dl[:len(old.dl)] = old.dl
+            alive = np.zeros(n, dtype=bool)
+            alive[:len(old.alive)] = old.alive
+            dl[rows] = lens
+            alive[rows] = True
+            post = dict(old.post)
+            for t, (rs, cs) in grow.items():
+                new_r, new_c = np.asarray(rs, dtype="int32"), np.asarray(cs, dtype="float32")
+                prev = post.get(t)
+                if prev is not None:
+                    new_r, new_c = np.concatenate([prev[0], new_r]), np.concatenate([prev[1], new_c])
+                post[t] = (new_r, new_c)
+            self.state = BM25State(post, dl, alive, old.n_docs + len(rows), old.total_len + float(sum(lens)))
+
+    def remove(self, rows: Iterable[int], texts: Iterable[str]):
+        """texts: add 때와 같은 본문. 다시 토큰화해 그 term 들의 포스팅에서만 삭제 row 를 뺀다
+        (포스팅이 비면 term 도 삭제) → df/평균 길이/term 수가 살아있는 문서만으로 만든 색인과 같다."""
+        with self._lock:
+            old = self.state
+            alive = old.alive.copy()
+            n_docs, total_len = old.n_docs, old.total_len
+            gone, terms = [], set()
+            for r, text in zip(rows, texts):
+                if 0 <= r < len(alive) and alive[r]:
+                    alive[r] = False
+                    n_docs -= 1
+                    total_len -= float(old.dl[r])
+                    gone.append(r)
+                    terms.update(tokenize(text))
+            if not gone:
+                return
+            gone = np.asarray(gone, dtype="int32")
+            post = dict(old.post)
+            for t in terms:
+                prev = post.get(t)
+                if prev is None:
+                    continue
+                keep = ~np.isin(prev[0], gone)
+                if keep.all():
+                    continue
+                if keep.any():
+                    post[t] = (prev[0][keep], prev[1][keep])
+                else:
+                    del post[t]
+            self.state = BM25State(post, old.dl, alive, n_docs, total_len)
+
+    def search(self, query: str, top_k: int = 12, state: Optional[BM25State] = None) -> List[Tuple[float, int]]:
+        """state: 요청이 잡아 둔 상태 (None 이면 현재 상태)"""
+        scores, rows = self.top(query, top_k, state)
+        return list(zip(scores.tolist(), rows.tolist()))
+
+    def top(self, query: str, top_k: int = 12, state: Optional[BM25State] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """search 와 같지만 (점수, row) 배열로 반환 (여러 색인의 결과를 NumPy 로 합칠 때)"""
+        empty = np.zeros(0, dtype="float32"), np.zeros(0, dtype="int64")
+        st = state or self.state
+        qtf = Counter(tokenize(query))
+        dl, n_docs = st.dl, st.n_docs
+        avgdl = st.total_len / max(n_docs, 1)
+        posts = [(st.post[t], c) for t, c in qtf.items() if t in st.post]
+        if not posts or n_docs == 0:
+            return empty
+        scores = np.zeros(len(dl), dtype="float32")
+        norm = self.k1 * (1.0 - self.b + self.b * dl / max(avgdl, 1e-9))
+        for (rows, tf), qc in posts:
+            df = len(rows)   # 포스팅에는 살아있는 문서만 있다
+            idf = math.log(1.0 + (n_docs - df + 0.5) / (df + 0.5))
+            scores[rows] += qc * idf * tf * (self.k1 + 1.0) / (tf + norm[rows])
+        k = min(top_k, int(np.count_nonzero(scores)))
+        if k == 0:
+            return empty
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return scores[top], top.astype("int64")
+
+    def stats(self) -> Dict:
+        st = self.state
+        return {"docs": st.n_docs, "terms": len(st.post), "rows": int(len(st.dl)),
+                "postings": int(sum(len(r) for r, _ in st.post.values()))}
@@ -0,0 +1,201 @@
+# caches.py — 크기 제한 LRU + TTL 캐시 (질의 임베딩 / 답변 캐시), 의미 기반 답변 캐시, single-flight
+
+import time, asyncio, threading
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Iterable, List, Optional, Set, Tuple
+import numpy as np
+import faiss
+
+SCOPE_PROBE = 8   # SemanticCache.lookup 이 범위(scope)를 맞춰 보는 최근접 후보 수
+
+
+class LRUCache:
+    """thread-safe LRU 캐시. maxsize 초과 시 가장 오래 안 쓴 항목을, ttl(초) 경과 항목은 조회 시 제거.
+    hits / misses / evictions(용량 초과) / expirations(TTL) 카운터를 stats() 로 노출한다."""
+
+    def __init__(self, maxsize: int, ttl: Optional[float] = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return default
+            value, expires = item
+            if expires is not None and expires < time.monotonic():
+                del self._data[key]
+                self.expirations += 1
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: Hashable, value: Any):
+        if self.maxsize <= 0:
+            return
+        expires = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            self._data[key] = (value, expires)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> Dict:
+        total = self.hits + self.misses
+        return {"size": len(self._data), "maxsize": self.maxsize, "ttl": self.ttl,
+                "hits": self.hits, "misses": self.misses,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0,
+                "evictions": self.evictions, "expirations": self.expirations}
+
+
+class SemanticCache:
+    """과거 질의 벡터 → 최종 답변. 새 질의와 코사인 유사도가 threshold 이상이면 그 답변을 재사용.
+    항목마다 근거 청크 id 를 기록해 두고, 해당 청크가 바뀌면 invalidate_chunks 로 제거한다.
+    scope: 검색 범위 (예: 컬렉션 필터). 범위가 같은 항목만 재사용한다.
+    ttl(초): 근거 청크가 그대로여도 이 시간이 지난 항목은 조회 시 제거 (None 이면 무기한)."""
+
+    def __init__(self, dim: int, threshold: float, maxsize: int, ttl: Optional[float] = None):
+        self.dim = dim
+        self.threshold = threshold
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._index = faiss.IndexIDMap(faiss.IndexFlatIP(dim))
+        # eid → (원래 질의, 값, 근거 청크 id, scope, 만료 시각)
+        self._entries: "OrderedDict[int, Tuple[str, Any, Tuple[str, ...], Hashable, Optional[float]]]" = OrderedDict()
+        self._by_chunk: Dict[str, Set[int]] = {}
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.expirations = 0
+
+    def lookup(self, qv: np.ndarray, scope: Hashable = None) -> Optional[Tuple[Any, float, str]]:
+        """→ (값, 유사도, 원래 질의) 또는 None"""
+        with self._lock:
+            if self._index.ntotal == 0:
+                self.misses += 1
+                return None
+            # 가장 가까운 항목이 다른 범위일 수 있으므로 몇 개 더 보고 같은 범위 중 첫 번째
+            k = min(self._index.ntotal, SCOPE_PROBE)
+            D, I = self._index.search(np.asarray(qv, dtype="float32").reshape(1, -1), k)
+            now, expired, found = time.monotonic(), [], None
+            for eid, score in zip(I[0].tolist(), D[0].tolist()):
+                if eid < 0 or score < self.threshold:
+                    break
+                entry = self._entries.get(eid)
+                if entry is None:
+                    continue
+                if entry[4] is not None and entry[4] < now:
+                    expired.append(eid)
+                    continue
+                if entry[3] != scope:
+                    continue
+                self._entries.move_to_end(eid)
+                found = (entry[1], score, entry[0])
+                break
+            self._remove(expired)
+            self.expirations += len(expired)
+            if found is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return found
+
+    def add(self, qv: np.ndarray, query: str, value: Any, chunk_ids: Iterable[str], scope: Hashable = None):
+        if self.maxsize <= 0:
+            return
+        chunk_ids = tuple(chunk_ids)
+        with self._lock:
+            eid = self._next_id
+            self._next_id += 1
+            self._index.add_with_ids(np.asarray(qv, dtype="float32").reshape(1, -1),
+                                     np.array([eid], dtype="int64"))
+            expires = time.monotonic() + self.ttl if self.ttl else None
+            self._entries[eid] = (query, value, chunk_ids, scope, expires)
+            for cid in chunk_ids:
+                self._by_chunk.setdefault(cid, set()).add(eid)
+            while len(self._entries) > self.maxsize:
+                old = next(iter(self._entries))
+                self._remove([old])
+                self.evictions += 1
+
+    def _remove(self, eids: List[int]):
+        # lock 보유 상태에서 호출
+        for eid in eids:
+            chunk_ids = self._entries.pop(eid)[2]
+            for cid in chunk_ids:
+                s = self._by_chunk.get(cid)
+                if s is not None:
+                    s.discard(eid)
+                    if not s:
+                        del self._by_chunk[cid]
+        if eids:
+            self._index.remove_ids(np.array(eids, dtype="int64"))
+
+    def invalidate_chunks(self, chunk_ids: Iterable[str]) -> int:
+        """해당 청크를 근거로 쓴 항목 제거, 제거 수 반환"""
+        with self._lock:
+            eids = sorted({e for cid in chunk_ids for e in self._by_chunk.get(cid, ())})
+            self._remove(eids)
+            self.invalidations += len(eids)
+            return len(eids)
+
+    def clear(self):
+        with self._lock:
+            self._index.reset()
+            self._entries.clear()
+            self._by_chunk.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Dict:
+        total = self.hits + self.misses
+        return {"size": len(self._entries), "maxsize": self.maxsize, "threshold": self.threshold, "ttl": self.ttl,
+                "hits": self.hits, "misses": self.misses,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0,
+                "evictions": self.evictions, "invalidations": self.invalidations,
+                "expirations": self.expirations}
+
+
+class SingleFlight:
+    """asyncio single-flight: 같은 key 로 동시에 들어온 호출은 첫 호출의 작업 1개를 함께 기다린다.
+    먼저 온 요청이 끊겨도(cancel) 작업은 shield 로 보호되어 나머지 요청에 결과가 전달된다."""
+
+    def __init__(self):
+        self._inflight: Dict[Hashable, "asyncio.Task"] = {}
+        self.calls = 0
+        self.coalesced = 0
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+            task.add_done_callback(lambda _t: self._inflight.pop(key, None))
+            self.calls += 1
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(task)
+
+    def stats(self) -> Dict:
+        return {"inflight": len(self._inflight), "calls": self.calls, "coalesced": self.coalesced}
@@ -1,5 +1,11 @@
 # eval_rag.py
-import argparse, json, re, sys, csv
+# 정확도: python eval_rag.py --file data/eval_v2.jsonl --mode v2
+#         python eval_rag.py --file data/eval_v2.jsonl --mode v2 --inproc --workers 8 --alpha 0.4 0.6 0.8 --topk 2 4
+#         (--inproc: 서버 없이 app 을 import 해 병렬 평가, 검색 결과/LLM 출력은 .eval_cache/ 에 캐시해 스윕 시 재사용)
+# 부하:   python eval_rag.py --file data/eval_v2.jsonl --mode load --concurrency 16 --requests 400 --json-out load.json
+#         (--qps 20: 목표 QPS 로 일정 간격 발사, --mock-ollama: 가짜 Ollama + 서버를 직접 띄워 검색 스택만 측정,
+#          --compare 이전.json: 커밋 간 회귀 비교)
+import argparse, json, re, sys, csv, os, time, threading, subprocess, hashlib, asyncio
 import requests
 from pathlib import Path
 
@@ -15,52 +21,60 @@ def norm(s: str, ignore_tokens=None) -> str:
         t = t.replace(tok, "")
     return t
 
-def call_ask(api: str, query: str, top_k: int, timeout: int) -> str:
-    r = requests.post(api, json={"query": query, "top_k": top_k}, timeout=timeout)
+def call_ask(api: str, query: str, top_k: int, timeout: int, semantic_cache: bool = True):
+    """→ (answer, cache) / cache: 서버 캐시 적중 종류("exact"|"semantic"), 미적중이면 "" """
+    r = requests.post(api, json={"query": query, "top_k": top_k, "semantic_cache": semantic_cache},
+                      timeout=timeout)
     r.raise_for_status()
     data = r.json()
-    return data.get("answer", "")
+    return data.get("answer", ""), data.get("cache") or ""
 
-def eval_basic(api: str, path: Path, top_k: int, timeout: int, ignore_tokens):
+def print_cache_summary(rows, is_ok):
+    # 의미 캐시로 답한 문항 vs 나머지의 정확도 비교 (캐시가 정확도를 깎는지 확인)
+    sem = [r for r in rows if r["cache"] == "semantic"]
+    rest = [r for r in rows if r["cache"] != "semantic"]
+    acc = lambda rs: (sum(1 for r in rs if is_ok(r)) / len(rs)) if rs else 0.0
+    print(f"SemanticCacheHit = {len(sem)}/{len(rows)} = {(len(sem) / len(rows) if rows else 0.0):.2%}")
+    print(f"  acc(semantic hits) = {acc(sem):.2%}  acc(others) = {acc(rest):.2%}")
+
+def read_items(path: Path):
+    return [json.loads(l) for l in path.read_text(encoding="utf-8").splitlines() if l.strip()]
+
+def http_predictions(api: str, items, top_k: int, timeout: int, semantic_cache=True):
+    """서버 /ask 를 순서대로 호출 → (prediction, cache) 를 하나씩 (진행 중에도 결과가 찍히도록 generator)"""
+    for item in items:
+        try:
+            yield call_ask(api, item["query"], top_k, timeout, semantic_cache)
+        except Exception as e:
+            yield f"[ERROR] {e}", ""
+
+def eval_basic(items, preds, ignore_tokens):
     ok = 0; tot = 0
     rows = []
-    for line in path.read_text(encoding="utf-8").splitlines():
-        if not line.strip(): 
-            continue
-        item = json.loads(line)
+    for item, (pred, cache) in zip(items, preds):
         q = item["query"]; gold = item["answer_span"]
-        try:
-            pred = call_ask(api, q, top_k, timeout)
-        except Exception as e:
-            pred = f"[ERROR] {e}"
         tot += 1
         hit = norm(gold, ignore_tokens) in norm(pred, ignore_tokens)
-        rows.append({"query": q, "answer_span": gold, "prediction": pred, "status": "OK" if hit else "XX"})
+        rows.append({"query": q, "answer_span": gold, "prediction": pred, "status": "OK" if hit else "XX",
+                     "cache": cache})
         print(f"[{'OK' if hit else 'XX'}] Q={q} | want={gold} | got={pred[:80]}...")
         ok += 1 if hit else 0
 
     acc = ok / tot if tot else 0.0
     print(f"\n== BASIC RESULT ==")
     print(f"Exact-Substring@Ans = {ok}/{tot} = {acc:.2%}")
+    print_cache_summary(rows, lambda r: r["status"] == "OK")
     return rows, {"ok": ok, "tot": tot, "acc": acc}
 
-def eval_v2(api: str, path: Path, top_k: int, timeout: int, ignore_tokens):
+def eval_v2(items, preds, ignore_tokens):
     ok = 0; partial = 0; wrong = 0; tot = 0
     rows = []
-    for line in path.read_text(encoding="utf-8").splitlines():
-        if not line.strip():
-            continue
-        item = json.loads(line)
+    for item, (pred, cache) in zip(items, preds):
         q = item["query"]
         req_spans = item.get("required_spans", [])
         forb_spans = item.get("forbidden_spans", [])
         opt_spans  = item.get("optional_spans", [])
 
-        try:
-            pred = call_ask(api, q, top_k, timeout)
-        except Exception as e:
-            pred = f"[ERROR] {e}"
-
         P = norm(pred, ignore_tokens)
         req_hits = sum(1 for s in req_spans if norm(s, ignore_tokens) in P)
         forb_hits = sum(1 for s in forb_spans if norm(s, ignore_tokens) in P)
@@ -95,7 +109,8 @@ def eval_v2(api: str, path: Path, top_k: int, timeout: int, ignore_tokens):
             "req_hits": req_hits,
             "forb_hits": forb_hits,
             "opt_hits": opt_hits,
-            "label": label
+            "label": label,
+            "cache": cache
         })
         print(f"[{label}] Q={q} | req={req_hits}/{len(req_spans)} forb={forb_hits} opt={opt_hits} | pred={pred[:80]}...")
 
@@ -105,18 +120,320 @@ def eval_v2(api: str, path: Path, top_k: int, timeout: int, ignore_tokens):
     print(f"OK={ok}  PARTIAL={partial}  WRONG={wrong}  TOT={tot}")
     print(f"Strict@OK = {strict:.2%}")
     print(f"Blended(OK + 0.5*PARTIAL) = {blended:.2%}")
+    print_cache_summary(rows, lambda r: r["label"] == "OK")
     return rows, {"ok": ok, "partial": partial, "wrong": wrong, "tot": tot,
                   "strict": strict, "blended": blended}
 
+# ---------- 서버 없이 병렬 평가 (--inproc) ----------
+def cache_key(obj) -> str:
+    return hashlib.sha1(json.dumps(obj, ensure_ascii=False, sort_keys=True).encode("utf-8")).hexdigest()
+
+class JsonlCache:
+    """key → JSON 값. 파일 끝에 한 줄씩 추가해 실행 간에 누적된다 (enabled=False 면 읽지도 쓰지도 않음)"""
+
+    def __init__(self, path: Path, enabled: bool = True):
+        self.path = path
+        self.enabled = enabled
+        self.data = {}
+        self.hits = self.misses = 0
+        self._lock = threading.Lock()
+        if enabled and path.exists():
+            for line in path.read_text(encoding="utf-8").splitlines():
+                if line.strip():
+                    rec = json.loads(line)
+                    self.data[rec["key"]] = rec["value"]
+
+    def get(self, key: str):
+        with self._lock:
+            v = self.data.get(key) if self.enabled else None
+            if v is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return v
+
+    def put(self, key: str, value):
+        if not self.enabled:
+            return
+        with self._lock:
+            self.data[key] = value
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with self.path.open("a", encoding="utf-8") as f:
+                f.write(json.dumps({"key": key, "value": value}, ensure_ascii=False) + "\n")
+
+    def stats(self) -> str:
+        return f"hit={self.hits} miss={self.misses}"
+
+class InprocRunner:
+    """app 을 import 해서 HTTP 없이 검색 → 답변 (QA_STORE_DIR 의 스냅샷 사용).
+    workers 개 질의를 동시에 처리하고 (CPU 구간은 app.CPU_POOL, LLM 은 비동기), 단계별 결과를 캐시한다.
+    - 검색 결과(청크 id): 코퍼스 지문 + 정규화 질의 + top_k + alpha + 인덱스/모델 설정
+    - LLM 원문: 모델 + API + 지시문 + 옵션 + 프롬프트 → 검색 결과가 같은 설정끼리는 LLM 을 다시 부르지 않는다
+    서버의 답변/의미 캐시는 거치지 않는다."""
+
+    def __init__(self, workers: int, cache_dir: Path, use_cache: bool = True):
+        import app
+        self.app = app
+        self.workers = workers
+        app.EMB.get(); app.RERANK.get()
+        h = hashlib.sha1()
+        for c in app.DOCS:
+            h.update(f"{c.id}\t{c.hash}\n".encode("utf-8"))
+        self.corpus = h.hexdigest()
+        self.retrieval = JsonlCache(cache_dir / "retrieval.jsonl", use_cache)
+        self.llm = JsonlCache(cache_dir / "llm.jsonl", use_cache)
+
+    def retrieval_config(self, top_k: int, alpha: float) -> dict:
+        app, cfg = self.app, self.app.FAISS_INDEX.cfg
+        return {"corpus": self.corpus, "top_k": top_k, "alpha": alpha, "keyword": app.KEYWORD_ENGINE,
+                "index": [app.FAISS_INDEX.kind, app.FAISS_INDEX.storage, cfg.ef_search, cfg.nprobe, cfg.rescore],
+                "models": [app.EMB_MODEL_NAME, app.RERANKER_NAME, app.MODEL_BACKEND]}
+
+    async def generate(self, prompt: str, options: dict) -> str:
+        # num_thread 는 결과와 무관하므로 키에서 뺀다
+        key = cache_key({"model": self.app.OLLAMA_MODEL, "api": self.app.LLM_API, "system": self.app.LLM_SYS_PROMPT,
+                         "prompt": prompt, "options": {k: v for k, v in options.items() if k != "num_thread"}})
+        raw = self.llm.get(key)
+        if raw is None:
+            raw = await self.app.llm_generate(prompt, options)   # 실패는 캐시하지 않음 (app 이 추출요약으로 폴백)
+            self.llm.put(key, raw)
+        return raw
+
+    async def answer(self, query: str, top_k: int, alpha: float) -> str:
+        app = self.app
+        qn = app.normalize_query_kor(query)
+        rkey = cache_key(dict(self.retrieval_config(top_k, alpha), query=qn))
+        ids = self.retrieval.get(rkey)
+        if ids is None:
+            contexts = await app.run_cpu(app.retrieve_contexts, qn, top_k, app.pin_view(), alpha)
+            self.retrieval.put(rkey, [c.id for c in contexts])
+        else:
+            contexts = [c for c in (app.DOCS.get(i) for i in ids) if c is not None]
+        resp = await app.generate_answer(query, contexts, self.generate)
+        return resp["answer"]
+
+    def predictions(self, items, top_k: int, alpha: float):
+        async def run():
+            sem = asyncio.Semaphore(self.workers)
+
+            async def one(q):
+                async with sem:
+                    try:
+                        return await self.answer(q, top_k, alpha), ""
+                    except Exception as e:
+                        return f"[ERROR] {e}", ""
+            try:
+                return await asyncio.gather(*(one(item["query"]) for item in items))
+            finally:
+                await self.app.OLLAMA.aclose()   # httpx 클라이언트는 이벤트 루프마다 새로
+        return asyncio.run(run())
+
+# ---------- 부하 테스트 (--mode load) ----------
+def load_queries(path: Path):
+    return [json.loads(l)["query"] for l in path.read_text(encoding="utf-8").splitlines() if l.strip()]
+
+def percentile(xs, p):
+    xs = sorted(xs)
+    if not xs:
+        return 0.0
+    return xs[min(len(xs) - 1, int(round(p / 100.0 * (len(xs) - 1))))]
+
+def run_load(api: str, queries, n_requests: int, concurrency: int, qps: float, top_k: int, timeout: int,
+             semantic_cache=True, unique=False, deadline_ms=None):
+    """eval 질의를 순환하며 n_requests 번 /ask 호출.
+    qps=0: concurrency 개 스레드가 쉬지 않고 보냄 (closed loop, 최대 처리량)
+    qps>0: i 번째 요청을 t0 + i/qps 에 발사 (open loop). 지연은 예정 시각부터 재므로 서버가 밀리면 대기 시간도 포함된다.
+    unique: 질의 끝에 요청 번호를 붙여 답변 캐시/동일 질문 합치기를 피한다 (매 요청이 검색 + LLM 을 거침)
+    deadline_ms: 요청별 지연 예산 (넘기면 서버가 추출요약으로 답함, 답변 출처별 개수는 "source")"""
+    lock = threading.Lock()
+    nxt = [0]
+    results = []   # (latency_s, error 또는 None, cache, source)
+    t0 = time.perf_counter()
+
+    def worker():
+        sess = requests.Session()
+        while True:
+            with lock:
+                i = nxt[0]
+                if i >= n_requests:
+                    return
+                nxt[0] += 1
+            start = time.perf_counter()
+            if qps > 0:
+                start = t0 + i / qps
+                wait = start - time.perf_counter()
+                if wait > 0:
+                    time.sleep(wait)
+            err, cache, source = None, "", ""
+            try:
+                q = queries[i % len(queries)]
+                if unique:
+                    q = f"{q} #{i}"
+                body = {"query": q, "top_k": top_k, "semantic_cache": semantic_cache}
+                if deadline_ms is not None:
+                    body["deadline_ms"] = deadline_ms
+                r = sess.post(api, json=body, timeout=timeout)
+                if r.status_code != 200:
+                    err = f"HTTP {r.status_code}"
+                else:
+                    data = r.json()
+                    cache = data.get("cache") or ""
+                    source = data.get("fallback") or data.get("source") or ""
+            except requests.RequestException as e:
+                err = type(e).__name__
+            lat = time.perf_counter() - start
+            with lock:
+                results.append((lat, err, cache, source))
+
+    threads = [threading.Thread(target=worker, daemon=True) for _ in range(concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - t0
+
+    ok_lats = [lat for lat, err, _, _ in results if err is None]
+    errors = {}
+    for _, err, _, _ in results:
+        if err is not None:
+            errors[err] = errors.get(err, 0) + 1
+    caches, sources = {}, {}
+    for _, err, cache, source in results:
+        if err is None:
+            caches[cache or "miss"] = caches.get(cache or "miss", 0) + 1
+            sources[source or "?"] = sources.get(source or "?", 0) + 1
+    ms = lambda x: round(x * 1e3, 1)
+    return {
+        "requests": len(results), "ok": len(ok_lats), "errors": sum(errors.values()), "error_types": errors,
+        "wall_s": round(wall, 3), "throughput_rps": round(len(ok_lats) / wall, 2) if wall else 0.0,
+        "latency_ms": {"p50": ms(percentile(ok_lats, 50)), "p95": ms(percentile(ok_lats, 95)),
+                       "p99": ms(percentile(ok_lats, 99)), "mean": ms(sum(ok_lats) / len(ok_lats)) if ok_lats else 0.0,
+                       "max": ms(max(ok_lats, default=0.0))},
+        "cache": caches,
+        "source": sources,   # llm | extractive(LLM 끔) | timeout | error | invalid(추출요약으로 대체) | none
+    }
+
+def git_rev() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              timeout=5).stdout.strip()
+    except Exception:
+        return ""
+
+def wait_http(url: str, timeout: float, ok_codes=(200,)):
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        try:
+            if requests.get(url, timeout=1).status_code in ok_codes:
+                return
+        except requests.RequestException:
+            pass
+        time.sleep(0.2)
+    raise TimeoutError(f"timeout waiting for {url}")
+
+def start_mock_stack(port: int, mock_port: int, latency_ms: float, timeout: float):
+    """mock_ollama(고정 지연) + 그걸 바라보는 app 서버를 띄운다 → (api url, 프로세스 목록)
+    LLM 지연을 고정해 검색/리랭크/서버 스택의 변화만 보이게 한다."""
+    env = dict(os.environ, MOCK_LATENCY_MS=str(latency_ms), OLLAMA_URL=f"http://127.0.0.1:{mock_port}")
+    procs = [subprocess.Popen([sys.executable, "-m", "uvicorn", "mock_ollama:app", "--port", str(mock_port)],
+                              env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)]
+    procs.append(subprocess.Popen([sys.executable, "-m", "uvicorn", "app:app", "--port", str(port)],
+                                  env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL))
+    base = f"http://127.0.0.1:{port}"
+    try:
+        wait_http(f"http://127.0.0.1:{mock_port}/stats", timeout)
+        wait_http(f"{base}/health/ready", timeout)
+    except Exception:
+        stop_procs(procs)
+        raise
+    return f"{base}/ask", procs
+
+def stop_procs(procs):
+    for p in procs:
+        p.terminate()
+    for p in procs:
+        try:
+            p.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            p.kill()
+
+def print_load_report(report, prev=None):
+    lat = report["latency_ms"]
+    print(f"\n== LOAD RESULT ({report['config']['label']}) ==")
+    print(f"requests={report['requests']}  ok={report['ok']}  errors={report['errors']} {report['error_types'] or ''}")
+    print(f"throughput = {report['throughput_rps']} req/s  (wall {report['wall_s']}s)")
+    print(f"latency ms: p50={lat['p50']}  p95={lat['p95']}  p99={lat['p99']}  mean={lat['mean']}  max={lat['max']}")
+    print(f"cache: {report['cache']}")
+    print(f"answer source: {report.get('source', {})}")
+    if prev:
+        # 이전 결과 대비 변화율 (+ 는 느려짐/증가)
+        def delta(cur, old):
+            return f"{(cur - old) / old:+.1%}" if old else "n/a"
+        plat = prev["latency_ms"]
+        print(f"vs {prev.get('git') or '?'}: throughput {delta(report['throughput_rps'], prev['throughput_rps'])}, "
+              f"p50 {delta(lat['p50'], plat['p50'])}, p95 {delta(lat['p95'], plat['p95'])}, "
+              f"p99 {delta(lat['p99'], plat['p99'])}, errors {prev['errors']} → {report['errors']}")
+
+def eval_load(args, path: Path):
+    queries = load_queries(path)
+    n = args.requests or len(queries)
+    procs = []
+    api = args.api
+    if args.mock_ollama:
+        api, procs = start_mock_stack(args.port, args.mock_port, args.mock_latency_ms, args.startup_timeout)
+    try:
+        if args.warmup:
+            run_load(api, queries, args.warmup, args.concurrency, 0, args.topk[0], args.timeout,
+                     not args.no_semantic_cache, args.unique, args.deadline_ms)
+        report = run_load(api, queries, n, args.concurrency, args.qps, args.topk[0], args.timeout,
+                          not args.no_semantic_cache, args.unique, args.deadline_ms)
+    finally:
+        stop_procs(procs)
+    label = f"qps={args.qps}" if args.qps > 0 else f"concurrency={args.concurrency}"
+    report = {"git": git_rev(), "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+              "config": {"label": label, "file": str(path), "requests": n, "concurrency": args.concurrency,
+                         "qps": args.qps, "top_k": args.topk[0], "warmup": args.warmup,
+                         "semantic_cache": not args.no_semantic_cache, "unique": args.unique,
+                         "deadline_ms": args.deadline_ms,
+                         "mock_ollama_ms": args.mock_latency_ms if args.mock_ollama else None},
+              **report}
+    prev = json.loads(Path(args.compare).read_text(encoding="utf-8")) if args.compare else None
+    print_load_report(report, prev)
+    Path(args.json_out).write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+    print(f"\nSaved load report → {args.json_out}")
+
 def main():
     ap = argparse.ArgumentParser()
     ap.add_argument("--api", default="http://127.0.0.1:8000/ask")
     ap.add_argument("--file", required=True, help="data/eval.jsonl or data/eval_v2.jsonl")
-    ap.add_argument("--mode", choices=["basic","v2"], required=True)
-    ap.add_argument("--topk", type=int, default=4)
+    ap.add_argument("--mode", choices=["basic","v2","load"], required=True)
+    ap.add_argument("--topk", type=int, nargs="+", default=[4], help="여러 개면 값마다 평가 (스윕)")
     ap.add_argument("--timeout", type=int, default=30)
     ap.add_argument("--ignore", nargs="*", default=["영업"])  # '영업일' vs '일' 표현 차이를 줄이기
     ap.add_argument("--out", default="eval_report.csv")
+    ap.add_argument("--no-semantic-cache", action="store_true",
+                    help="서버 의미 캐시 조회 끄기 (켠 결과와 정확도 비교용)")
+    # --inproc (basic / v2)
+    ap.add_argument("--inproc", action="store_true", help="서버 없이 app 을 import 해 병렬 평가 (QA_STORE_DIR 스냅샷)")
+    ap.add_argument("--workers", type=int, default=8, help="--inproc 동시 처리 질의 수")
+    ap.add_argument("--alpha", type=float, nargs="+", default=[0.6], help="하이브리드 벡터 가중치 (--inproc 전용, 스윕 가능)")
+    ap.add_argument("--cache-dir", default=".eval_cache", help="--inproc 검색/LLM 결과 캐시 디렉터리")
+    ap.add_argument("--no-eval-cache", action="store_true", help="--inproc 캐시를 읽지도 쓰지도 않음")
+    # --mode load
+    ap.add_argument("--concurrency", type=int, default=8, help="동시 요청 스레드 수")
+    ap.add_argument("--qps", type=float, default=0.0, help="목표 QPS (0=closed loop, concurrency 만큼 최대한)")
+    ap.add_argument("--requests", type=int, default=0, help="총 요청 수 (0=eval 질의 수, 부족하면 순환)")
+    ap.add_argument("--warmup", type=int, default=0, help="측정 전 버리는 요청 수")
+    ap.add_argument("--unique", action="store_true", help="질의마다 요청 번호를 붙여 답변 캐시 적중을 피함")
+    ap.add_argument("--deadline-ms", type=int, default=None, help="요청별 지연 예산 (AskReq.deadline_ms)")
+    ap.add_argument("--json-out", default="load_report.json")
+    ap.add_argument("--compare", default="", help="이전 load 결과 JSON (변화율 출력)")
+    ap.add_argument("--mock-ollama", action="store_true",
+                    help="mock_ollama + app 서버를 직접 띄워 측정 (--api 무시, LLM 지연 고정)")
+    ap.add_argument("--mock-latency-ms", type=float, default=500.0)
+    ap.add_argument("--port", type=int, default=8010, help="--mock-ollama 시 app 서버 포트")
+    ap.add_argument("--mock-port", type=int, default=11435)
+    ap.add_argument("--startup-timeout", type=float, default=600.0)
     args = ap.parse_args()
 
     path = Path(args.file)
@@ -124,18 +441,49 @@ def main():
         print(f"File not found: {path}")
         sys.exit(1)
 
-    if args.mode == "basic":
-        rows, metrics = eval_basic(args.api, path, args.topk, args.timeout, args.ignore)
-    else:
-        rows, metrics = eval_v2(args.api, path, args.topk, args.timeout, args.ignore)
-
-    # CSV 저장
-    with open(args.out, "w", newline="", encoding="utf-8-sig") as f:
-        writer = csv.DictWriter(f, fieldnames=list(rows[0].keys()) if rows else [])
-        if rows:
-            writer.writeheader()
-            writer.writerows(rows)
-    print(f"\nSaved report → {args.out}")
+    if args.mode == "load":
+        eval_load(args, path)
+        return
+    if not args.inproc and args.alpha != [0.6]:
+        ap.error("--alpha 는 --inproc 에서만 (서버는 기본값 0.6 사용)")
+
+    items = read_items(path)
+    runner = InprocRunner(args.workers, Path(args.cache_dir), not args.no_eval_cache) if args.inproc else None
+    configs = [(k, a) for a in args.alpha for k in args.topk]
+    summary = []
+    for top_k, alpha in configs:
+        t0 = time.perf_counter()
+        if runner is not None:
+            print(f"\n### top_k={top_k} alpha={alpha} (inproc, workers={args.workers})")
+            preds = runner.predictions(items, top_k, alpha)
+        else:
+            preds = http_predictions(args.api, items, top_k, args.timeout, not args.no_semantic_cache)
+        if args.mode == "basic":
+            rows, metrics = eval_basic(items, preds, args.ignore)
+        else:
+            rows, metrics = eval_v2(items, preds, args.ignore)
+        wall = time.perf_counter() - t0
+
+        # CSV 저장 (스윕이면 설정별 파일)
+        out = Path(args.out)
+        if len(configs) > 1:
+            out = out.with_name(f"{out.stem}.k{top_k}.a{alpha}{out.suffix}")
+        with open(out, "w", newline="", encoding="utf-8-sig") as f:
+            writer = csv.DictWriter(f, fieldnames=list(rows[0].keys()) if rows else [])
+            if rows:
+                writer.writeheader()
+                writer.writerows(rows)
+        print(f"\nSaved report → {out}  ({wall:.1f}s)")
+        if runner is not None:
+            print(f"eval cache: retrieval {runner.retrieval.stats()}, llm {runner.llm.stats()}")
+        summary.append((top_k, alpha, metrics, wall))
+
+    if len(configs) > 1:
+        print("\n== SWEEP ==")
+        for top_k, alpha, metrics, wall in summary:
+            main_metric = f"acc={metrics['acc']:.2%}" if args.mode == "basic" else \
+                f"strict={metrics['strict']:.2%} blended={metrics['blended']:.2%}"
+            print(f"top_k={top_k} alpha={alpha}: {main_metric}  ({wall:.1f}s)")
 
 if __name__ == "__main__":
     main()
@@ -1,20 +1,52 @@
+import json
+import threading
 import tkinter as tk
 import requests
 
 API = "http://127.0.0.1:8000"
 
+def show(text):
+    output.delete("1.0","end")
+    output.insert("end", text)
+
+def append(text):
+    output.insert("end", text)
+    output.see("end")
+
+def stream_ask(q):
+    # /ask_stream (SSE): contexts → token... → final 순서로 도착하는 이벤트를 바로바로 그린다
+    try:
+        with requests.post(f"{API}/ask_stream", json={"query": q, "top_k": 3}, stream=True, timeout=300) as r:
+            r.raise_for_status()
+            event = None
+            for line in r.iter_lines(decode_unicode=True):
+                if not line:
+                    continue
+                if line.startswith("event:"):
+                    event = line[6:].strip()
+                    continue
+                if not line.startswith("data:"):
+                    continue
+                data = json.loads(line[5:].strip())
+                if event == "contexts":
+                    refs = ", ".join(f"{c['title']}#{c['chunk_idx']}" for c in data.get("contexts", []))
+                    root.after(0, show, f"[근거] {refs or '(없음)'}\n\n생성 중...\n")
+                elif event == "token":
+                    root.after(0, append, data.get("text", ""))
+                elif event == "final":
+                    root.after(0, show, data.get("answer") or "(no answer)")
+    except Exception as e:
+        root.after(0, show, f"에러: {e}")
+    finally:
+        root.after(0, lambda: btn.config(state="normal"))
+
 def ask():
     q = entry.get("1.0","end").strip()
     if not q:
         return
-    try:
-        r = requests.post(f"{API}/ask", json={"query": q, "top_k": 3})
-        data = r.json()
-        output.delete("1.0","end")
-        output.insert("end", data.get("answer","(no answer)"))
-    except Exception as e:
-        output.delete("1.0","end")
-        output.insert("end", f"에러: {e}")
+    btn.config(state="disabled")
+    show("검색 중...")
+    threading.Thread(target=stream_ask, args=(q,), daemon=True).start()
 
 root = tk.Tk()
 root.title("메뉴얼 QA (Beginner)")
@@ -0,0 +1,212 @@
+# infer.py — 공유 모델 추론 프로세스 (bge-m3 임베딩 + bge 리랭커)
+# 실행: python infer.py --addr /tmp/qa_infer.sock        (Windows 등 AF_UNIX 가 없으면 --addr 127.0.0.1:7100)
+#       QA_INFER_ADDR=/tmp/qa_infer.sock python -m uvicorn app:app --workers 4
+# 모델은 이 프로세스에만 1벌 올리고, 웹 워커들은 로컬 IPC(multiprocessing.connection)로 encode / compute_score 를 요청한다.
+# 여러 워커에서 동시에 온 요청은 MicroBatcher 로 모아 한 번의 forward 로 처리한다 (이 모드에서 웹 워커는 따로 모으지 않음).
+
+import os, sys, time, logging, argparse, threading
+from multiprocessing.connection import Listener, Client, Connection
+from typing import Any, Dict, List, Optional, Tuple, Union
+import numpy as np
+
+from models import ModelSlot, MicroBatcher, MODEL_BACKEND, load_embedding_model, load_reranker
+
+log = logging.getLogger("qa.infer")
+
+AUTHKEY = os.environ.get("QA_INFER_KEY", "qa-infer").encode("utf-8")
+READY_TIMEOUT = float(os.environ.get("QA_INFER_READY_TIMEOUT", "600"))
+
+
+def parse_addr(addr: str) -> Union[str, Tuple[str, int]]:
+    """'host:port' → TCP, 그 외 → unix socket 경로"""
+    host, sep, port = addr.rpartition(":")
+    if sep and port.isdigit() and "/" not in addr:
+        return host or "127.0.0.1", int(port)
+    return addr
+
+
+# ---------- 서버 ----------
+class InferServer:
+    def __init__(self, emb_name: str, reranker_name: str, dim: int,
+                 window_ms: float = 5.0, max_texts: int = 64, max_pairs: int = 128,
+                 backend: str = MODEL_BACKEND):
+        self.backend = backend
+        self.emb = ModelSlot(emb_name, lambda: load_embedding_model(emb_name, dim, backend),
+                             warmup=lambda m: m.encode(["query: 워밍업"], normalize_embeddings=True))
+        self.rerank = ModelSlot(reranker_name, lambda: load_reranker(reranker_name, backend),
+                                warmup=lambda m: m.compute_score([["워밍업", "워밍업 문장입니다."]]))
+        # 요청 1개 = (텍스트/쌍 목록, batch_size). 워커 간 요청을 이어 붙여 한 번에 추론한 뒤 요청별로 나눈다
+        self.encode_batcher = MicroBatcher("encode", self._encode_batch, max_items=max_texts,
+                                           window_ms=window_ms, size_fn=lambda r: len(r[0]))
+        self.score_batcher = MicroBatcher("score", self._score_batch, max_items=max_pairs,
+                                          window_ms=window_ms, size_fn=lambda r: len(r[0]))
+        self.connections = 0
+        self.requests = 0
+
+    @staticmethod
+    def _by_batch_size(reqs: List[Tuple[List, int]], run) -> List:
+        """batch_size 가 같은 요청끼리 이어 붙여 run(flat, batch_size) 1회 → 요청별로 다시 분할
+        (대개 한 그룹: 질의는 기본값, ingest 는 QA_EMB_BATCH_SIZE)"""
+        out: List = [None] * len(reqs)
+        groups: Dict[int, List[int]] = {}
+        for i, (_, bs) in enumerate(reqs):
+            groups.setdefault(bs, []).append(i)
+        for bs, idx in groups.items():
+            res = run([x for i in idx for x in reqs[i][0]], bs)
+            pos = 0
+            for i in idx:
+                n = len(reqs[i][0])
+                out[i] = res[pos:pos + n]
+                pos += n
+        return out
+
+    def _encode_batch(self, reqs: List[Tuple[List[str], int]]) -> List[np.ndarray]:
+        return self._by_batch_size(reqs, lambda flat, bs: self.emb.get().encode(
+            flat, batch_size=bs, normalize_embeddings=True).astype("float32"))
+
+    def _score(self, flat: List[List[str]], batch_size: int) -> List[float]:
+        scores = self.rerank.get().compute_score(flat, batch_size=batch_size)
+        return scores if isinstance(scores, list) else [scores]   # 쌍이 1개면 float 반환
+
+    def _score_batch(self, reqs: List[Tuple[List[List[str]], int]]) -> List[List[float]]:
+        return self._by_batch_size(reqs, self._score)
+
+    def status(self) -> Dict:
+        return {"models": {s.name: s.status() for s in (self.emb, self.rerank)}, "backend": self.backend,
+                "ready": self.emb.ready and self.rerank.ready,
+                "connections": self.connections, "requests": self.requests,
+                "batching": {"encode": self.encode_batcher.stats(), "score": self.score_batcher.stats()}}
+
+    def handle(self, op: str, args: Tuple) -> Any:
+        # args = (목록, batch_size) — batch_size 가 없으면 (이전 클라이언트) 32
+        if op == "encode":
+            return (self.encode_batcher((list(args[0]), int(args[1]) if len(args) > 1 else 32))
+                    if args[0] else np.zeros((0, 0), dtype="float32"))
+        if op == "score":
+            return (self.score_batcher(([list(p) for p in args[0]], int(args[1]) if len(args) > 1 else 32))
+                    if args[0] else [])
+        if op == "dim":
+            return self.emb.get().get_sentence_embedding_dimension()
+        if op == "ready":
+            # 두 모델이 로드 + 워밍업될 때까지 기다린 뒤 상태 반환
+            self.emb.get(READY_TIMEOUT)
+            self.rerank.get(READY_TIMEOUT)
+            return self.status()
+        if op == "status":
+            return self.status()
+        raise ValueError(f"unknown op: {op}")
+
+    def _serve_conn(self, conn: Connection):
+        self.connections += 1
+        try:
+            while True:
+                try:
+                    op, args = conn.recv()
+                except (EOFError, OSError):
+                    return
+                self.requests += 1
+                try:
+                    conn.send(("ok", self.handle(op, args)))
+                except Exception as e:
+                    log.exception(f"infer {op} failed")
+                    conn.send(("err", f"{type(e).__name__}: {e}"))
+        finally:
+            self.connections -= 1
+            conn.close()
+
+    def serve_forever(self, addr: str):
+        for slot in (self.emb, self.rerank):
+            slot.start(background=True)
+        address = parse_addr(addr)
+        if isinstance(address, str) and os.path.exists(address):
+            os.remove(address)   # 이전 실행이 남긴 소켓 파일
+        with Listener(address, backlog=64, authkey=AUTHKEY) as listener:
+            log.info(f"infer: listening on {addr}")
+            while True:
+                try:
+                    conn = listener.accept()
+                except Exception as e:   # 인증 실패 등은 그 연결만 버린다
+                    log.warning(f"infer: accept failed: {e}")
+                    continue
+                threading.Thread(target=self._serve_conn, args=(conn,), name="infer-conn", daemon=True).start()
+
+
+# ---------- 클라이언트 (웹 워커) ----------
+class InferClient:
+    """스레드마다 연결 1개 (Connection 은 thread-safe 가 아님). 끊기면 다음 호출에서 다시 연결."""
+
+    def __init__(self, addr: str, connect_timeout: float = 30.0):
+        self.addr = addr
+        self.connect_timeout = connect_timeout
+        self._local = threading.local()
+
+    def _conn(self) -> Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            deadline = time.monotonic() + self.connect_timeout
+            while True:
+                try:
+                    conn = Client(parse_addr(self.addr), authkey=AUTHKEY)
+                    break
+                except (ConnectionRefusedError, FileNotFoundError):
+                    # 추론 프로세스가 아직 바인딩 전
+                    if time.monotonic() > deadline:
+                        raise
+                    time.sleep(0.2)
+            self._local.conn = conn
+        return conn
+
+    def call(self, op: str, *args) -> Any:
+        conn = self._conn()
+        try:
+            conn.send((op, args))
+            status, value = conn.recv()
+        except (EOFError, OSError):
+            self._local.conn = None
+            raise
+        if status != "ok":
+            raise RuntimeError(f"infer {op}: {value}")
+        return value
+
+
+class RemoteEmbedder:
+    """SentenceTransformer.encode 와 같은 모양으로 추론 프로세스를 호출 (ModelSlot 에 그대로 넣는다)"""
+
+    def __init__(self, client: InferClient):
+        self.client = client
+
+    def encode(self, texts: List[str], batch_size: int = 32, normalize_embeddings: bool = True) -> np.ndarray:
+        # 서버는 항상 정규화된 벡터를 돌려준다 (이 저장소는 normalize_embeddings=True 만 쓴다)
+        return self.client.call("encode", list(texts), batch_size)
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.client.call("dim")
+
+
+class RemoteReranker:
+    """FlagReranker.compute_score 와 같은 모양 (쌍이 1개면 float)"""
+
+    def __init__(self, client: InferClient):
+        self.client = client
+
+    def compute_score(self, pairs: List[List[str]], batch_size: int = 32):
+        scores = self.client.call("score", [list(p) for p in pairs], batch_size)
+        return scores[0] if len(scores) == 1 else scores
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--addr", default=os.environ.get("QA_INFER_ADDR", "/tmp/qa_infer.sock"))
+    ap.add_argument("--emb-model", default="BAAI/bge-m3")
+    ap.add_argument("--reranker", default="BAAI/bge-reranker-base")
+    ap.add_argument("--dim", type=int, default=int(os.environ.get("EMB_DIM", "1024")))
+    ap.add_argument("--backend", choices=["torch", "onnx"], default=MODEL_BACKEND)
+    ap.add_argument("--window-ms", type=float, default=float(os.environ.get("QA_BATCH_WINDOW_MS", "5")))
+    args = ap.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    InferServer(args.emb_model, args.reranker, args.dim, window_ms=args.window_ms,
+                backend=args.backend).serve_forever(args.addr)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,97 @@
+# jobs.py — 백그라운드 작업 큐 (대량 ingest 등)
+# 요청은 job id 만 받고 바로 반환, 실제 작업은 단일 워커 스레드에서 순서대로 실행한다.
+# 진행 상황은 Job 필드를 핸들러가 갱신하고 /jobs/{id} 에서 조회한다.
+
+import time, uuid, queue, logging, threading
+from collections import OrderedDict
+from typing import Callable, Optional, Any, Dict, List
+
+log = logging.getLogger("qa.jobs")
+
+
+class Job:
+    """작업 1개. state: queued → running → done | error"""
+
+    def __init__(self, kind: str, payload: Any):
+        self.id = uuid.uuid4().hex[:12]
+        self.kind = kind
+        self.payload = payload
+        self.state = "queued"
+        self.error: Optional[str] = None
+        self.progress: Dict[str, Any] = {}
+        self.created = time.time()
+        self.started: Optional[float] = None
+        self.finished: Optional[float] = None
+
+    def status(self) -> Dict:
+        elapsed = None
+        if self.started is not None:
+            elapsed = round((self.finished or time.time()) - self.started, 3)
+        return {"id": self.id, "kind": self.kind, "state": self.state, "error": self.error,
+                "progress": dict(self.progress), "created": self.created,
+                "started": self.started, "finished": self.finished, "elapsed_seconds": elapsed}
+
+
+class JobQueue:
+    """handler(job) 를 워커 스레드 1개에서 순서대로 실행. 끝난 작업은 최근 keep 개만 보관."""
+
+    def __init__(self, name: str, handler: Callable[[Job], None], keep: int = 100):
+        self.name = name
+        self.handler = handler
+        self.keep = keep
+        self._q: "queue.Queue[Job]" = queue.Queue()
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._worker: Optional[threading.Thread] = None
+
+    def _ensure_worker(self):
+        with self._lock:
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, name=f"jobs-{self.name}", daemon=True)
+                self._worker.start()
+
+    def submit(self, kind: str, payload: Any) -> Job:
+        job = Job(kind, payload)
+        with self._lock:
+            self._jobs[job.id] = job
+            self._trim()
+        self._ensure_worker()
+        self._q.put(job)
+        return job
+
+    def _trim(self):
+        # 대기/실행 중인 작업은 지우지 않는다
+        finished = [j.id for j in self._jobs.values() if j.state in ("done", "error")]
+        for jid in finished[:max(0, len(self._jobs) - self.keep)]:
+            del self._jobs[jid]
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def list(self) -> List[Job]:
+        with self._lock:
+            return list(self._jobs.values())
+
+    def _run(self):
+        while True:
+            job = self._q.get()
+            job.state = "running"
+            job.started = time.time()
+            try:
+                self.handler(job)
+                job.state = "done"
+            except Exception as e:
+                job.error = f"{type(e).__name__}: {e}"
+                job.state = "error"
+                log.exception(f"job {job.id} ({job.kind}) failed")
+            finally:
+                job.finished = time.time()
+                job.payload = None   # 끝난 작업의 입력(업로드 임시 파일 목록 등)은 놓아준다
+
+    def stats(self) -> Dict:
+        with self._lock:
+            states: Dict[str, int] = {}
+            for j in self._jobs.values():
+                states[j.state] = states.get(j.state, 0) + 1
+        return {"queued": self._q.qsize(), "jobs": states}
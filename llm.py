@@ -0,0 +1,110 @@
+# llm.py — Ollama 비동기 클라이언트 (keep-alive 커넥션 풀 재사용)
+# 요청마다 새 TCP 연결을 맺지 않고, 느린 LLM 응답을 기다리는 동안에도 워커 스레드를 점유하지 않는다.
+# chat(): 고정 지시문은 system 메시지로 보낸다. Ollama 는 슬롯에 남은 직전 요청과 토큰 프리픽스가 같은 만큼
+# KV 캐시를 재사용하므로 (keep_alive 동안 모델이 내려가지 않아야 함), 지시문이 매번 같은 토큰으로 맨 앞에 오면
+# 요청마다 prompt eval 하는 토큰은 질문 + 근거뿐이다.
+
+import os, json, logging
+from typing import AsyncIterator, Callable, Dict, List, Optional
+import httpx
+
+log = logging.getLogger("qa.llm")
+
+# 응답 마지막(done) 메시지의 시간/토큰 필드 (시간은 ns)
+STAT_FIELDS = ("prompt_eval_count", "prompt_eval_duration", "eval_count", "eval_duration",
+               "load_duration", "total_duration")
+
+
+class OllamaClient:
+    def __init__(self, base_url: str, model: str, timeout: float,
+                 max_connections: int = int(os.environ.get("OLLAMA_MAX_CONNECTIONS", "16")),
+                 on_stats: Optional[Callable[[Dict], None]] = None):
+        self.base_url = base_url.rstrip("/")
+        self.model = model
+        self.timeout = timeout
+        self.max_connections = max_connections
+        self.on_stats = on_stats   # 호출마다 Ollama 가 보고한 STAT_FIELDS (요청 컨텍스트 안에서 호출됨)
+        self._client: Optional[httpx.AsyncClient] = None
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        # 이벤트 루프 안에서 처음 쓸 때 생성 (루프에 바인딩됨)
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                timeout=httpx.Timeout(self.timeout, connect=10.0),
+                limits=httpx.Limits(max_connections=self.max_connections,
+                                    max_keepalive_connections=self.max_connections,
+                                    keepalive_expiry=300.0),
+            )
+        return self._client
+
+    def _report(self, msg: Dict):
+        if self.on_stats is not None:
+            stats = {k: msg[k] for k in STAT_FIELDS if k in msg}
+            if stats:
+                self.on_stats(stats)
+
+    @staticmethod
+    def _messages(system: str, user: str) -> List[Dict]:
+        return [{"role": "system", "content": system}, {"role": "user", "content": user}]
+
+    async def generate(self, prompt: str, options: Dict, keep_alive: str = "1h") -> str:
+        """/api/generate (stream=False) → response 텍스트"""
+        r = await self.client.post("/api/generate", json={
+            "model": self.model,
+            "prompt": prompt,
+            "stream": False,
+            "keep_alive": keep_alive,
+            "options": options,
+        })
+        r.raise_for_status()
+        msg = r.json()
+        self._report(msg)
+        return msg.get("response", "")
+
+    async def chat(self, system: str, user: str, options: Dict, keep_alive: str = "1h") -> str:
+        """/api/chat (stream=False), system + user 메시지 1개씩 → 답변 텍스트"""
+        r = await self.client.post("/api/chat", json={
+            "model": self.model,
+            "messages": self._messages(system, user),
+            "stream": False,
+            "keep_alive": keep_alive,
+            "options": options,
+        })
+        r.raise_for_status()
+        msg = r.json()
+        self._report(msg)
+        return (msg.get("message") or {}).get("content", "")
+
+    async def _stream(self, path: str, body: Dict, piece: Callable[[Dict], str]) -> AsyncIterator[str]:
+        # NDJSON 한 줄 = 조각 1개, 마지막 줄(done)에 통계
+        async with self.client.stream("POST", path, json=body) as r:
+            r.raise_for_status()
+            async for line in r.aiter_lines():
+                if not line.strip():
+                    continue
+                msg = json.loads(line)
+                text = piece(msg)
+                if text:
+                    yield text
+                if msg.get("done"):
+                    self._report(msg)
+                    break
+
+    def generate_stream(self, prompt: str, options: Dict, keep_alive: str = "1h") -> AsyncIterator[str]:
+        """/api/generate (stream=True) → 토큰 조각을 순서대로 yield"""
+        return self._stream("/api/generate", {"model": self.model, "prompt": prompt, "stream": True,
+                                              "keep_alive": keep_alive, "options": options},
+                            lambda m: m.get("response", ""))
+
+    def chat_stream(self, system: str, user: str, options: Dict, keep_alive: str = "1h") -> AsyncIterator[str]:
+        """/api/chat (stream=True) → 토큰 조각을 순서대로 yield"""
+        return self._stream("/api/chat", {"model": self.model, "messages": self._messages(system, user),
+                                          "stream": True, "keep_alive": keep_alive, "options": options},
+                            lambda m: (m.get("message") or {}).get("content", ""))
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
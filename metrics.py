@@ -0,0 +1,172 @@
+# metrics.py — 구간별 타이머 + Prometheus 텍스트 포맷 노출 (/metrics)
+# 외부 의존성 없이 counter / gauge(콜백) / histogram 만 구현한다 (prometheus_client 와 같은 출력 형식).
+# 구간 타이머:
+#   with stage("rerank"): ...          또는   @timed("search_vector")
+#   → qa_stage_seconds{stage="rerank"} 히스토그램에 기록 + 요청별 breakdown(start_request() 로 시작)에 누적
+#   이미 잰 시간은 record("llm.prompt_eval", seconds)
+# 요청별 breakdown 은 contextvars 로 전달되므로 스레드풀에서 실행할 때는 copy_context().run 으로 넘긴다 (app.run_cpu).
+
+import time, threading, functools, contextvars
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+# 초 단위 지연 버킷 (1ms ~ 30s)
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+REGISTRY: List["_Metric"] = []
+
+
+def _fmt_labels(names: Sequence[str], values: Tuple, extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(zip(names, values))
+    if extra is not None:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    esc = lambda v: str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return "{" + ",".join(f'{k}="{esc(v)}"' for k, v in pairs) + "}"
+
+
+def _fmt_value(v: float) -> str:
+    if v == float("inf"):
+        return "+Inf"
+    return repr(float(v)) if not float(v).is_integer() else str(int(v))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def _key(self, labels: Dict[str, str]) -> Tuple:
+        return tuple(str(labels.get(k, "")) for k in self.labels)
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        return "\n".join([f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"] + self.samples())
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        super().__init__(name, help, labels)
+        self._values: Dict[Tuple, float] = {}
+
+    def inc(self, n: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + n
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_fmt_labels(self.labels, k)} {_fmt_value(v)}" for k, v in items]
+
+
+class Gauge(_Metric):
+    """값을 읽을 때 fn() 호출 (문서 수, FAISS row 수 등 이미 어딘가에 있는 값)"""
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, fn: Callable[[], float]):
+        super().__init__(name, help)
+        self.fn = fn
+
+    def samples(self) -> List[str]:
+        try:
+            return [f"{self.name} {_fmt_value(self.fn())}"]
+        except Exception:
+            return []
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        self._series: Dict[Tuple, List] = {}   # key → [버킷별 개수(비누적), sum, count]
+
+    def observe(self, v: float, **labels):
+        key = self._key(labels)
+        i = next(j for j, b in enumerate(self.buckets) if v <= b)
+        with self._lock:
+            s = self._series.get(key)
+            if s is None:
+                s = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+            s[0][i] += 1
+            s[1] += v
+            s[2] += 1
+
+    def summary(self, **labels) -> Dict:
+        s = self._series.get(self._key(labels))
+        if s is None:
+            return {"count": 0, "sum": 0.0}
+        return {"count": s[2], "sum": s[1]}
+
+    def samples(self) -> List[str]:
+        out = []
+        with self._lock:
+            items = sorted((k, (list(s[0]), s[1], s[2])) for k, s in self._series.items())
+        for key, (counts, total, n) in items:
+            acc = 0
+            for b, c in zip(self.buckets, counts):
+                acc += c
+                out.append(f"{self.name}_bucket{_fmt_labels(self.labels, key, ('le', _fmt_value(b)))} {acc}")
+            out.append(f"{self.name}_sum{_fmt_labels(self.labels, key)} {_fmt_value(total)}")
+            out.append(f"{self.name}_count{_fmt_labels(self.labels, key)} {n}")
+        return out
+
+
+def render() -> str:
+    return "\n".join(m.render() for m in REGISTRY) + "\n"
+
+
+# ---------- 구간 타이머 ----------
+STAGE_SECONDS = Histogram("qa_stage_seconds", "파이프라인 구간별 소요 시간 (중첩 구간은 각각 기록)", ("stage",))
+
+_breakdown: contextvars.ContextVar[Optional[Dict[str, float]]] = contextvars.ContextVar("qa_breakdown", default=None)
+
+
+def start_request() -> Dict[str, float]:
+    """현재 컨텍스트(요청)의 구간별 누적 시간 dict 를 새로 시작해 반환 (stage → 초)"""
+    d: Dict[str, float] = {}
+    _breakdown.set(d)
+    return d
+
+
+def record(name: str, seconds: float):
+    """다른 곳에서 잰 구간 시간을 기록 (예: Ollama 가 보고한 prompt eval 시간)"""
+    STAGE_SECONDS.observe(seconds, stage=name)
+    d = _breakdown.get()
+    if d is not None:
+        d[name] = d.get(name, 0.0) + seconds
+
+
+@contextmanager
+def stage(name: str):
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, time.perf_counter() - t0)
+
+
+def timed(name: str):
+    """함수 전체를 stage(name) 으로 감싸는 데코레이터 (동기 함수용)"""
+    def deco(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return deco
@@ -0,0 +1,134 @@
+# mock_ollama.py — 테스트/벤치마크용 가짜 Ollama 서버 (/api/generate, /api/chat)
+# 실행: MOCK_LATENCY_MS=800 python -m uvicorn mock_ollama:app --port 11435
+#       OLLAMA_URL=http://127.0.0.1:11435 python -m uvicorn app:app --port 8000
+# 프롬프트의 '근거:' JSON 에서 첫 근거의 첫 문장을 골라 Extractive JSON 형식으로 돌려준다.
+# 실제 LLM 없이 검색 스택/동시성만 측정할 때 사용.
+# prompt eval 흉내: MOCK_PROMPT_MS_PER_TOKEN > 0 이면 (문자 1개 = 토큰 1개로 치고) 직전 요청과 겹치지 않는 뒷부분만큼
+# 추가로 기다린다 (Ollama 의 슬롯 KV 프리픽스 재사용과 같은 방식, 슬롯 1개). 응답에 prompt_eval_count/duration 등을 넣는다.
+
+import os, re, json, time, asyncio
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+from typing import Dict, List, Optional
+
+LATENCY_MS = float(os.environ.get("MOCK_LATENCY_MS", "500"))
+PROMPT_MS_PER_TOKEN = float(os.environ.get("MOCK_PROMPT_MS_PER_TOKEN", "0"))
+PREFIX_CACHE = os.environ.get("MOCK_PREFIX_CACHE", "1") == "1"
+
+app = FastAPI(title="Mock Ollama")
+STATS = {"requests": 0, "inflight": 0, "max_inflight": 0, "prompt_tokens": 0, "prompt_eval_tokens": 0}
+SLOT = {"text": ""}   # 직전 요청의 전체 입력 (KV 캐시)
+
+
+class GenerateReq(BaseModel):
+    model: str = "mock"
+    prompt: str = ""
+    stream: bool = False
+    keep_alive: Optional[str] = None
+    options: Optional[Dict] = None
+
+
+class ChatReq(BaseModel):
+    model: str = "mock"
+    messages: List[Dict] = []
+    stream: bool = False
+    keep_alive: Optional[str] = None
+    options: Optional[Dict] = None
+
+
+def fake_answer(prompt: str) -> str:
+    m = re.search(r"근거:\s*(\[.*\])", prompt, flags=re.DOTALL)
+    bullets = []
+    if m:
+        try:
+            bullets = json.loads(m.group(1))
+        except Exception:
+            bullets = []
+    if not bullets:
+        return json.dumps({"final_answer": "메뉴얼에 근거가 없어 답변드리기 어렵습니다.",
+                           "support": [], "citations": []}, ensure_ascii=False)
+    first = bullets[0]
+    sents = re.findall(r".+?(?:다\.|요\.|[.!?])", first.get("text", "")) or [first.get("text", "")]
+    sent = sents[0].strip()
+    return json.dumps({"final_answer": sent[:50], "support": [sent],
+                       "citations": [first.get("id", "")]}, ensure_ascii=False)
+
+
+def chat_text(messages: List[Dict]) -> str:
+    # 채팅 템플릿 흉내: 역할 표시 + 내용을 이어 붙인 것이 모델 입력
+    return "".join(f"<|{m.get('role', 'user')}|>{m.get('content', '')}" for m in messages)
+
+
+async def prompt_eval(text: str) -> Dict:
+    """직전 입력과의 공통 프리픽스는 건너뛰고 나머지만 '평가' → Ollama 와 같은 통계 필드"""
+    prev = SLOT["text"] if PREFIX_CACHE else ""
+    n = 0
+    for a, b in zip(prev, text):
+        if a != b:
+            break
+        n += 1
+    SLOT["text"] = text
+    count = len(text) - n
+    STATS["prompt_tokens"] += len(text)
+    STATS["prompt_eval_tokens"] += count
+    t0 = time.perf_counter()
+    if PROMPT_MS_PER_TOKEN > 0:
+        await asyncio.sleep(count * PROMPT_MS_PER_TOKEN / 1000.0)
+    return {"prompt_eval_count": count, "prompt_eval_duration": int((time.perf_counter() - t0) * 1e9)}
+
+
+def final_stats(pe: Dict, answer: str, t_start: float, t_eval: float) -> Dict:
+    now = time.perf_counter()
+    return dict(pe, eval_count=len(answer), eval_duration=int((now - t_eval) * 1e9),
+                load_duration=0, total_duration=int((now - t_start) * 1e9))
+
+
+async def stream_tokens(text: str, answer: str, piece):
+    # 전체 지연의 절반은 첫 토큰까지(prompt eval), 나머지는 토큰 사이에 나눠서
+    try:
+        t0 = time.perf_counter()
+        pe = await prompt_eval(text)
+        pieces = [answer[i:i + 4] for i in range(0, len(answer), 4)]
+        await asyncio.sleep(LATENCY_MS / 2000.0)
+        t1 = time.perf_counter()
+        for p in pieces:
+            yield json.dumps(dict(piece(p), model="mock", done=False), ensure_ascii=False) + "\n"
+            await asyncio.sleep(LATENCY_MS / 2000.0 / max(len(pieces), 1))
+        yield json.dumps(dict(piece(""), model="mock", done=True, **final_stats(pe, answer, t0, t1))) + "\n"
+    finally:
+        STATS["inflight"] -= 1
+
+
+async def respond(text: str, answer: str, stream: bool, piece):
+    STATS["requests"] += 1
+    STATS["inflight"] += 1
+    STATS["max_inflight"] = max(STATS["max_inflight"], STATS["inflight"])
+    if stream:
+        return StreamingResponse(stream_tokens(text, answer, piece), media_type="application/x-ndjson")
+    try:
+        t0 = time.perf_counter()
+        pe = await prompt_eval(text)
+        t1 = time.perf_counter()
+        await asyncio.sleep(LATENCY_MS / 1000.0)
+        return dict(piece(answer), model="mock", done=True, **final_stats(pe, answer, t0, t1))
+    finally:
+        STATS["inflight"] -= 1
+
+
+@app.post("/api/generate")
+async def generate(req: GenerateReq):
+    return await respond(chat_text([{"role": "user", "content": req.prompt}]), fake_answer(req.prompt),
+                         req.stream, lambda p: {"response": p})
+
+
+@app.post("/api/chat")
+async def chat(req: ChatReq):
+    user = next((m.get("content", "") for m in reversed(req.messages) if m.get("role") == "user"), "")
+    return await respond(chat_text(req.messages), fake_answer(user), req.stream,
+                         lambda p: {"message": {"role": "assistant", "content": p}})
+
+
+@app.get("/stats")
+def stats():
+    return STATS
@@ -0,0 +1,205 @@
+# models.py — 모델 지연/백그라운드 로딩 (bge-m3 임베딩, bge 리랭커) + 요청 간 마이크로 배칭
+# 서버는 모델 없이 먼저 바인딩하고, 모델은 백그라운드 스레드에서 로드 + 워밍업한다.
+# 로드 전에 들어온 요청은 get()에서 로드 완료까지 기다린다.
+
+import os, time, queue, logging, threading, functools
+from concurrent.futures import Future
+from typing import Callable, Optional, Any, Dict, List
+
+log = logging.getLogger("qa.models")
+
+# 추론 백엔드: torch (sentence-transformers / FlagEmbedding, fp32) | onnx (int8 ONNX Runtime, onnx_backend.py)
+MODEL_BACKEND = os.environ.get("QA_MODEL_BACKEND", "torch")
+MODEL_THREADS = int(os.environ.get("QA_MODEL_THREADS", "0"))      # intra-op 스레드 (0: 라이브러리 기본 = 코어 수)
+EMB_MAX_SEQ_LEN = int(os.environ.get("QA_EMB_MAX_SEQ_LEN", "0"))  # 0: 모델 기본 (bge-m3 8192, 청크는 400자라 512 면 충분)
+RERANK_MAX_LEN = int(os.environ.get("QA_RERANK_MAX_LEN", "512"))  # FlagReranker 기본과 같음
+
+
+def _torch_threads():
+    if MODEL_THREADS > 0:
+        import torch
+        torch.set_num_threads(MODEL_THREADS)
+
+
+def load_embedding_model(name: str, dim: int, backend: Optional[str] = None):
+    backend = backend or MODEL_BACKEND
+    if backend == "onnx":
+        from onnx_backend import OnnxEmbedder
+        m = OnnxEmbedder(name, threads=MODEL_THREADS, max_len=EMB_MAX_SEQ_LEN)
+    elif backend == "torch":
+        # torch/sentence-transformers import 자체가 수 초 걸리므로 로더 안에서 import
+        _torch_threads()
+        from sentence_transformers import SentenceTransformer
+        m = SentenceTransformer(name)   # 임베딩 모델 (한국어/다국어 강함)
+        if EMB_MAX_SEQ_LEN:
+            m.max_seq_length = EMB_MAX_SEQ_LEN
+    else:
+        raise ValueError(f"unknown QA_MODEL_BACKEND: {backend}")
+    got = m.get_sentence_embedding_dimension()
+    if got != dim:
+        raise ValueError(f"embedding dim {got} != EMB_DIM {dim}")
+    return m
+
+
+def load_reranker(name: str, backend: Optional[str] = None):
+    backend = backend or MODEL_BACKEND
+    if backend == "onnx":
+        from onnx_backend import OnnxReranker
+        return OnnxReranker(name, threads=MODEL_THREADS, max_len=RERANK_MAX_LEN)
+    if backend != "torch":
+        raise ValueError(f"unknown QA_MODEL_BACKEND: {backend}")
+    _torch_threads()
+    from FlagEmbedding import FlagReranker
+    m = FlagReranker(name, use_fp16=False)  # CPU면 False
+    m.compute_score = functools.partial(m.compute_score, max_length=RERANK_MAX_LEN)
+    return m
+
+
+class ModelSlot:
+    """모델 1개의 로딩 상태를 관리. state: pending → loading → ready | error"""
+
+    def __init__(self, name: str, loader: Callable[[], Any],
+                 warmup: Optional[Callable[[Any], None]] = None):
+        self.name = name
+        self._loader = loader
+        self._warmup = warmup
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+        self.model: Any = None
+        self.state = "pending"
+        self.error: Optional[str] = None
+        self.load_seconds: Optional[float] = None
+        self.warmup_seconds: Optional[float] = None
+
+    def _load(self):
+        t0 = time.perf_counter()
+        try:
+            model = self._loader()
+            self.load_seconds = time.perf_counter() - t0
+            if self._warmup is not None:
+                t1 = time.perf_counter()
+                self._warmup(model)
+                self.warmup_seconds = time.perf_counter() - t1
+            self.model = model
+            self.state = "ready"
+            log.info(f"model {self.name}: loaded {self.load_seconds:.1f}s, "
+                     f"warmup {self.warmup_seconds or 0.0:.2f}s")
+        except Exception as e:
+            self.error = f"{type(e).__name__}: {e}"
+            self.state = "error"
+            log.exception(f"model {self.name}: load failed")
+        finally:
+            self._done.set()
+
+    def start(self, background: bool = True):
+        """로드 시작 (이미 시작했으면 무시)."""
+        with self._lock:
+            if self.state != "pending":
+                return
+            self.state = "loading"
+        if background:
+            threading.Thread(target=self._load, name=f"load-{self.name}", daemon=True).start()
+        else:
+            self._load()
+
+    def get(self, timeout: Optional[float] = None) -> Any:
+        """모델 반환. 아직 시작 전이면 지금(호출 스레드에서) 로드한다."""
+        if self.state == "pending":
+            self.start(background=False)
+        if not self._done.wait(timeout):
+            raise TimeoutError(f"model {self.name} not ready after {timeout}s")
+        if self.state != "ready":
+            raise RuntimeError(f"model {self.name} failed to load: {self.error}")
+        return self.model
+
+    @property
+    def ready(self) -> bool:
+        return self.state == "ready"
+
+    def status(self) -> Dict:
+        return {"state": self.state, "load_seconds": self.load_seconds,
+                "warmup_seconds": self.warmup_seconds, "error": self.error}
+
+
+class MicroBatcher:
+    """동시에 들어온 요청들의 추론 입력을 짧은 시간창(window_ms) 동안 모아 한 번에 실행.
+    batch_fn(items) 는 items 와 같은 순서/길이의 결과 리스트를 반환해야 한다.
+    size_fn 으로 항목 크기(예: 리랭크 쌍 개수)를 재서 max_items 를 넘기 전까지만 모은다."""
+
+    def __init__(self, name: str, batch_fn: Callable[[List[Any]], List[Any]],
+                 max_items: int = 32, window_ms: float = 5.0,
+                 size_fn: Callable[[Any], int] = lambda x: 1, enabled: bool = True):
+        self.name = name
+        self.batch_fn = batch_fn
+        self.max_items = max_items
+        self.window = window_ms / 1000.0
+        self.size_fn = size_fn
+        self.enabled = enabled
+        self._q: "queue.Queue[tuple]" = queue.Queue()
+        self._worker: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self.batches = 0
+        self.items = 0
+
+    def _ensure_worker(self):
+        if self._worker is None:
+            with self._lock:
+                if self._worker is None:
+                    self._worker = threading.Thread(target=self._run, name=f"batch-{self.name}",
+                                                    daemon=True)
+                    self._worker.start()
+
+    def submit(self, item: Any) -> Future:
+        fut: Future = Future()
+        if not self.enabled:
+            try:
+                fut.set_result(self.batch_fn([item])[0])
+            except Exception as e:
+                fut.set_exception(e)
+            return fut
+        self._ensure_worker()
+        self._q.put((item, fut))
+        return fut
+
+    def __call__(self, item: Any) -> Any:
+        return self.submit(item).result()
+
+    def _run(self):
+        pending = None   # 이전 배치에 못 들어간 항목
+        while True:
+            first = pending or self._q.get()
+            pending = None
+            batch = [first]
+            size = self.size_fn(first[0])
+            deadline = time.monotonic() + self.window
+            while size < self.max_items:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    nxt = self._q.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if size + self.size_fn(nxt[0]) > self.max_items:
+                    pending = nxt
+                    break
+                batch.append(nxt)
+                size += self.size_fn(nxt[0])
+            self._execute(batch)
+
+    def _execute(self, batch: List[tuple]):
+        try:
+            results = self.batch_fn([item for item, _ in batch])
+        except Exception as e:
+            for _, fut in batch:
+                fut.set_exception(e)
+            return
+        self.batches += 1
+        self.items += len(batch)
+        for (_, fut), res in zip(batch, results):
+            fut.set_result(res)
+
+    def stats(self) -> Dict:
+        return {"enabled": self.enabled, "window_ms": self.window * 1000.0, "max_items": self.max_items,
+                "batches": self.batches, "requests": self.items,
+                "avg_batch": round(self.items / self.batches, 2) if self.batches else 0.0}
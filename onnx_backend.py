@@ -0,0 +1,169 @@
+# onnx_backend.py — CPU 추론 백엔드: bge-m3 / bge 리랭커를 ONNX 로 내보내고 int8 동적 양자화해 ONNX Runtime 으로 실행
+# 내보내기(1회, optimum[onnxruntime] 필요):
+#   python onnx_backend.py export --model BAAI/bge-m3 --kind embed
+#   python onnx_backend.py export --model BAAI/bge-reranker-base --kind rerank
+# 사용: QA_MODEL_BACKEND=onnx (서버는 onnxruntime + transformers(토크나이저)만 있으면 된다)
+# OnnxEmbedder.encode / OnnxReranker.compute_score 는 SentenceTransformer / FlagReranker 와 같은 모양이라
+# ModelSlot, infer.py 에 그대로 들어간다. 정확도/속도 비교: python bench.py backend
+
+import os, sys, time, logging, argparse, platform, threading
+from typing import List, Optional
+import numpy as np
+
+log = logging.getLogger("qa.onnx")
+
+ONNX_DIR = os.environ.get("QA_ONNX_DIR", "onnx_models")
+ONNX_QUANT = os.environ.get("QA_ONNX_QUANT", "int8")        # int8 | fp32
+ONNX_QCONFIG = os.environ.get("QA_ONNX_QCONFIG", "auto")    # auto | avx512_vnni | avx512 | avx2 | arm64
+ONNX_EXPORT = os.environ.get("QA_ONNX_EXPORT", "0") == "1"  # 내보낸 모델이 없으면 로드 시 내보내기 (수 분)
+
+
+def model_dir(name: str, quant: str = ONNX_QUANT) -> str:
+    return os.path.join(ONNX_DIR, name.replace("/", "__"), quant)
+
+
+def onnx_file(d: str) -> Optional[str]:
+    for f in ("model_quantized.onnx", "model.onnx"):
+        if os.path.exists(os.path.join(d, f)):
+            return os.path.join(d, f)
+    return None
+
+
+def _qconfig_name() -> str:
+    if ONNX_QCONFIG != "auto":
+        return ONNX_QCONFIG
+    if platform.machine().lower() in ("arm64", "aarch64"):
+        return "arm64"
+    try:
+        flags = open("/proc/cpuinfo", encoding="utf-8").read()
+    except OSError:
+        flags = ""
+    if "avx512_vnni" in flags:
+        return "avx512_vnni"
+    return "avx512" if "avx512f" in flags else "avx2"
+
+
+def export(name: str, kind: str, quant: str = ONNX_QUANT) -> str:
+    """HF 모델 → ONNX(fp32) → (int8 이면) 가중치 동적 양자화. 토크나이저와 함께 저장한 디렉터리 반환"""
+    from optimum.onnxruntime import ORTModelForFeatureExtraction, ORTModelForSequenceClassification, ORTQuantizer
+    from optimum.onnxruntime.configuration import AutoQuantizationConfig
+    from transformers import AutoTokenizer
+
+    fp32_dir = model_dir(name, "fp32")
+    if onnx_file(fp32_dir) is None:
+        t0 = time.perf_counter()
+        cls = ORTModelForFeatureExtraction if kind == "embed" else ORTModelForSequenceClassification
+        cls.from_pretrained(name, export=True).save_pretrained(fp32_dir)   # 2GB 넘으면 model.onnx_data 로 분리
+        AutoTokenizer.from_pretrained(name).save_pretrained(fp32_dir)
+        log.info(f"onnx: exported {name} → {fp32_dir} ({time.perf_counter() - t0:.0f}s)")
+    if quant == "fp32":
+        return fp32_dir
+
+    q_dir = model_dir(name, quant)
+    qname = _qconfig_name()
+    qconfig = getattr(AutoQuantizationConfig, qname)(is_static=False, per_channel=False)
+    t0 = time.perf_counter()
+    ORTQuantizer.from_pretrained(fp32_dir).quantize(save_dir=q_dir, quantization_config=qconfig)
+    AutoTokenizer.from_pretrained(fp32_dir).save_pretrained(q_dir)
+    log.info(f"onnx: quantized {name} ({qname}, dynamic int8) → {q_dir} ({time.perf_counter() - t0:.0f}s)")
+    return q_dir
+
+
+class _OnnxModel:
+    kind = ""
+    output = ""
+
+    def __init__(self, name: str, threads: int = 0, max_len: int = 0, quant: str = ONNX_QUANT):
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+
+        d = model_dir(name, quant)
+        if onnx_file(d) is None:
+            if not ONNX_EXPORT:
+                raise FileNotFoundError(f"{d}: 먼저 python onnx_backend.py export --model {name} --kind {self.kind}"
+                                        f" (또는 QA_ONNX_EXPORT=1)")
+            export(name, self.kind, quant)
+        so = ort.SessionOptions()
+        so.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        so.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        so.inter_op_num_threads = 1
+        if threads > 0:
+            so.intra_op_num_threads = threads
+        self.name = name
+        self.path = onnx_file(d)
+        self.session = ort.InferenceSession(self.path, sess_options=so, providers=["CPUExecutionProvider"])
+        self.inputs = {i.name for i in self.session.get_inputs()}
+        outs = [o.name for o in self.session.get_outputs()]
+        self.outputs = [self.output] if self.output in outs else outs[:1]
+        self.tokenizer = AutoTokenizer.from_pretrained(d)
+        self.max_len = max_len or min(int(self.tokenizer.model_max_length), 8192)
+        # fast tokenizer 는 padding/truncation 설정을 바꿔 가며 인코딩하므로 스레드 간 동시 호출을 막는다 (추론은 병렬)
+        self._tok_lock = threading.Lock()
+        log.info(f"onnx: {name} ← {self.path} (threads={threads or 'default'}, max_len={self.max_len})")
+
+    def _run(self, *texts, max_len: int) -> np.ndarray:
+        with self._tok_lock:
+            enc = self.tokenizer(*texts, padding=True, truncation=True, max_length=max_len, return_tensors="np")
+        feeds = {k: v.astype("int64") for k, v in enc.items() if k in self.inputs}
+        return self.session.run(self.outputs, feeds)[0]
+
+    @staticmethod
+    def _batches(lengths: List[int], batch_size: int):
+        # 길이가 비슷한 것끼리 묶어 패딩을 줄인다 (SentenceTransformer 와 같은 방식)
+        order = np.argsort([-n for n in lengths], kind="stable")
+        for i in range(0, len(order), batch_size):
+            yield order[i:i + batch_size]
+
+
+class OnnxEmbedder(_OnnxModel):
+    """SentenceTransformer.encode 대체 (bge-m3 dense: CLS 토큰 벡터 + L2 정규화)"""
+    kind = "embed"
+    output = "last_hidden_state"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        dim = self.session.get_outputs()[0].shape[-1]
+        self.dim = dim if isinstance(dim, int) else self._run(["dim"], max_len=8).shape[-1]
+
+    def encode(self, texts: List[str], batch_size: int = 32, normalize_embeddings: bool = True) -> np.ndarray:
+        out = np.zeros((len(texts), self.dim), dtype="float32")
+        for idx in self._batches([len(t) for t in texts], batch_size):
+            vecs = self._run([texts[i] for i in idx], max_len=self.max_len)[:, 0].astype("float32")
+            if normalize_embeddings:
+                vecs /= np.maximum(np.linalg.norm(vecs, axis=1, keepdims=True), 1e-12)
+            out[idx] = vecs
+        return out
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.dim
+
+
+class OnnxReranker(_OnnxModel):
+    """FlagReranker.compute_score 대체 (logit 그대로, 쌍이 1개면 float)"""
+    kind = "rerank"
+    output = "logits"
+
+    def compute_score(self, pairs: List[List[str]], batch_size: int = 32, max_length: Optional[int] = None):
+        scores = np.zeros(len(pairs), dtype="float32")
+        for idx in self._batches([len(p[0]) + len(p[1]) for p in pairs], batch_size):
+            logits = self._run([pairs[i][0] for i in idx], [pairs[i][1] for i in idx],
+                               max_len=max_length or self.max_len)
+            scores[idx] = logits.reshape(len(idx), -1)[:, 0]
+        res = scores.tolist()
+        return res[0] if len(res) == 1 else res
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    sp = sub.add_parser("export", help="HF 모델 → ONNX (+ int8 동적 양자화)")
+    sp.add_argument("--model", required=True)
+    sp.add_argument("--kind", choices=["embed", "rerank"], required=True)
+    sp.add_argument("--quant", choices=["int8", "fp32"], default=ONNX_QUANT)
+    args = ap.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    print(export(args.model, args.kind, args.quant))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,132 @@
+# partitions.py — title(컬렉션)별 검색 파티션
+# /ask 의 collections 필터가 있으면 그 title 의 청크만 검색한다.
+# - 벡터: 파티션별 인덱스를 따로 두지 않는다. 전역 FAISS 인덱스(저장본/공유 mmap 그대로)에 파티션의 DOCS row 를
+#   selector 로 넘겨 그 row 만 검색 (범위가 작으면 스냅샷 float 벡터 전수 내적, VectorIndex.search 의 rows)
+# - 키워드: 파티션마다 BM25 (문서 번호 = 파티션 안 번호 → 검색 비용이 파티션 크기에 비례)
+#   IDF/평균 길이는 파티션 안 통계 (여러 파티션 결과는 점수 그대로 합친다)
+# 파티션은 row 목록과 BM25 만 메모리에 두고 기동 시 스냅샷 청크 본문에서 다시 만든다 (벡터 복사/재구축 없음).
+# 쓰기(add/remove)는 app 의 INGEST_LOCK 안에서만, 읽기는 versions() 로 잡아 둔 버전으로 락 없이.
+
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+import numpy as np
+
+from bm25 import BM25Index, BM25State
+
+
+class PartitionVersion:
+    """게시된 파티션 버전 (읽기 전용). rows: 파티션 안 번호 → DOCS row (추가만 하므로 이전 버전의 앞부분은 불변),
+    live: 살아있는 DOCS row (정렬), keyword: BM25 상태 (키워드 파티션을 두지 않으면 None)"""
+    __slots__ = ("part", "keyword", "rows", "live")
+
+    def __init__(self, part: "Partition", keyword: Optional[BM25State], rows: np.ndarray, live: np.ndarray):
+        self.part = part
+        self.keyword = keyword
+        self.rows = rows
+        self.live = live
+
+
+class Partition:
+    def __init__(self, title: str, keyword: bool = True):
+        self.title = title
+        self.keyword = BM25Index() if keyword else None
+        self.rows = np.zeros(0, dtype="int64")   # 파티션 안 번호 → DOCS row (삭제된 것 포함)
+        self._local: Dict[int, int] = {}         # 살아있는 DOCS row → 파티션 안 번호
+        self._version: Optional[PartitionVersion] = None   # 바뀌지 않은 파티션은 publish 마다 같은 버전을 재사용
+
+    def __len__(self) -> int:
+        return len(self._local)
+
+    def add(self, rows: List[int], texts: List[str]):
+        start = len(self.rows)
+        self.rows = np.concatenate([self.rows, np.asarray(rows, dtype="int64")])
+        self._local.update((r, start + i) for i, r in enumerate(rows))
+        if self.keyword is not None:
+            self.keyword.add(range(start, len(self.rows)), texts)
+        self._version = None
+
+    def remove(self, rows: List[int], texts: List[str]):
+        gone = [(self._local.pop(r), text) for r, text in zip(rows, texts) if r in self._local]
+        if self.keyword is not None:
+            self.keyword.remove((i for i, _ in gone), (text for _, text in gone))
+        self._version = None
+
+    def live_rows(self) -> np.ndarray:
+        return np.fromiter(sorted(self._local), dtype="int64", count=len(self._local))
+
+    def version(self) -> PartitionVersion:
+        if self._version is None:
+            keyword = self.keyword.state if self.keyword is not None else None
+            self._version = PartitionVersion(self, keyword, self.rows, self.live_rows())
+        return self._version
+
+    def status(self) -> Dict:
+        return {"docs": len(self),
+                "terms": len(self.keyword.state.post) if self.keyword is not None else None}
+
+
+class Partitions:
+    """title → Partition. add/remove 는 DOCS row 단위 (title 은 row 로 기억해 둔다).
+    keyword=False: row 목록만 (키워드 엔진이 Whoosh 일 때, texts 는 무시)"""
+
+    def __init__(self, keyword: bool = True):
+        self.keyword = keyword
+        self._parts: Dict[str, Partition] = {}
+        self._title_of: Dict[int, str] = {}
+
+    def __len__(self) -> int:
+        return len(self._parts)
+
+    def add(self, rows: Iterable[int], titles: Iterable[str], texts: Iterable[str]):
+        groups: Dict[str, Tuple[List[int], List[str]]] = {}
+        for r, title, text in zip(rows, titles, texts):
+            rs, ts = groups.setdefault(title, ([], []))
+            rs.append(int(r))
+            ts.append(text)
+        for title, (rs, ts) in groups.items():
+            part = self._parts.get(title)
+            if part is None:
+                part = self._parts[title] = Partition(title, self.keyword)
+            part.add(rs, ts)
+            self._title_of.update((r, title) for r in rs)
+
+    def remove(self, rows: Iterable[int], texts: Iterable[str]):
+        """texts: 삭제 row 의 add 때 본문 (BM25 포스팅 정리용)"""
+        groups: Dict[str, Tuple[List[int], List[str]]] = {}
+        for r, text in zip(rows, texts):
+            title = self._title_of.pop(int(r), None)
+            if title is not None:
+                rs, ts = groups.setdefault(title, ([], []))
+                rs.append(int(r))
+                ts.append(text)
+        for title, (rs, ts) in groups.items():
+            part = self._parts[title]
+            part.remove(rs, ts)
+            if not len(part):   # 문서 삭제 → 컬렉션도 없앤다 (같은 title 로 다시 올리면 새로 만든다)
+                del self._parts[title]
+
+    def versions(self) -> Dict[str, PartitionVersion]:
+        return {title: p.version() for title, p in self._parts.items()}
+
+    def status(self) -> Dict:
+        return {title: p.status() for title, p in sorted(self._parts.items())}
+
+
+def collection_rows(parts: Sequence[PartitionVersion]) -> np.ndarray:
+    """파티션들의 살아있는 DOCS row (정렬) → VectorIndex.search(rows=...)"""
+    if len(parts) == 1:
+        return parts[0].live
+    return np.sort(np.concatenate([pv.live for pv in parts])) if parts else np.zeros(0, dtype="int64")
+
+
+def search_keyword(parts: Sequence[PartitionVersion], query: str, k: int) -> List[Tuple[float, int]]:
+    """파티션별 BM25 상위 k → [(score, DOCS row)] 점수 순 상위 k"""
+    scores, rows = [], []
+    for pv in parts:
+        s, local = pv.part.keyword.top(query, k, state=pv.keyword)
+        scores.append(s)
+        rows.append(pv.rows[local])
+    if not scores:
+        return []
+    S, R = np.concatenate(scores), np.concatenate(rows)
+    top = np.argsort(-S, kind="stable")[:k]
+    return list(zip(S[top].tolist(), R[top].tolist()))
@@ -0,0 +1,76 @@
+# pdfx.py — PDF 텍스트 추출 (페이지 구간 단위로 프로세스 풀에서 병렬)
+# 워커는 spawn 으로 띄우므로 이 모듈만 import 한다 (app.py 의 모델/인덱스를 복제하지 않음).
+# iter_pages() 는 페이지 순서대로 (page, text) 를 흘려보내고, 동시에 떠 있는 구간 수를 제한해
+# 메모리 사용량이 파일 크기가 아니라 (워커 수 × 구간 크기)에 묶이게 한다.
+
+import os, logging, threading
+import multiprocessing as mp
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterator, List, Optional, Tuple
+
+try:
+    import fitz  # PyMuPDF
+except Exception:
+    fitz = None
+
+log = logging.getLogger("qa.pdf")
+
+PDF_WORKERS = int(os.environ.get("QA_PDF_WORKERS", str(min(4, os.cpu_count() or 1))))
+PAGES_PER_TASK = int(os.environ.get("QA_PDF_PAGES_PER_TASK", "16"))
+
+_POOL: Optional[ProcessPoolExecutor] = None
+_POOL_LOCK = threading.Lock()
+
+
+def _pool() -> ProcessPoolExecutor:
+    global _POOL
+    with _POOL_LOCK:
+        if _POOL is None:
+            _POOL = ProcessPoolExecutor(max_workers=PDF_WORKERS, mp_context=mp.get_context("spawn"))
+        return _POOL
+
+
+def shutdown():
+    global _POOL
+    with _POOL_LOCK:
+        if _POOL is not None:
+            _POOL.shutdown(wait=False, cancel_futures=True)
+            _POOL = None
+
+
+def page_count(path: str) -> int:
+    """페이지 수. 열 수 없으면 ValueError"""
+    if fitz is None:
+        raise RuntimeError("pymupdf 미설치: pip install pymupdf")
+    try:
+        with fitz.open(path) as doc:
+            return doc.page_count
+    except Exception as e:
+        raise ValueError(f"PDF 열기 실패: {e}")
+
+
+def extract_pages(path: str, start: int, end: int) -> List[Tuple[int, str]]:
+    """[start, end) 페이지 텍스트 (워커 프로세스에서 실행)"""
+    with fitz.open(path) as doc:
+        return [(pi, doc[pi].get_text("text") or "") for pi in range(start, min(end, doc.page_count))]
+
+
+def iter_pages(path: str, n_pages: Optional[int] = None) -> Iterator[Tuple[int, str]]:
+    """(page, text) 를 페이지 순서대로. 작은 파일/워커 1개면 현재 스레드에서 바로 추출."""
+    if n_pages is None:
+        n_pages = page_count(path)
+    if PDF_WORKERS <= 1 or n_pages <= PAGES_PER_TASK:
+        yield from extract_pages(path, 0, n_pages)
+        return
+    ranges = deque((s, min(s + PAGES_PER_TASK, n_pages)) for s in range(0, n_pages, PAGES_PER_TASK))
+    pool, inflight = _pool(), deque()
+    try:
+        while ranges or inflight:
+            while ranges and len(inflight) < PDF_WORKERS * 2:
+                s, e = ranges.popleft()
+                inflight.append(pool.submit(extract_pages, path, s, e))
+            yield from inflight.popleft().result()
+    finally:
+        for fut in inflight:
+            fut.cancel()
@@ -0,0 +1,55 @@
+# serve.py — 멀티 워커 기동: 공유 추론 프로세스(infer.py) 1개 + uvicorn 워커 N개 (QA_SHARED=1)
+# 실행: python serve.py --workers 4 --port 8000
+# 모델은 추론 프로세스에만 1벌, 스냅샷/ANN 인덱스는 QA_STORE_DIR 파일을 워커들이 mmap 으로 공유한다.
+
+import os, sys, time, signal, argparse, subprocess
+
+import uvicorn
+
+from infer import InferClient
+
+
+def wait_ready(addr: str, proc: subprocess.Popen, timeout: float) -> dict:
+    # 추론 프로세스가 바인딩하고 두 모델을 로드 + 워밍업할 때까지
+    deadline = time.monotonic() + timeout
+    client = InferClient(addr, connect_timeout=timeout)
+    while True:
+        if proc.poll() is not None:
+            raise RuntimeError(f"infer process exited: {proc.returncode}")
+        try:
+            return client.call("ready")
+        except (ConnectionRefusedError, FileNotFoundError):
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.5)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 2)
+    ap.add_argument("--host", default="0.0.0.0")
+    ap.add_argument("--port", type=int, default=8000)
+    ap.add_argument("--infer-addr", default=os.environ.get("QA_INFER_ADDR", "/tmp/qa_infer.sock"))
+    ap.add_argument("--ready-timeout", type=float, default=600.0)
+    args = ap.parse_args()
+
+    os.environ["QA_INFER_ADDR"] = args.infer_addr
+    os.environ["QA_SHARED"] = "1"
+    infer_proc = subprocess.Popen([sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "infer.py"),
+                                   "--addr", args.infer_addr])
+    try:
+        t0 = time.perf_counter()
+        status = wait_ready(args.infer_addr, infer_proc, args.ready_timeout)
+        print(f"[serve] infer ready in {time.perf_counter() - t0:.1f}s: "
+              f"{ {k: v['state'] for k, v in status['models'].items()} }", flush=True)
+        uvicorn.run("app:app", host=args.host, port=args.port, workers=args.workers)
+    finally:
+        infer_proc.send_signal(signal.SIGTERM)
+        try:
+            infer_proc.wait(10)
+        except subprocess.TimeoutExpired:
+            infer_proc.kill()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
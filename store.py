@@ -0,0 +1,457 @@
+# store.py — 온디스크 스냅샷 (청크 메타/본문 + 벡터 mmap)
+# 구조:
+#   <dir>/manifest.json      : {"format", "generation", "dim", "count", "sent_count", "chunks_bytes", "model"}
+#   <dir>/chunks.jsonl       : 청크 1개당 JSON 한 줄 (Chunk.to_dict(+ PDF "page") + 문장 오프셋 "sents", "sent_row")
+#   <dir>/vectors.f32        : float32 (count, dim) 청크 벡터, np.memmap 으로 로드
+#   <dir>/sent_vectors.f32   : float32 (sent_count, dim) 문장 벡터, 청크별 [sent_row, sent_row+len(sents))
+#   <dir>/deleted.i32        : int32 삭제된 row 번호 (tombstone, deleted_count 개)
+# manifest 는 항상 마지막에 원자적으로 교체하므로, 중간에 죽어도 manifest 기준까지만 유효.
+# 삭제된 row 가 많아지면 compact_snapshot() 이 살아있는 row 만으로 새 스냅샷을 만들어 디렉터리째 교체한다.
+# 여러 프로세스(uvicorn --workers)가 같은 디렉터리를 쓸 때: 쓰기는 WriteLock(<dir>/write.lock) 으로 한 번에 하나,
+# 나머지 프로세스는 load_tail() 로 manifest 이후 추가분만 따라 읽는다.
+
+import os, json, shutil, hashlib, threading, weakref
+from typing import Callable, List, Dict, Tuple, Optional, Iterable, Iterator
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:   # Windows: 프로세스 간 락 없음 (단일 워커로만 운영)
+    fcntl = None
+
+STORE_FORMAT = 3
+READABLE_FORMATS = (1, 2, 3)   # format 1: 문장 사전 계산 없음 (질의 시 계산으로 폴백), 2: tombstone 없음
+
+
+def content_hash(text: str) -> str:
+    """청크 본문 해시 (재업로드 시 바뀌지 않은 청크는 재임베딩하지 않는다)"""
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()[:16]
+
+
+# ---------- 청크 레코드 / 문서 저장소 ----------
+class Chunk:
+    """청크 1개. dict 대신 __slots__ 로 청크당 메모리를 줄인다.
+    sents: 문장 (start, end) 오프셋 int32 (m, 2), sent_vecs: 정규화된 문장 벡터 (m, dim).
+    둘 다 ingest 시 한 번 계산하며, 없으면(None) 질의 시 계산한다.
+    page: PDF 원본 페이지 번호 (0부터, 텍스트 문서는 None). hash: 본문 content_hash."""
+    __slots__ = ("id", "title", "chunk_idx", "text", "sents", "sent_vecs", "page", "hash")
+
+    def __init__(self, id: str, title: str, chunk_idx: int, text: str,
+                 sents: Optional[np.ndarray] = None, sent_vecs: Optional[np.ndarray] = None,
+                 page: Optional[int] = None, hash: Optional[str] = None):
+        self.id = id
+        self.title = title
+        self.chunk_idx = chunk_idx
+        self.text = text
+        self.sents = sents
+        self.sent_vecs = sent_vecs
+        self.page = page
+        self.hash = hash or content_hash(text)
+
+    @classmethod
+    def from_dict(cls, d: Dict) -> "Chunk":
+        page = d.get("page")
+        return cls(d["id"], d["title"], int(d["chunk_idx"]), d["text"],
+                   page=None if page is None else int(page), hash=d.get("hash"))
+
+    def to_dict(self) -> Dict:
+        d = {"id": self.id, "title": self.title, "chunk_idx": self.chunk_idx, "text": self.text}
+        if self.page is not None:
+            d["page"] = self.page
+        return d
+
+    def __repr__(self):
+        return f"Chunk({self.id!r})"
+
+
+class DocStore:
+    """행(row) 순서로 청크를 보관 + id → row 인덱스 (O(1) 조회).
+    row 는 스냅샷/FAISS id 와 같다. 삭제된 row 는 번호를 유지한다 (compaction 전까지).
+    삭제된 청크는 그것을 아직 살아있다고 보는 view 가 모두 풀릴 때까지 객체를 남겨 둔다 (publish 참고):
+    DOCS[row] 는 그런 청크도 돌려주므로 살아있는지는 alive(row) / view.visible(row) 로 본다."""
+
+    def __init__(self):
+        self._rows: List[Optional[Chunk]] = []
+        self._row_of: Dict[str, int] = {}          # 살아있는 청크 id → row
+        self._retired: Dict[str, int] = {}         # 삭제됐지만 이전 view 가 아직 볼 수 있는 청크 id → row
+        self._unpublished: List[int] = []          # 다음 publish 전에 삭제된 row
+        self._pending: List[Tuple[int, List[int]]] = []   # (이 seq 부터의 view 에는 안 보임, row 목록)
+        self._views: "weakref.WeakSet[CorpusView]" = weakref.WeakSet()   # 게시된 view 중 아직 누가 잡고 있는 것
+        self._rows_of_title: Dict[str, List[int]] = {}
+        self.next_idx = 0   # 다음 청크 chunk_idx (id 충돌 방지용 단조 증가 번호)
+
+    def __len__(self) -> int:
+        """살아있는 청크 수"""
+        return len(self._row_of)
+
+    @property
+    def n_rows(self) -> int:
+        """삭제된 row 를 포함한 전체 row 수"""
+        return len(self._rows)
+
+    @property
+    def n_retired(self) -> int:
+        """삭제됐지만 pin 된 view 때문에 아직 붙잡고 있는 청크 수"""
+        return len(self._retired)
+
+    def __iter__(self) -> Iterator[Chunk]:
+        return (self._rows[r] for r in self.live_rows())
+
+    def __getitem__(self, row: int) -> Optional[Chunk]:
+        """row 의 청크 (삭제됐어도 아직 풀리지 않았으면 그대로, 풀린 row 는 None)"""
+        return self._rows[row]
+
+    def alive(self, row: int) -> bool:
+        c = self._rows[row]
+        return c is not None and self._row_of.get(c.id) == row
+
+    def extend(self, chunks: Iterable[Chunk]) -> range:
+        """청크 추가 후 새로 배정된 row 범위를 반환."""
+        start = len(self._rows)
+        for c in chunks:
+            self._retired.pop(c.id, None)   # 같은 id 를 다시 쓰면 예전 row 는 id 로 찾지 않는다
+            self._row_of[c.id] = len(self._rows)
+            self._rows_of_title.setdefault(c.title, []).append(len(self._rows))
+            self._rows.append(c)
+            self.next_idx = max(self.next_idx, c.chunk_idx + 1)
+        return range(start, len(self._rows))
+
+    def remove(self, chunk_ids: Iterable[str]) -> List[int]:
+        """청크 삭제 → 삭제된 row 목록 (없는 id 는 무시). 청크 객체는 publish 가 풀어 줄 때까지 남는다"""
+        rows = []
+        for cid in chunk_ids:
+            r = self._row_of.pop(cid, None)
+            if r is None:
+                continue
+            c = self._rows[r]
+            self._retired[cid] = r
+            title_rows = self._rows_of_title.get(c.title, [])
+            if r in title_rows:
+                title_rows.remove(r)
+            if not title_rows:
+                self._rows_of_title.pop(c.title, None)
+            rows.append(r)
+        self._unpublished.extend(rows)
+        return rows
+
+    def remove_rows(self, rows: Iterable[int]) -> List[int]:
+        return self.remove([self._rows[r].id for r in rows if self.alive(r)])
+
+    def publish(self, view: "CorpusView") -> int:
+        """새 view 게시 (writer, 락 안에서). 지금까지 삭제된 row 는 view.seq 부터 안 보인다고 기록하고,
+        살아있는 view 가 모두 그 seq 이상이 된 삭제분은 청크를 놓는다 (row 는 None) → 놓은 청크 수.
+        view 는 요청이 참조를 놓으면 (weakref) 목록에서 빠지므로, 오래 걸린 요청이 끝난 뒤 다음 publish 에서 풀린다."""
+        if self._unpublished:
+            self._pending.append((view.seq, self._unpublished))
+            self._unpublished = []
+        self._views.add(view)
+        oldest = min((v.seq for v in list(self._views)), default=view.seq)
+        released = 0
+        while self._pending and self._pending[0][0] <= oldest:
+            _, rows = self._pending.pop(0)
+            for r in rows:
+                c = self._rows[r]
+                if c is not None and self._retired.get(c.id) == r:
+                    del self._retired[c.id]
+                self._rows[r] = None
+            released += len(rows)
+        return released
+
+    def live_rows(self) -> np.ndarray:
+        return np.fromiter(sorted(self._row_of.values()), dtype="int64", count=len(self._row_of))
+
+    def row(self, chunk_id: str) -> Optional[int]:
+        return self._row_of.get(chunk_id)
+
+    def find(self, chunk_id: str) -> Optional[int]:
+        """id → row (삭제됐지만 아직 풀리지 않은 청크 포함, 보이는지는 view.visible 로 확인)"""
+        r = self._row_of.get(chunk_id)
+        return self._retired.get(chunk_id) if r is None else r
+
+    def get(self, chunk_id: str) -> Optional[Chunk]:
+        r = self._row_of.get(chunk_id)
+        return None if r is None else self._rows[r]
+
+    def by_title(self, title: str) -> List[Chunk]:
+        return [self._rows[r] for r in list(self._rows_of_title.get(title, ()))]
+
+    def titles(self) -> Dict[str, int]:
+        """title → 살아있는 청크 수 (ingest 와 동시에 불려도 되도록 목록을 먼저 복사)"""
+        return {t: len(rows) for t, rows in list(self._rows_of_title.items())}
+
+
+class CorpusView:
+    """요청 하나가 처음부터 끝까지 붙잡는(pin) 읽기 전용 코퍼스 버전. writer 는 새 view 를 만들어 교체한다.
+    rows: 보이는 row 수 (이후 append 된 청크는 안 보임), alive: row → 살아있음 (게시 후 불변),
+    vectors / keyword: 같은 시점의 벡터 인덱스 버전 / BM25 상태 (Whoosh 면 None),
+    partitions: title → 같은 시점의 컬렉션 파티션 버전 (partitions.py), seq: 게시 순번 (DocStore.publish).
+    view 이후에 삭제된 청크도 이 view 가 살아있는 동안은 DocStore 에 남아 있어 그대로 읽힌다."""
+    __slots__ = ("generation", "rows", "alive", "n_live", "vectors", "keyword", "partitions", "seq", "__weakref__")
+
+    def __init__(self, generation: int, alive: np.ndarray, vectors=None, keyword=None, partitions=None,
+                 seq: int = 0):
+        self.generation = generation
+        self.rows = len(alive)
+        self.alive = alive
+        self.n_live = int(np.count_nonzero(alive))
+        self.vectors = vectors
+        self.keyword = keyword
+        self.partitions = partitions or {}
+        self.seq = seq
+
+    def visible(self, row: int) -> bool:
+        return 0 <= row < self.rows and bool(self.alive[row])
+
+    def live_rows(self) -> np.ndarray:
+        return np.flatnonzero(self.alive)
+
+
+# ---------- 스냅샷 파일 ----------
+MANIFEST = "manifest.json"
+CHUNKS = "chunks.jsonl"
+VECTORS = "vectors.f32"
+SENT_VECTORS = "sent_vectors.f32"
+DELETED = "deleted.i32"
+
+
+LOCK_FILE = "write.lock"
+
+
+class WriteLock:
+    """스냅샷 쓰기 락. 프로세스 안에서는 재진입 가능한 RLock, shared=True 면 <dir>/write.lock 에 flock 도 건다
+    (가장 바깥 acquire 에서만 잡고 마지막 release 에서 푼다). on_acquire 는 shared 일 때만 호출."""
+
+    def __init__(self, path: str, shared: bool = False, on_acquire: Optional[Callable[[], None]] = None):
+        self.path = path
+        self.shared = shared and fcntl is not None
+        self.on_acquire = on_acquire   # 가장 바깥 acquire 직후 호출 (다른 프로세스가 쓴 변경분 따라잡기)
+        self._rlock = threading.RLock()
+        self._depth = 0
+        self._fd: Optional[int] = None
+
+    def __enter__(self):
+        self._rlock.acquire()
+        if self._depth == 0 and self.shared:
+            try:
+                os.makedirs(self.path, exist_ok=True)
+                self._fd = os.open(os.path.join(self.path, LOCK_FILE), os.O_RDWR | os.O_CREAT, 0o644)
+                fcntl.flock(self._fd, fcntl.LOCK_EX)
+                if self.on_acquire is not None:
+                    self.on_acquire()
+            except BaseException:
+                if self._fd is not None:
+                    fcntl.flock(self._fd, fcntl.LOCK_UN)
+                    os.close(self._fd)
+                    self._fd = None
+                self._rlock.release()
+                raise
+        self._depth += 1
+        return self
+
+    def __exit__(self, *exc):
+        self._depth -= 1
+        if self._depth == 0 and self._fd is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+            self._fd = None
+        self._rlock.release()
+
+
+def _empty_manifest(dim: int, model: str) -> Dict:
+    return {"format": STORE_FORMAT, "generation": 0, "dim": dim, "count": 0, "sent_count": 0,
+            "chunks_bytes": 0, "deleted_count": 0, "model": model}
+
+
+def read_manifest(path: str) -> Optional[Dict]:
+    p = os.path.join(path, MANIFEST)
+    if not os.path.exists(p):
+        return None
+    with open(p, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _write_manifest(path: str, manifest: Dict):
+    tmp = os.path.join(path, MANIFEST + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, os.path.join(path, MANIFEST))
+
+
+def _mmap_rows(path: str, name: str, n: int, dim: int) -> np.ndarray:
+    if n == 0:
+        return np.zeros((0, dim), dtype="float32")
+    return np.memmap(os.path.join(path, name), dtype="float32", mode="r", shape=(n, dim))
+
+
+def load_snapshot(path: str, dim: int, model: str) -> Tuple[List[Chunk], np.ndarray, Dict]:
+    """스냅샷 로드. 벡터(청크/문장)는 복사 없이 mmap(read-only)으로 연결.
+    스냅샷이 없으면 빈 상태, 포맷/차원/모델이 다르면 ValueError (재임베딩 필요)."""
+    manifest = read_manifest(path)
+    if manifest is None:
+        return [], np.zeros((0, dim), dtype="float32"), _empty_manifest(dim, model)
+    if (manifest.get("format") not in READABLE_FORMATS or manifest.get("dim") != dim
+            or manifest.get("model") != model):
+        raise ValueError(f"snapshot 불일치: {manifest} (expected dim={dim}, model={model})")
+    manifest = dict(manifest, format=STORE_FORMAT)
+    manifest.setdefault("sent_count", 0)
+    manifest.setdefault("deleted_count", 0)
+
+    n = int(manifest["count"])
+    with open(os.path.join(path, CHUNKS), "rb") as f:
+        data = f.read(int(manifest["chunks_bytes"]))
+    docs = _parse_chunks(data, _mmap_rows(path, SENT_VECTORS, int(manifest["sent_count"]), dim))
+    if len(docs) != n:
+        raise ValueError(f"snapshot 손상: chunks={len(docs)} manifest.count={n}")
+
+    return docs, load_vectors(path, manifest), manifest
+
+
+def _parse_chunks(data: bytes, sent_vecs: np.ndarray) -> List[Chunk]:
+    docs: List[Chunk] = []
+    for line in data.splitlines():
+        if not line.strip():
+            continue
+        rec = json.loads(line)
+        c = Chunk.from_dict(rec)
+        if "sents" in rec:
+            c.sents = np.asarray(rec["sents"], dtype="int32").reshape(-1, 2)
+            row = int(rec["sent_row"])
+            c.sent_vecs = sent_vecs[row:row + len(c.sents)]
+        docs.append(c)
+    return docs
+
+
+def load_tail(path: str, old: Dict) -> Optional[Tuple[List[Chunk], np.ndarray, np.ndarray, Dict]]:
+    """다른 프로세스가 old 이후에 추가한 부분만 읽는다 → (새 청크, 전체 벡터 mmap, 새 삭제 row, manifest).
+    바뀐 게 없으면 None. compaction 등으로 old 와 이어지지 않으면 ValueError (전체 재로드 필요)."""
+    manifest = read_manifest(path)
+    if manifest is None or manifest.get("generation") == old.get("generation"):
+        return None
+    manifest = dict(manifest, format=STORE_FORMAT)
+    manifest.setdefault("sent_count", 0)
+    manifest.setdefault("deleted_count", 0)
+    if (manifest["generation"] < old["generation"] or manifest["count"] < old["count"]
+            or manifest["chunks_bytes"] < old["chunks_bytes"]
+            or manifest["deleted_count"] < old.get("deleted_count", 0)):
+        raise ValueError(f"snapshot 이 이어지지 않음: {old} → {manifest}")
+    dim = int(manifest["dim"])
+    with open(os.path.join(path, CHUNKS), "rb") as f:
+        f.seek(int(old["chunks_bytes"]))
+        data = f.read(int(manifest["chunks_bytes"]) - int(old["chunks_bytes"]))
+    docs = _parse_chunks(data, _mmap_rows(path, SENT_VECTORS, int(manifest["sent_count"]), dim))
+    if len(docs) != manifest["count"] - old["count"]:
+        raise ValueError(f"snapshot 손상: tail chunks={len(docs)}")
+    deleted = load_deleted(path, manifest)[int(old.get("deleted_count", 0)):]
+    return docs, load_vectors(path, manifest), deleted, manifest
+
+
+def load_deleted(path: str, manifest: Dict) -> np.ndarray:
+    """삭제된 row 번호 (tombstone)"""
+    n = int(manifest.get("deleted_count", 0))
+    if n == 0:
+        return np.zeros(0, dtype="int64")
+    return np.fromfile(os.path.join(path, DELETED), dtype="int32", count=n).astype("int64")
+
+
+def load_vectors(path: str, manifest: Dict) -> np.ndarray:
+    """manifest 기준 전체 청크 벡터를 mmap(read-only)으로 반환."""
+    return _mmap_rows(path, VECTORS, int(manifest["count"]), int(manifest["dim"]))
+
+
+def _append_bytes(file_path: str, valid_bytes: int, payload: bytes):
+    # manifest 이후의 잔여 바이트(이전 크래시 흔적)는 먼저 잘라낸다
+    with open(file_path, "ab") as f:
+        f.truncate(valid_bytes)
+        f.write(payload)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def append_snapshot(path: str, manifest: Dict, new_docs: List[Chunk], vecs: np.ndarray,
+                    deleted_rows: Iterable[int] = ()) -> Dict:
+    """새 청크/벡터(+ 문장 오프셋/벡터)와 삭제 row 를 파일 끝에 추가하고 manifest 를 갱신해 반환."""
+    os.makedirs(path, exist_ok=True)
+    dim = int(manifest["dim"])
+    vecs = np.ascontiguousarray(vecs, dtype="float32").reshape(-1, dim)
+    if len(new_docs) != vecs.shape[0]:
+        raise ValueError(f"docs/vecs 길이 불일치: {len(new_docs)} != {vecs.shape[0]}")
+    deleted = np.asarray(list(deleted_rows), dtype="int32")
+
+    sent_row = int(manifest.get("sent_count", 0))
+    records, sent_blocks = [], []
+    for d in new_docs:
+        rec = d.to_dict()
+        rec["hash"] = d.hash
+        if d.sents is not None and d.sent_vecs is not None:
+            rec["sents"] = d.sents.tolist()
+            rec["sent_row"] = sent_row
+            sent_row += len(d.sents)
+            sent_blocks.append(np.ascontiguousarray(d.sent_vecs, dtype="float32").reshape(-1, dim))
+        records.append((json.dumps(rec, ensure_ascii=False) + "\n").encode("utf-8"))
+    payload = b"".join(records)
+    sent_payload = b"".join(b.tobytes() for b in sent_blocks)
+
+    _append_bytes(os.path.join(path, CHUNKS), int(manifest["chunks_bytes"]), payload)
+    _append_bytes(os.path.join(path, VECTORS), int(manifest["count"]) * dim * 4, vecs.tobytes())
+    _append_bytes(os.path.join(path, SENT_VECTORS), int(manifest.get("sent_count", 0)) * dim * 4,
+                  sent_payload)
+    _append_bytes(os.path.join(path, DELETED), int(manifest.get("deleted_count", 0)) * 4, deleted.tobytes())
+
+    manifest = dict(manifest)
+    manifest["count"] = int(manifest["count"]) + len(new_docs)
+    manifest["sent_count"] = sent_row
+    manifest["chunks_bytes"] = int(manifest["chunks_bytes"]) + len(payload)
+    manifest["deleted_count"] = int(manifest.get("deleted_count", 0)) + len(deleted)
+    manifest["generation"] = int(manifest["generation"]) + 1
+    _write_manifest(path, manifest)
+    return manifest
+
+
+def map_sent_vectors(path: str, manifest: Dict, docs: List[Chunk], sent_row: int):
+    """append_snapshot 으로 기록한 docs 의 문장 벡터를 힙 배열에서 sent_vectors.f32 mmap 구간으로 바꾼다
+    (ingest 한 청크의 문장 벡터가 메모리에 계속 남지 않도록). sent_row: 기록 전 manifest 의 sent_count.
+    이번에 추가된 구간만 mmap 한다."""
+    dim = int(manifest["dim"])
+    n = int(manifest["sent_count"]) - sent_row
+    if n <= 0:
+        return
+    sent = np.memmap(os.path.join(path, SENT_VECTORS), dtype="float32", mode="r",
+                     offset=sent_row * dim * 4, shape=(n, dim))
+    row = 0
+    for d in docs:   # append_snapshot 과 같은 순서로 배정
+        if d.sents is not None and d.sent_vecs is not None:
+            d.sent_vecs = sent[row:row + len(d.sents)]
+            row += len(d.sents)
+
+
+def compact_snapshot(path: str, dim: int, model: str, min_ratio: float) -> bool:
+    """삭제된 row 비율이 min_ratio 이상이면 살아있는 row 만으로 스냅샷을 다시 쓴다 (row 번호가 바뀜).
+    새 스냅샷을 옆 디렉터리에 만든 뒤 디렉터리째 교체. ANN 저장본은 row 가 달라지므로 버린다."""
+    manifest = read_manifest(path)
+    if manifest is None or not manifest.get("deleted_count"):
+        return False
+    if manifest["deleted_count"] < min_ratio * max(int(manifest["count"]), 1):
+        return False
+    docs, vecs, manifest = load_snapshot(path, dim, model)
+    alive = np.ones(len(docs), dtype=bool)
+    alive[load_deleted(path, manifest)] = False
+    live = np.flatnonzero(alive)
+    new_path, old_path = path + ".compact", path + ".old"
+    shutil.rmtree(new_path, ignore_errors=True)
+    os.makedirs(new_path)
+    base = dict(_empty_manifest(dim, model), generation=int(manifest["generation"]))
+    append_snapshot(new_path, base, [docs[r] for r in live], vecs[live])
+    del docs, vecs   # mmap 해제 후 교체
+    shutil.rmtree(old_path, ignore_errors=True)
+    os.replace(path, old_path)
+    os.replace(new_path, path)
+    shutil.rmtree(old_path, ignore_errors=True)
+    return True
+
+
+def recover_compaction(path: str):
+    """compaction 도중 죽어 path 가 없고 .compact 만 남은 경우 복구"""
+    if not os.path.exists(path) and read_manifest(path + ".compact") is not None:
+        os.replace(path + ".compact", path)
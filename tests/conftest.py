@@ -0,0 +1,55 @@
+# 테스트 공용: 저장소 루트를 import 경로에 넣고, app 은 가짜 모델로 임시 스냅샷 디렉터리에서 한 번만 띄운다
+import os, sys, hashlib
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+DIM = 64
+
+
+def unit_rows(n: int, dim: int = DIM, seed: int = 0) -> np.ndarray:
+    v = np.random.default_rng(seed).normal(size=(n, dim)).astype("float32")
+    return v / np.linalg.norm(v, axis=1, keepdims=True)
+
+
+class FakeEmbedder:
+    """단어 해시 bag-of-words 임베딩 (같은 단어가 많으면 가깝다). SentenceTransformer.encode 모양"""
+
+    def __init__(self, dim: int):
+        self.dim = dim
+
+    def encode(self, texts, batch_size=32, normalize_embeddings=True):
+        out = np.zeros((len(texts), self.dim), dtype="float32")
+        for i, t in enumerate(texts):
+            for w in t.split():
+                out[i, int(hashlib.md5(w.encode("utf-8")).hexdigest()[:8], 16) % self.dim] += 1.0
+            out[i, 0] += 1e-3
+            out[i] /= np.linalg.norm(out[i])
+        return out
+
+    def get_sentence_embedding_dimension(self):
+        return self.dim
+
+
+class FakeReranker:
+    """질의와 겹치는 단어 수 (FlagReranker.compute_score 모양, 쌍 1개면 float)"""
+
+    def compute_score(self, pairs, batch_size=32):
+        s = [float(len(set(q.split()) & set(p.split()))) for q, p in pairs]
+        return s if len(s) != 1 else s[0]
+
+
+def _ready(slot, model):
+    slot.model, slot.state = model, "ready"
+    slot._done.set()
+
+
+@pytest.fixture(scope="session")
+def app(tmp_path_factory):
+    os.environ.update({"QA_STORE_DIR": str(tmp_path_factory.mktemp("store")), "EMB_DIM": str(DIM),
+                       "QA_LLM": "none", "QA_PRELOAD": "0", "QA_KEYWORD": "bm25", "QA_SHARED": "0"})
+    import app as app_module
+    _ready(app_module.EMB, FakeEmbedder(DIM))
+    _ready(app_module.RERANK, FakeReranker())
+    return app_module
@@ -0,0 +1,66 @@
+# app 수준 동작: 가짜 임베딩/리랭커로 ingest → 검색 (LLM 없음, conftest 의 app fixture)
+import gc
+
+MANUAL = """[섹션 1] 주문/배송
+- 주문은 결제 완료 시 접수됩니다.
+- 기본 배송 소요 기간은 2~3영업일입니다.
+
+[섹션 2] 반품/교환
+- 반품 가능 기간은 수령일 포함 7일입니다.
+- 교환은 동일 상품에 한하여 1회 가능합니다.
+"""
+
+
+def ingest(app, title: str, text: str):
+    return app.ingest_stream((title, page, ch) for page, ch in app.text_pieces(text))
+
+
+def long_manual(n: int) -> str:
+    return "\n\n".join(f"[섹션 {i}] 안내 {i}\n- 항목 {i} 의 처리 기간은 {i}일입니다. 문의는 고객센터 {i}번으로 해 주세요.\n"
+                       f"- 항목 {i} 의 비용은 {i * 1000}원이며 환불 기준은 별도 공지를 따릅니다." for i in range(n))
+
+
+def test_upsert_and_delete_counts(app):
+    st = ingest(app, "upsert", MANUAL)
+    n = st["added"]
+    assert n >= 1 and st["deleted"] == 0 and len(app.DOCS.by_title("upsert")) == n
+    assert ingest(app, "upsert", MANUAL) == {"added": 0, "unchanged": n, "deleted": 0}
+    assert app.delete_title("upsert") == n
+    assert not app.DOCS.by_title("upsert") and app.delete_title("upsert") == 0
+
+
+def test_edit_reembeds_only_touched_chunks(app):
+    text = long_manual(12)
+    ingest(app, "edit", text)
+    n = len(app.DOCS.by_title("edit"))
+    assert n >= 4
+    i = text.index("[섹션 3]")
+    st = ingest(app, "edit", text[:i + 20] + "12345" + text[i + 20:])
+    assert st["added"] <= 2 and st["unchanged"] >= n - 2
+    app.delete_title("edit")
+
+
+def test_pinned_view_survives_update(app):
+    ingest(app, "pin", "반품 가능 기간은 수령일 포함 7일입니다.")
+    view = app.pin_view()
+    assert [c.title for c in app.search_hybrid("반품 기간", 4, view=view)] == ["pin"]
+    ingest(app, "pin", "반품 가능 기간은 수령일 포함 8일입니다.")   # 같은 title 갱신 → 이전 청크 삭제
+    old = app.search_hybrid("반품 기간", 4, view=view)
+    assert [c.text for c in old] == ["반품 가능 기간은 수령일 포함 7일입니다."]
+    assert [c.text for c in app.search_hybrid("반품 기간", 4)] == ["반품 가능 기간은 수령일 포함 8일입니다."]
+    del view, old
+    gc.collect()
+    app.delete_title("pin")
+    assert app.DOCS.n_retired == 0
+
+
+def test_collection_filter(app):
+    ingest(app, "col-a", "반품 가능 기간은 수령일 포함 7일입니다.")
+    ingest(app, "col-b", "반품 배송비는 고객 부담입니다.")
+    view = app.pin_view()
+    got = app.search_hybrid("반품", 4, view=view, collections=("col-b",))
+    assert got and {c.title for c in got} == {"col-b"}
+    assert app.search_hybrid("반품", 4, view=view, collections=("없는-title",)) == []
+    assert {c.title for c in app.search_hybrid("반품", 4, view=view)} >= {"col-a", "col-b"}
+    app.delete_title("col-a")
+    app.delete_title("col-b")
@@ -0,0 +1,37 @@
+import numpy as np
+
+from bm25 import BM25Index
+
+TEXTS = ["반품은 수령일 포함 7일 이내 가능합니다", "교환은 동일 상품에 한하여 1회 가능합니다",
+         "배송은 2~3영업일 소요됩니다", "카드 결제 취소는 3~5일 소요", "J001 상품 색상은 Yellow Green",
+         "보증 기간은 구매일로부터 1년", "반품 배송비는 고객 부담입니다", "현금영수증은 마이페이지에서 발급"]
+QUERIES = ["반품 기간", "배송 소요", "교환 가능", "J001 색상", "영수증 발급"]
+
+
+def build(rows):
+    idx = BM25Index()
+    idx.add(rows, [TEXTS[r] for r in rows])
+    return idx
+
+
+def test_remove_matches_fresh_build():
+    idx = build(range(len(TEXTS)))
+    gone = [0, 3, 6]
+    idx.remove(gone, [TEXTS[r] for r in gone])
+    fresh = build([r for r in range(len(TEXTS)) if r not in gone])
+    a, b = idx.stats(), fresh.stats()
+    assert (a["docs"], a["terms"], a["postings"]) == (b["docs"], b["terms"], b["postings"])
+    assert idx.state.total_len == fresh.state.total_len
+    for q in QUERIES:
+        got, want = idx.search(q, 5), fresh.search(q, 5)
+        assert [r for _, r in got] == [r for _, r in want]
+        assert np.allclose([s for s, _ in got], [s for s, _ in want])
+        assert not {r for _, r in got} & set(gone)
+
+
+def test_pinned_state_survives_remove():
+    idx = build(range(len(TEXTS)))
+    pinned = idx.state
+    idx.remove([0], [TEXTS[0]])
+    assert 0 in [r for _, r in idx.search("반품 수령일", 3, state=pinned)]
+    assert 0 not in [r for _, r in idx.search("반품 수령일", 3)]
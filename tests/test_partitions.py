@@ -0,0 +1,48 @@
+import numpy as np
+
+import partitions
+from bm25 import BM25Index
+from partitions import Partitions
+
+TEXTS = {0: ("a", "반품은 7일 이내"), 1: ("b", "반품 불가 상품 안내"), 2: ("a", "배송은 2일"),
+         3: ("b", "교환은 1회"), 4: ("c", "반품 배송비 안내")}
+
+
+def make():
+    parts = Partitions()
+    rows = sorted(TEXTS)
+    parts.add(rows, [TEXTS[r][0] for r in rows], [TEXTS[r][1] for r in rows])
+    return parts
+
+
+def test_collection_rows_and_counts():
+    parts = make()
+    v = parts.versions()
+    assert {t: s["docs"] for t, s in parts.status().items()} == {"a": 2, "b": 2, "c": 1}
+    assert partitions.collection_rows([v["a"]]).tolist() == [0, 2]
+    assert partitions.collection_rows([v["a"], v["b"]]).tolist() == [0, 1, 2, 3]
+    assert partitions.collection_rows([]).tolist() == []
+
+
+def test_keyword_search_only_in_collection_and_matches_bm25():
+    parts = make()
+    v = parts.versions()
+    hits = partitions.search_keyword([v["a"], v["c"]], "반품 안내", 5)
+    assert {r for _, r in hits} <= {0, 2, 4}
+    # 파티션 안 통계 = 그 title 만으로 만든 BM25
+    ref = BM25Index()
+    ref.add([0, 2], [TEXTS[0][1], TEXTS[2][1]])
+    assert [(round(s, 6), r) for s, r in partitions.search_keyword([v["a"]], "반품", 5)] == \
+           [(round(s, 6), r) for s, r in ref.search("반품", 5)]
+
+
+def test_remove_drops_empty_collection_and_keeps_pinned_version():
+    parts = make()
+    pinned = parts.versions()
+    parts.remove([4], [TEXTS[4][1]])
+    assert "c" not in parts.versions()
+    assert pinned["c"].live.tolist() == [4]
+    assert partitions.search_keyword([pinned["c"]], "반품", 5)[0][1] == 4
+    parts.remove([0], [TEXTS[0][1]])
+    assert parts.versions()["a"].live.tolist() == [2]
+    assert not partitions.search_keyword([parts.versions()["a"]], "반품", 5)
@@ -0,0 +1,94 @@
+import gc
+import numpy as np
+
+import store
+from conftest import DIM, unit_rows
+from store import Chunk, CorpusView, DocStore
+
+MODEL = "test-model"
+
+
+def chunks(title: str, n: int, start: int = 0):
+    return [Chunk(f"{title}:{start + i}", title, start + i, f"{title} 본문 {start + i}") for i in range(n)]
+
+
+def publish(docs: DocStore, prev: CorpusView, removed=()) -> CorpusView:
+    # app.publish_view 와 같은 방식: 이전 alive + 새 row, 삭제 row 끔
+    alive = np.zeros(docs.n_rows, dtype=bool)
+    alive[:prev.rows] = prev.alive
+    alive[prev.rows:] = [docs.alive(r) for r in range(prev.rows, docs.n_rows)]
+    alive[list(removed)] = False
+    view = CorpusView(prev.generation + 1, alive, seq=prev.seq + 1)
+    docs.publish(view)
+    return view
+
+
+def test_docstore_upsert_delete_counts():
+    docs = DocStore()
+    docs.extend(chunks("a", 3) + chunks("b", 2))
+    assert len(docs) == 5 and docs.titles() == {"a": 3, "b": 2}
+    rows = docs.remove(["a:1", "missing"])
+    assert rows == [1] and len(docs) == 4 and docs.n_rows == 5
+    assert docs.titles() == {"a": 2, "b": 2} and docs.get("a:1") is None
+    docs.extend(chunks("a", 1, start=5))
+    assert docs.titles()["a"] == 3 and docs.next_idx == 6
+    assert [c.id for c in docs] == ["a:0", "a:2", "b:0", "b:1", "a:5"]
+    docs.remove([c.id for c in docs.by_title("b")])
+    assert "b" not in docs.titles() and docs.live_rows().tolist() == [0, 2, 5]
+
+
+def test_pinned_view_keeps_removed_chunks_until_released():
+    docs = DocStore()
+    docs.extend(chunks("a", 2))
+    v1 = publish(docs, CorpusView(0, np.zeros(0, dtype=bool)))
+    # 같은 title 갱신: 0번 교체 → 새 row 2
+    rows = docs.remove(["a:0"])
+    docs.extend(chunks("a", 1, start=2))
+    v2 = publish(docs, v1, rows)
+    assert v1.visible(0) and not v2.visible(0) and v2.visible(2) and not v1.visible(2)
+    assert docs[0].id == "a:0" and docs.find("a:0") == 0 and docs.n_retired == 1   # v1 이 아직 잡고 있음
+    assert not docs.alive(0) and docs.get("a:0") is None
+    del v1
+    gc.collect()
+    v3 = publish(docs, v2)
+    assert docs[0] is None and docs.find("a:0") is None and docs.n_retired == 0
+    assert [c.id for c in docs if v3.visible(docs.row(c.id))] == ["a:1", "a:2"]
+
+
+def test_snapshot_round_trip_and_compaction(tmp_path):
+    path = str(tmp_path / "snap")
+    vecs = unit_rows(10)
+    docs = chunks("a", 6) + chunks("b", 4)
+    for d in docs[:3]:
+        d.sents = np.array([[0, 2], [3, 5]], dtype="int32")
+        d.sent_vecs = unit_rows(2, seed=d.chunk_idx + 10)
+    m = store.append_snapshot(path, store._empty_manifest(DIM, MODEL), docs[:6], vecs[:6])
+    m = store.append_snapshot(path, m, docs[6:], vecs[6:], deleted_rows=[1, 7])
+    m = store.append_snapshot(path, m, [], np.zeros((0, DIM), dtype="float32"), deleted_rows=[2, 3])
+
+    loaded, lvecs, lm = store.load_snapshot(path, DIM, MODEL)
+    assert [c.id for c in loaded] == [c.id for c in docs] and lm["generation"] == 3
+    assert np.array_equal(np.asarray(lvecs), vecs)
+    assert np.array_equal(np.asarray(loaded[2].sent_vecs), docs[2].sent_vecs)
+    assert sorted(store.load_deleted(path, lm).tolist()) == [1, 2, 3, 7]
+
+    # 다른 프로세스가 이어 쓴 꼬리만 읽기
+    tail = store.load_tail(path, dict(m, generation=1, count=6, chunks_bytes=_bytes_of(path, 6),
+                                      deleted_count=0, sent_count=6))
+    assert [c.id for c in tail[0]] == [c.id for c in docs[6:]] and sorted(tail[2].tolist()) == [1, 2, 3, 7]
+
+    # 삭제 4/10 ≥ 0.3 → 살아있는 row 만으로 다시 씀 (row 번호 변경)
+    del loaded, lvecs, tail
+    assert store.compact_snapshot(path, DIM, MODEL, 0.3)
+    loaded, lvecs, lm = store.load_snapshot(path, DIM, MODEL)
+    live = [0, 4, 5, 6, 8, 9]
+    assert [c.id for c in loaded] == [docs[r].id for r in live]
+    assert np.array_equal(np.asarray(lvecs), vecs[live])
+    assert np.array_equal(np.asarray(loaded[0].sent_vecs), docs[0].sent_vecs)
+    assert lm.get("deleted_count", 0) == 0 and lm["generation"] > 3   # generation 은 되돌아가지 않는다 (캐시 키)
+    assert not store.compact_snapshot(path, DIM, MODEL, 0.3)
+
+
+def _bytes_of(path: str, n: int) -> int:
+    with open(f"{path}/{store.CHUNKS}", "rb") as f:
+        return sum(len(line) for _, line in zip(range(n), f))
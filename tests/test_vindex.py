@@ -0,0 +1,92 @@
+import numpy as np
+import pytest
+
+from conftest import DIM, unit_rows
+from vindex import IndexConfig, VectorIndex, TOMBSTONE_RATIO
+
+
+def make_index(kind: str, n: int = 2000, delta_max: int = 256):
+    cfg = IndexConfig()
+    cfg.kind, cfg.storage, cfg.delta_max, cfg.shared = kind, "float", delta_max, False
+    cfg.ef_search, cfg.nprobe = 128, 64
+    vecs = unit_rows(n)
+    idx = VectorIndex(DIM, cfg)
+    if kind == "flat":
+        idx.add(vecs, np.arange(n))
+    else:
+        idx.maybe_promote(vecs, np.arange(n))
+    return idx, vecs
+
+
+def brute(qv: np.ndarray, vecs: np.ndarray, rows: np.ndarray, k: int) -> np.ndarray:
+    scores = vecs[rows] @ qv[0]
+    return rows[np.argsort(-scores, kind="stable")[:k]]
+
+
+def recall(got: np.ndarray, want: np.ndarray) -> float:
+    return len(set(got.tolist()) & set(want.tolist())) / len(want)
+
+
+@pytest.mark.parametrize("kind", ["flat", "hnsw", "ivf"])
+def test_tombstones_filtered_like_brute_force(kind):
+    idx, vecs = make_index(kind)
+    dead = np.random.default_rng(1).choice(len(vecs), 150, replace=False)   # TOMBSTONE_RATIO 미만 → tombstone 로 남음
+    idx.remove(dead)
+    assert len(idx.deleted) == len(dead)
+    live = np.setdiff1d(np.arange(len(vecs)), dead)
+    for q in unit_rows(20, seed=2):
+        qv = q.reshape(1, -1)
+        D, I = idx.search(qv, 10)
+        assert not set(I[0].tolist()) & set(dead.tolist())
+        want = brute(qv, vecs, live, 10)
+        if kind == "flat":
+            assert I[0].tolist() == want.tolist()
+        else:
+            assert recall(I[0], want) >= 0.8
+
+
+def test_delta_rows_filtered_before_merge():
+    idx, vecs = make_index("flat", n=1000, delta_max=10_000)
+    extra = unit_rows(50, seed=3)
+    idx.add(extra, np.arange(1000, 1050))
+    assert idx.merges == 0   # 전부 delta (merge 전)
+    assert idx.search(extra[:1], 1)[1][0][0] == 1000
+    idx.remove(range(1000, 1050))
+    D, I = idx.search(extra[:1], 5)
+    assert not set(I[0].tolist()) & set(range(1000, 1050))
+
+
+def test_tombstone_ratio_triggers_merge():
+    idx, vecs = make_index("flat", n=1000)
+    idx.remove(range(int(TOMBSTONE_RATIO * 1000)))
+    assert len(idx.deleted) == 100   # 비율 이하: 아직 tombstone
+    idx.remove([500])
+    assert len(idx.deleted) == 0 and idx.index.ntotal == 1000 - 101
+
+
+@pytest.mark.parametrize("kind", ["flat", "hnsw", "ivf"])
+def test_collection_rows_filter(kind):
+    idx, vecs = make_index(kind)
+    idx.remove(range(0, 2000, 50))
+    rows = np.arange(100, 400)   # 15%
+    live = np.setdiff1d(rows, np.arange(0, 2000, 50))
+    for q in unit_rows(10, seed=4):
+        qv = q.reshape(1, -1)
+        D, I = idx.search(qv, 5, exact=vecs, rows=live)
+        got = I[0][I[0] >= 0]
+        assert set(got.tolist()) <= set(live.tolist())
+        assert recall(got, brute(qv, vecs, live, 5)) >= (1.0 if kind == "flat" else 0.8)
+    D, I = idx.search(unit_rows(1, seed=5), 5, rows=np.zeros(0, dtype="int64"))
+    assert (I == -1).all()
+
+
+def test_pinned_version_unaffected_by_later_writes():
+    idx, vecs = make_index("flat", n=500, delta_max=64)
+    qv = vecs[7:8]
+    pinned = idx.version
+    idx.remove([7])
+    idx.add(unit_rows(100, seed=6), np.arange(500, 600))   # merge 포함
+    D, I = idx.search(qv, 1, version=pinned)
+    assert I[0][0] == 7
+    D, I = idx.search(qv, 1)
+    assert I[0][0] != 7
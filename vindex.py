@@ -0,0 +1,648 @@
+# vindex.py — 벡터 인덱스 (flat / HNSW / IVF) + 코퍼스 크기에 따른 자동 승격
+# 환경변수:
+#   QA_INDEX          : auto | flat | hnsw | ivf   (기본 auto)
+#   QA_ANN_KIND       : auto 모드에서 승격할 ANN 종류 (hnsw | ivf, 기본 hnsw)
+#   QA_ANN_THRESHOLD  : auto 모드 승격 기준 벡터 수 (기본 50000)
+#   QA_HNSW_M / QA_HNSW_EF_CONSTRUCTION / QA_HNSW_EF_SEARCH
+#   QA_IVF_NLIST (0=자동) / QA_IVF_NPROBE
+#   QA_VEC_STORAGE    : float | sq8 | pq   벡터 저장 방식 (기본 float, sq8 = 차원당 1바이트, pq = 벡터당 QA_PQ_M 바이트)
+#   QA_PQ_M           : PQ 부분공간 수 (dim 의 약수, 기본 64 → 1024차원 64바이트)
+#   QA_DELTA_MAX      : base 에 합치기 전까지 delta(전수 내적)에 쌓아 두는 최대 벡터 수 (기본 4096)
+#   QA_VEC_RESCORE    : 양자화 인덱스에서 top_k × R 후보를 뽑아 float 벡터(스냅샷 mmap)로 재계산 (0=끔, 기본 4)
+#   QA_SHARED         : 1 이면 여러 워커 프로세스가 같은 store 를 공유 (base 인덱스를 항상 파일로 저장하고 mmap 으로 열어
+#                       페이지 캐시를 공유, merge 한 워커가 새 파일을 쓰면 나머지는 follow() 로 바꿔 연다)
+
+import os, json, time, logging, threading
+from typing import Dict, FrozenSet, Optional
+import numpy as np
+import faiss
+
+log = logging.getLogger("qa.vindex")
+
+ANN_FILE = "ann.index"    # 단일 프로세스 저장본 (공유 모드는 ann-<ns>.index 로 버전마다 새 파일)
+ANN_META = "ann.json"
+IVF_MIN_TRAIN = 1000     # IVF 학습에 필요한 최소 벡터 수 (미만이면 flat 유지)
+SQ_MIN_TRAIN = 1000      # sq8 범위 학습 최소 벡터 수 (미만이면 float 유지)
+PQ_MIN_TRAIN = 256 * 39  # pq 코드북(부분공간당 256 centroid) 학습 최소 벡터 수
+STORAGES = ("float", "sq8", "pq")
+RESAVE_RATIO = 0.1       # 저장본 이후 추가분이 이 비율을 넘으면 ANN 재저장
+TOMBSTONE_RATIO = 0.1    # 삭제 row 가 base 의 이 비율을 넘으면 정리 (flat/IVF 는 merge, HNSW 는 maybe_promote 에서 재구축)
+OVERFETCH_MAX = 4        # selector 를 못 쓰는 인덱스(flat pq)에서 삭제 row 를 거르려고 더 가져오는 최대 배수
+FILTER_EF_MAX = 1024     # 필터 검색에서 HNSW efSearch 를 늘리는 상한
+EXACT_CHUNK = 16384      # 필터 범위 전수 내적을 나눠 읽는 행 수
+
+
+def _env_int(name: str, default: int) -> int:
+    return int(os.environ.get(name, str(default)))
+
+
+class IndexConfig:
+    def __init__(self):
+        self.kind = os.environ.get("QA_INDEX", "auto")
+        self.ann_kind = os.environ.get("QA_ANN_KIND", "hnsw")
+        self.threshold = _env_int("QA_ANN_THRESHOLD", 50_000)
+        self.hnsw_m = _env_int("QA_HNSW_M", 32)
+        self.ef_construction = _env_int("QA_HNSW_EF_CONSTRUCTION", 200)
+        self.ef_search = _env_int("QA_HNSW_EF_SEARCH", 64)
+        self.nlist = _env_int("QA_IVF_NLIST", 0)
+        self.nprobe = _env_int("QA_IVF_NPROBE", 16)
+        self.storage = os.environ.get("QA_VEC_STORAGE", "float")
+        self.pq_m = _env_int("QA_PQ_M", 64)
+        self.rescore = _env_int("QA_VEC_RESCORE", 4)
+        self.delta_max = _env_int("QA_DELTA_MAX", 4096)
+        self.shared = os.environ.get("QA_SHARED", "0") == "1"
+        if self.storage not in STORAGES:
+            raise ValueError(f"unknown QA_VEC_STORAGE: {self.storage}")
+
+    def target_kind(self, n: int) -> str:
+        kind = self.kind
+        if kind == "auto":
+            kind = self.ann_kind if n >= self.threshold else "flat"
+        if kind == "ivf" and n < IVF_MIN_TRAIN:
+            return "flat"
+        return kind
+
+    def target_storage(self, n: int) -> str:
+        # 학습할 벡터가 모자라면 float 로 시작했다가 maybe_promote 에서 전환
+        if self.storage == "sq8" and n < SQ_MIN_TRAIN:
+            return "float"
+        if self.storage == "pq" and n < PQ_MIN_TRAIN:
+            return "float"
+        return self.storage
+
+    def as_dict(self) -> Dict:
+        return dict(self.__dict__)
+
+
+def build_index(kind: str, dim: int, vecs: np.ndarray, cfg: IndexConfig,
+                ids: Optional[np.ndarray] = None, storage: str = "float"):
+    """kind 인덱스를 새로 만들고 vecs 를 ids(기본 0..n-1, = DOCS row)로 추가. (normalized + inner-product = cosine)
+    flat/HNSW 는 IndexIDMap 으로 감싸고, IVF 는 자체 id 를 쓴다 → 검색 결과가 곧 DOCS row.
+    storage: float(원본) | sq8(스칼라 8bit) | pq(product quantization, cfg.pq_m 바이트). 양자화는 vecs 로 학습."""
+    n = vecs.shape[0]
+    metric = faiss.METRIC_INNER_PRODUCT
+    sq8 = faiss.ScalarQuantizer.QT_8bit
+    if storage == "pq" and dim % cfg.pq_m:
+        raise ValueError(f"QA_PQ_M={cfg.pq_m} 가 dim={dim} 의 약수가 아님")
+    if kind == "flat":
+        if storage == "sq8":
+            base = faiss.IndexScalarQuantizer(dim, sq8, metric)
+        elif storage == "pq":
+            base = faiss.IndexPQ(dim, cfg.pq_m, 8, metric)
+        else:
+            base = faiss.IndexFlatIP(dim)
+        index = faiss.IndexIDMap(base)
+    elif kind == "hnsw":
+        if storage == "sq8":
+            base = faiss.IndexHNSWSQ(dim, sq8, cfg.hnsw_m, metric)
+        elif storage == "pq":
+            base = faiss.IndexHNSWPQ(dim, cfg.pq_m, cfg.hnsw_m, 8, metric)
+        else:
+            base = faiss.IndexHNSWFlat(dim, cfg.hnsw_m, metric)
+        base.hnsw.efConstruction = cfg.ef_construction
+        index = faiss.IndexIDMap(base)
+    elif kind == "ivf":
+        # 셀당 학습 샘플이 최소 39개는 되도록 nlist 제한
+        nlist = cfg.nlist or int(4 * np.sqrt(max(n, 1)))
+        nlist = max(1, min(nlist, n // 39))
+        quantizer = faiss.IndexFlatIP(dim)
+        if storage == "sq8":
+            index = faiss.IndexIVFScalarQuantizer(quantizer, dim, nlist, sq8, metric)
+        elif storage == "pq":
+            index = faiss.IndexIVFPQ(quantizer, dim, nlist, cfg.pq_m, 8, metric)
+        else:
+            index = faiss.IndexIVFFlat(quantizer, dim, nlist, metric)
+    else:
+        raise ValueError(f"unknown index kind: {kind}")
+    if not index.is_trained:
+        index.train(np.ascontiguousarray(vecs, dtype="float32"))
+    apply_search_params(index, cfg)
+    if n:
+        if ids is None:
+            ids = np.arange(n, dtype="int64")
+        index.add_with_ids(np.ascontiguousarray(vecs, dtype="float32"), np.asarray(ids, dtype="int64"))
+    return index
+
+
+def _base(index):
+    if isinstance(index, faiss.IndexIDMap):
+        return faiss.downcast_index(index.index)
+    return index
+
+
+def index_kind(index) -> str:
+    base = _base(index)
+    if isinstance(base, faiss.IndexHNSW):
+        return "hnsw"
+    if isinstance(base, faiss.IndexIVF):
+        return "ivf"
+    return "flat"
+
+
+def _codes(index):
+    # 벡터 코드를 실제로 보관하는 인덱스 (HNSW 는 storage)
+    base = _base(index)
+    if isinstance(base, faiss.IndexHNSW):
+        return faiss.downcast_index(base.storage)
+    return base
+
+
+def index_storage(index) -> str:
+    codes = _codes(index)
+    if isinstance(codes, (faiss.IndexScalarQuantizer, faiss.IndexIVFScalarQuantizer)):
+        return "sq8"
+    if isinstance(codes, (faiss.IndexPQ, faiss.IndexIVFPQ)):
+        return "pq"
+    return "float"
+
+
+def code_size(index) -> int:
+    """벡터 1개당 코드 바이트 (HNSW 링크/IVF 리스트 id 등 부가 구조 제외)"""
+    return int(_codes(index).code_size)
+
+
+def rescore(qv: np.ndarray, D: np.ndarray, I: np.ndarray, vecs: np.ndarray, k: int):
+    """양자화 인덱스가 고른 후보(shortlist)를 float 벡터(row 순, 스냅샷 mmap)와의 정확한 내적으로 다시 정렬 → 상위 k.
+    vecs 에 아직 없는 row(스냅샷 기록 전)는 근사 점수를 그대로 쓴다."""
+    n = vecs.shape[0]
+    outD = np.full((I.shape[0], k), -np.inf, dtype="float32")
+    outI = np.full((I.shape[0], k), -1, dtype="int64")
+    for qi in range(I.shape[0]):
+        valid = I[qi] != -1
+        ids, scores = I[qi, valid], D[qi, valid].astype("float32")
+        exact = ids < n
+        if exact.any():
+            scores[exact] = np.asarray(vecs[ids[exact]], dtype="float32") @ qv[qi]
+        order = np.argsort(-scores, kind="stable")[:k]
+        outD[qi, :len(order)] = scores[order]
+        outI[qi, :len(order)] = ids[order]
+    return outD, outI
+
+
+def exact_search(qv: np.ndarray, vecs: np.ndarray, rows: np.ndarray, k: int):
+    """vecs[rows] (row 순 float 벡터, 스냅샷 mmap) 와의 전수 내적 상위 k → (D, I), I = row.
+    EXACT_CHUNK 행씩 읽어 임시 메모리를 묶어 둔다."""
+    D = np.zeros((qv.shape[0], 0), dtype="float32")
+    I = np.zeros((qv.shape[0], 0), dtype="int64")
+    for s in range(0, len(rows), EXACT_CHUNK):
+        r = rows[s:s + EXACT_CHUNK]
+        S = qv @ np.asarray(vecs[r], dtype="float32").T
+        D, I = topk(np.hstack([D, S]), np.hstack([I, np.broadcast_to(r, S.shape)]), k)
+    return D, I
+
+
+def apply_search_params(index, cfg: IndexConfig):
+    kind, base = index_kind(index), _base(index)
+    if kind == "hnsw":
+        base.hnsw.efSearch = cfg.ef_search
+    elif kind == "ivf":
+        base.nprobe = cfg.nprobe
+
+
+class IndexVersion:
+    """게시된 벡터 인덱스 버전 (읽기 전용). 검색은 버전 하나를 잡고(pin) 락 없이 수행한다.
+    base: FAISS 인덱스 (게시 후 변경하지 않음), delta: base 이후 추가된 float 벡터 버퍼의 앞 n_delta 행
+    (writer 는 버퍼 뒤쪽에만 쓰므로 이전 버전이 보는 구간은 바뀌지 않는다),
+    deleted: base/delta 에 남아 있는 삭제 row (FAISS selector 로 검색 중에 거른다), base_rows: base 가 반영한 row 수."""
+    __slots__ = ("base", "delta", "delta_ids", "n_delta", "deleted", "base_rows", "_dead")
+
+    def __init__(self, base, delta: Optional[np.ndarray] = None, delta_ids: Optional[np.ndarray] = None,
+                 n_delta: int = 0, deleted: FrozenSet[int] = frozenset(), base_rows: int = 0):
+        self.base = base
+        self.delta = delta
+        self.delta_ids = delta_ids
+        self.n_delta = n_delta
+        self.deleted = deleted
+        self.base_rows = base_rows
+        self._dead: Optional[np.ndarray] = None
+
+    @property
+    def ntotal(self) -> int:
+        return self.base.ntotal + self.n_delta - len(self.deleted)
+
+    def dead_mask(self) -> np.ndarray:
+        # 삭제 row 의 bool 마스크 (id 순). 버전이 불변이라 처음 쓸 때 한 번만 만든다
+        if self._dead is None:
+            self._dead = id_mask(np.fromiter(self.deleted, dtype="int64", count=len(self.deleted)))
+        return self._dead
+
+    def search(self, qv: np.ndarray, k: int, allow: Optional[np.ndarray] = None):
+        """base 검색 + delta 전수 내적을 합쳐 상위 k (삭제 row 제외).
+        allow: 검색할 row 의 bool 마스크 (컬렉션 필터, 범위 밖 row 는 제외). None 이면 전체.
+        tombstone/allow 는 FAISS selector 로 검색 중에 거르므로 k 를 늘리지 않는다 (selector 를 못 쓰는 flat pq 만
+        최대 k × OVERFETCH_MAX 까지 더 가져와 거른다)."""
+        n = self.n_delta
+        if allow is not None:
+            mask, inverted = allow, False
+            if self.deleted:
+                dead = self.dead_mask()
+                m = min(len(mask), len(dead))
+                mask = mask.copy()
+                mask[:m] &= ~dead[:m]
+            frac = np.count_nonzero(mask) / max(self.base.ntotal, 1)
+        elif self.deleted:
+            mask, inverted = self.dead_mask(), True
+            frac = 1 - len(self.deleted) / max(self.base.ntotal, 1)
+        else:
+            mask = None
+        if mask is None:
+            D, I = self.base.search(qv, k)
+        elif supports_selector(self.base):
+            bits = np.packbits(mask, bitorder="little")
+            sel = member = faiss.IDSelectorBitmap(len(bits), faiss.swig_ptr(bits))
+            if inverted:
+                sel = faiss.IDSelectorNot(member)
+            D, I = self.base.search(qv, k, params=search_params(self.base, sel, k, frac))
+        else:
+            kk = k * OVERFETCH_MAX if allow is not None else min(k + len(self.deleted), k * OVERFETCH_MAX)
+            D, I = self.base.search(qv, kk)
+            D, I = _mask_hits(D, I, _member(I, mask, outside=False) != inverted)
+        if n:
+            S = qv @ self.delta[:n].T
+            ids = self.delta_ids[:n]
+            if mask is not None:
+                S[:, _member(ids, mask, outside=False) == inverted] = -np.inf
+            kd = min(k, n)
+            top = np.argpartition(-S, kd - 1, axis=1)[:, :kd]
+            D = np.hstack([D, np.take_along_axis(S, top, axis=1)])
+            I = np.hstack([I, ids[top]])
+        elif D.shape[1] == k:
+            return D, I
+        return topk(D, I, k)
+
+
+def id_mask(ids: np.ndarray, size: int = 0) -> np.ndarray:
+    """id 배열 → bool 마스크 (길이 = max(size, 최대 id + 1))"""
+    mask = np.zeros(max(size, int(ids.max()) + 1 if len(ids) else 0), dtype=bool)
+    mask[ids] = True
+    return mask
+
+
+def _member(ids: np.ndarray, mask: np.ndarray, outside: bool) -> np.ndarray:
+    # ids 가 mask 에 속하는지 (-1 은 False, 마스크 범위 밖은 outside)
+    inside = (ids >= 0) & (ids < len(mask))
+    if not len(mask):
+        return np.full(ids.shape, outside) & (ids >= 0)
+    out = np.where(inside, mask[np.where(inside, ids, 0)], outside)
+    return out & (ids >= 0)
+
+
+def _mask_hits(D: np.ndarray, I: np.ndarray, keep: np.ndarray):
+    return np.where(keep, D, -np.inf).astype("float32"), np.where(keep, I, -1)
+
+
+def topk(D: np.ndarray, I: np.ndarray, k: int):
+    """(nq, m) 후보 → 점수 순 상위 k (모자라면 -inf / -1)"""
+    nq, m = D.shape
+    outD = np.full((nq, k), -np.inf, dtype="float32")
+    outI = np.full((nq, k), -1, dtype="int64")
+    D = np.where(I >= 0, D, -np.inf)
+    if m > k:   # 후보가 많으면 상위 k 만 골라서 정렬
+        part = np.argpartition(-D, k - 1, axis=1)[:, :k]
+        D, I = np.take_along_axis(D, part, axis=1), np.take_along_axis(I, part, axis=1)
+    order = np.argsort(-D, axis=1, kind="stable")[:, :k]
+    outD[:, :order.shape[1]] = np.take_along_axis(D, order, axis=1)
+    outI[:, :order.shape[1]] = np.take_along_axis(I, order, axis=1)
+    outI[~np.isfinite(outD)] = -1
+    return outD, outI
+
+
+def supports_selector(index) -> bool:
+    # SearchParameters.sel 을 지원하지 않는 건 flat pq(IndexPQ) 뿐
+    return not (index_kind(index) == "flat" and index_storage(index) == "pq")
+
+
+def search_params(index, sel, k: int, frac: float = 1.0):
+    """selector 를 실은 종류별 SearchParameters (인덱스에 설정된 efSearch/nprobe 유지).
+    frac: 통과하는 벡터 비율 → 작을수록 HNSW efSearch / IVF nprobe 를 늘려 걸러진 뒤에도 k 개가 남게 한다."""
+    kind, base = index_kind(index), _base(index)
+    if kind == "hnsw":
+        params = faiss.SearchParametersHNSW()
+        params.efSearch = max(k, min(int(base.hnsw.efSearch / max(frac, 1e-6)), FILTER_EF_MAX))
+    elif kind == "ivf":
+        params = faiss.SearchParametersIVF()
+        params.nprobe = min(base.nlist, int(np.ceil(base.nprobe / max(frac, 1e-6))))
+    else:
+        params = faiss.SearchParameters()
+    params.sel = sel
+    return params
+
+
+def _index_ids(index) -> np.ndarray:
+    # 인덱스에 들어 있는 id 목록 (IndexIDMap 은 id_map, IVF 는 역리스트별 id)
+    if isinstance(index, faiss.IndexIDMap):
+        return faiss.vector_to_array(index.id_map)
+    ivf = faiss.extract_index_ivf(index)
+    invlists = ivf.invlists
+    parts = [faiss.rev_swig_ptr(invlists.get_ids(l), invlists.list_size(l)).copy()
+             for l in range(ivf.nlist) if invlists.list_size(l)]
+    return np.concatenate(parts) if parts else np.zeros(0, dtype="int64")
+
+
+def _clone(index, shared: bool):
+    # mmap 으로 연 인덱스는 clone_index 후 add 하면 faiss 가 abort 하므로 직렬화 왕복으로 소유 복사본을 만든다
+    if shared:
+        return faiss.deserialize_index(faiss.serialize_index(index))
+    return faiss.clone_index(index)
+
+
+def _read_index(path: str, shared: bool):
+    # 공유 모드: 코드 배열을 복사하지 않고 파일에 mmap (워커들이 같은 페이지 캐시를 읽는다, IVF 리스트는 예외)
+    if shared:
+        return faiss.read_index(path, faiss.IO_FLAG_MMAP_IFC | faiss.IO_FLAG_READ_ONLY)
+    return faiss.read_index(path)
+
+
+class VectorIndex:
+    """FAISS 인덱스 래퍼. 벡터 id = DOCS row (스냅샷 row 와 동일).
+    copy-on-write: 추가/삭제는 새 IndexVersion 을 만들어 self.version 참조만 바꾼다 (검색은 락 없이 버전 하나를 사용).
+    - 추가: delta 버퍼에 float 벡터로 append, QA_DELTA_MAX 개가 차면 base 복제본에 합쳐 새 base 로 교체 (merge)
+    - 삭제: tombstone (deleted, 검색 중 selector 로 거름). flat/IVF 는 tombstone 이 TOMBSTONE_RATIO 를 넘으면 merge
+      (remove_ids), HNSW 는 삭제 불가라 maybe_promote 에서 살아있는 벡터로 재구축한다.
+    양자화 저장(sq8/pq)은 학습 가능한 벡터 수가 되면 승격과 같은 방식으로 전환한다.
+    승격/merge 시 새 인덱스를 다 만든 뒤 참조만 교체하므로 검색은 멈추지 않는다."""
+
+    def __init__(self, dim: int, cfg: Optional[IndexConfig] = None):
+        self.dim = dim
+        self.cfg = cfg or IndexConfig()
+        self.version = IndexVersion(build_index("flat", dim, np.zeros((0, dim), dtype="float32"), self.cfg))
+        self._lock = threading.RLock()  # writer 직렬화 (add/삭제/merge/승격, merge 중 save 재진입). 검색은 락 없이
+        self.rows = 0                   # 지금까지 추가된 최대 id + 1 (= 반영된 스냅샷 row 수)
+        self.saved_rows = 0             # 디스크에 저장된 ANN 인덱스가 반영한 스냅샷 row 수
+        self.saved_file: Optional[str] = None
+        self.store_dir: Optional[str] = None
+        self.merges = 0
+
+    @property
+    def index(self):
+        return self.version.base
+
+    @property
+    def deleted(self) -> FrozenSet[int]:
+        return self.version.deleted
+
+    @property
+    def ntotal(self) -> int:
+        return self.version.ntotal
+
+    @property
+    def kind(self) -> str:
+        return index_kind(self.version.base)
+
+    @property
+    def storage(self) -> str:
+        return index_storage(self.version.base)
+
+    @property
+    def persist(self) -> bool:
+        # 디스크에 저장해 두는 인덱스: 재시작 시 재학습/재구축이 필요한 인덱스, 공유 모드는 항상 (워커 간 공유)
+        return self.cfg.shared or self.kind != "flat" or self.storage != "float"
+
+    def search(self, qv: np.ndarray, k: int, exact: Optional[np.ndarray] = None,
+               version: Optional[IndexVersion] = None, rows: Optional[np.ndarray] = None):
+        """version: 요청이 잡아 둔 버전 (None 이면 현재 버전).
+        exact: row 순 float 벡터 (스냅샷 mmap). 양자화 인덱스면 k × cfg.rescore 후보를 exact 로 재정렬.
+        rows: 이 row 들만 검색 (컬렉션 필터, 정렬된 배열). 인덱스 검색에 selector 로 넘기고
+        (HNSW efSearch / IVF nprobe 는 비율만큼 늘림), HNSW 에서 비율이 너무 작으면 exact 전수 내적."""
+        v = version or self.version
+        quantized = exact is not None and self.cfg.rescore > 0 and index_storage(v.base) != "float"
+        kk = k * self.cfg.rescore if quantized else k
+        allow = None
+        if rows is not None:
+            if not len(rows):
+                return np.full((qv.shape[0], k), -np.inf, dtype="float32"), np.full((qv.shape[0], k), -1, dtype="int64")
+            # HNSW 는 고른 비율이 작으면 걸러진 뒤 k 개를 찾을 efSearch 가 FILTER_EF_MAX 를 넘는다 → 그 row 만 전수 내적
+            # (flat pq 는 selector 미지원). flat/IVF 는 selector 로 고른 row 만 내적한다 (복사 없음)
+            frac = len(rows) / max(v.base.ntotal, 1)
+            scan = not supports_selector(v.base) or (
+                index_kind(v.base) == "hnsw" and max(self.cfg.ef_search, kk) > FILTER_EF_MAX * frac)
+            if exact is not None and scan and rows[-1] < exact.shape[0]:
+                return exact_search(qv, exact, rows, k)
+            allow = id_mask(rows)
+        if not quantized:
+            return v.search(qv, k, allow)
+        D, I = v.search(qv, kk, allow)
+        return rescore(qv, D, I, exact, k)
+
+    def add(self, vecs: np.ndarray, ids: np.ndarray, merge: bool = True):
+        ids = np.asarray(ids, dtype="int64")
+        if not len(ids):
+            return
+        vecs = np.ascontiguousarray(vecs, dtype="float32").reshape(len(ids), self.dim)
+        with self._lock:
+            v = self.version
+            n, b = v.n_delta, len(ids)
+            delta, delta_ids = v.delta, v.delta_ids
+            if delta is None or n + b > len(delta):
+                # 버퍼가 모자라면 새로 잡아 복사 (이전 버전은 예전 버퍼를 계속 본다)
+                cap = max(min(1024, self.cfg.delta_max), 2 * (n + b))
+                delta = np.zeros((cap, self.dim), dtype="float32")
+                delta_ids = np.full(cap, -1, dtype="int64")
+                if n:
+                    delta[:n], delta_ids[:n] = v.delta[:n], v.delta_ids[:n]
+            delta[n:n + b], delta_ids[n:n + b] = vecs, ids
+            self.version = IndexVersion(v.base, delta, delta_ids, n + b, v.deleted, v.base_rows)
+            self.rows = max(self.rows, int(ids.max()) + 1)
+            if merge and n + b >= self.cfg.delta_max:
+                self._merge()
+
+    def remove(self, ids, merge: bool = True) -> int:
+        ids = np.asarray(list(ids), dtype="int64")
+        if not len(ids):
+            return 0
+        with self._lock:
+            v = self.version
+            self.version = IndexVersion(v.base, v.delta, v.delta_ids, v.n_delta,
+                                        v.deleted | frozenset(ids.tolist()), v.base_rows)
+            if merge and self.kind != "hnsw" and self._stale():
+                self._merge()
+        return len(ids)
+
+    def _stale(self) -> bool:
+        # tombstone 이 base 의 TOMBSTONE_RATIO 를 넘었는지 (삭제 개수가 아니라 비율로 정리 시점을 정한다)
+        return len(self.deleted) > TOMBSTONE_RATIO * max(self.index.ntotal, 1)
+
+    def _merge(self):
+        """(writer 락 보유) base 복제본에 delta 추가 + tombstone 제거 → 새 base 로 게시"""
+        v = self.version
+        t0 = time.perf_counter()
+        base = _clone(v.base, self.cfg.shared)
+        apply_search_params(base, self.cfg)
+        if v.n_delta:
+            base.add_with_ids(v.delta[:v.n_delta], v.delta_ids[:v.n_delta])
+        deleted = v.deleted
+        if deleted and index_kind(base) != "hnsw":
+            base.remove_ids(np.fromiter(deleted, dtype="int64", count=len(deleted)))
+            deleted = frozenset()
+        self.version = IndexVersion(base, deleted=deleted, base_rows=self.rows)
+        self.merges += 1
+        log.info(f"vindex: delta {v.n_delta} merge, n={base.ntotal}, {time.perf_counter() - t0:.2f}s")
+        if self.cfg.shared and self.store_dir:
+            self.save(self.store_dir)   # 다른 워커가 follow() 로 새 base 를 연다
+
+    def set_search_params(self, ef_search: Optional[int] = None, nprobe: Optional[int] = None,
+                          rescore: Optional[int] = None):
+        if ef_search is not None:
+            self.cfg.ef_search = ef_search
+        if nprobe is not None:
+            self.cfg.nprobe = nprobe
+        if rescore is not None:
+            self.cfg.rescore = rescore
+        apply_search_params(self.version.base, self.cfg)
+
+    def maybe_promote(self, all_vecs: np.ndarray, live: np.ndarray, store_dir: Optional[str] = None) -> bool:
+        """살아있는 벡터 수 기준 목표 종류/저장 방식과 다르거나 HNSW tombstone 이 많으면
+        all_vecs(스냅샷 전체 벡터, row 순)[live] 로 재구축.
+        ANN/양자화 인덱스는 store_dir 에 저장해 재시작 시 재학습/재구축을 피한다."""
+        target = self.cfg.target_kind(len(live))
+        storage = self.cfg.target_storage(len(live))
+        if target == self.kind and storage == self.storage and not self._stale():
+            return False
+        t0 = time.perf_counter()
+        new_index = build_index(target, self.dim, all_vecs[live], self.cfg, ids=live, storage=storage)
+        with self._lock:
+            self.rows = all_vecs.shape[0]
+            self.version = IndexVersion(new_index, base_rows=self.rows)
+        log.info(f"vindex: {target}/{storage} 로 재구축, n={new_index.ntotal}, {time.perf_counter() - t0:.1f}s")
+        if store_dir and self.persist:
+            self.save(store_dir)
+        return True
+
+    def maybe_save(self, store_dir: str) -> bool:
+        """merge 로 base 에 반영된 추가분이 많아지면 ANN 인덱스를 다시 저장 (재시작 시 tail add 최소화)."""
+        if not self.persist:
+            return False
+        if self.version.base_rows - self.saved_rows <= RESAVE_RATIO * max(self.saved_rows, 1):
+            return False
+        self.save(store_dir)
+        return True
+
+    # ---------- 저장/복원 (ANN/양자화만 저장: float flat 은 스냅샷 벡터에서 바로 재구성, 공유 모드는 전부 저장) ----------
+    def save(self, store_dir: str):
+        # 게시된 base 는 바뀌지 않으므로 락 없이 써도 된다 (delta 는 재시작 시 스냅샷 tail 로 다시 추가)
+        v = self.version
+        os.makedirs(store_dir, exist_ok=True)
+        # 공유 모드: 다른 워커가 이전 파일을 mmap 중일 수 있으므로 덮어쓰지 않고 새 이름으로
+        name = f"ann-{time.time_ns()}.index" if self.cfg.shared else ANN_FILE
+        tmp = os.path.join(store_dir, f"{name}.{os.getpid()}.tmp")
+        faiss.write_index(v.base, tmp)
+        os.replace(tmp, os.path.join(store_dir, name))
+        meta = {"kind": index_kind(v.base), "storage": index_storage(v.base), "rows": v.base_rows,
+                "dim": self.dim, "ids": True, "file": name}
+        tmp = os.path.join(store_dir, f"{ANN_META}.{os.getpid()}.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        os.replace(tmp, os.path.join(store_dir, ANN_META))
+        self.saved_rows, self.saved_file = v.base_rows, name
+        if self.cfg.shared:
+            # 방금 쓴 파일을 mmap 으로 다시 열어 개인 메모리 사본을 버린다 (검색 결과는 같음)
+            mm = _read_index(os.path.join(store_dir, name), True)
+            apply_search_params(mm, self.cfg)
+            with self._lock:
+                cur = self.version
+                if cur.base is v.base:
+                    self.version = IndexVersion(mm, cur.delta, cur.delta_ids, cur.n_delta, cur.deleted,
+                                                cur.base_rows)
+            self._remove_old_files(store_dir, name)
+
+    def _remove_old_files(self, store_dir: str, keep: str):
+        # 직전 파일 1개는 남긴다 (ann.json 을 막 읽은 워커가 열 수 있도록). 이미 mmap 한 워커는 unlink 돼도 계속 읽힌다
+        files = sorted(f for f in os.listdir(store_dir) if f.startswith("ann-") and f.endswith(".index"))
+        for f in files[:-2]:
+            if f != keep:
+                try:
+                    os.remove(os.path.join(store_dir, f))
+                except OSError:
+                    pass
+
+    def _saved_meta(self, store_dir: str, n: int, live: np.ndarray) -> Optional[Dict]:
+        # 저장본이 지금 스냅샷(n row)과 목표 종류/저장 방식에 맞으면 그 메타
+        meta_path = os.path.join(store_dir, ANN_META)
+        if not os.path.exists(meta_path):
+            return None
+        with open(meta_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get("ids") and meta.get("dim") == self.dim and meta.get("rows", 0) <= n \
+                and meta.get("kind") == self.cfg.target_kind(len(live)) \
+                and meta.get("storage", "float") == self.cfg.target_storage(len(live)):
+            return meta
+        return None
+
+    def _open_saved(self, store_dir: str, meta: Dict, all_vecs: np.ndarray, live: np.ndarray) -> IndexVersion:
+        """저장본 + 그 이후 스냅샷 변경분으로 버전 구성 (게시 전).
+        단일 프로세스: 이후 추가분을 인덱스에 직접 add, 삭제분은 remove_ids (HNSW 는 tombstone).
+        공유 모드: 인덱스는 mmap(read-only) 그대로 두고 추가분은 delta, 삭제분은 tombstone."""
+        shared = self.cfg.shared
+        n = all_vecs.shape[0]
+        index = _read_index(os.path.join(store_dir, meta.get("file", ANN_FILE)), shared)
+        apply_search_params(index, self.cfg)
+        saved_rows = int(meta["rows"])
+        tail = live[live >= saved_rows]
+        delta = delta_ids = None
+        if len(tail) and shared:
+            delta = np.ascontiguousarray(all_vecs[tail], dtype="float32")
+            delta_ids = tail.copy()
+        elif len(tail):
+            index.add_with_ids(np.ascontiguousarray(all_vecs[tail], dtype="float32"), tail)
+        # 저장 이후 삭제된 row 중 저장본에 남아 있는 것
+        alive = np.zeros(n, dtype=bool)
+        alive[live] = True
+        dead = np.flatnonzero(~alive[:saved_rows])
+        deleted: FrozenSet[int] = frozenset()
+        if len(dead):
+            if shared or index_kind(index) == "hnsw":
+                dead = dead[np.isin(dead, _index_ids(index))]
+                deleted = frozenset(dead.tolist())
+            else:
+                index.remove_ids(dead)
+        self.saved_rows, self.saved_file = saved_rows, meta.get("file", ANN_FILE)
+        n_delta = 0 if delta is None else len(delta)
+        return IndexVersion(index, delta, delta_ids, n_delta, deleted, saved_rows if shared else n)
+
+    def load(self, store_dir: str, all_vecs: np.ndarray, live: np.ndarray):
+        """스냅샷 전체 벡터(all_vecs, mmap)와 살아있는 row(live)로 인덱스 복원.
+        저장된 ANN 이 있으면 읽고 그 이후 추가분/삭제분만 반영, 없으면 목표 종류로 구축."""
+        self.store_dir = store_dir
+        n = all_vecs.shape[0]
+        live = np.asarray(live, dtype="int64")
+        saved = self._saved_meta(store_dir, n, live)
+        if saved is not None:
+            version = self._open_saved(store_dir, saved, all_vecs, live)
+        else:
+            index = build_index(self.cfg.target_kind(len(live)), self.dim, all_vecs[live], self.cfg,
+                                ids=live, storage=self.cfg.target_storage(len(live)))
+            version = IndexVersion(index, base_rows=n)
+        with self._lock:
+            self.rows = n
+            self.version = version
+        if saved is None and self.persist:
+            self.save(store_dir)
+
+    def follow(self, all_vecs: np.ndarray, new_rows: np.ndarray, deleted_rows: np.ndarray, live: np.ndarray):
+        """(공유 모드) 다른 워커가 쓴 스냅샷 변경분 반영. 그 워커가 merge/승격해 새 파일을 저장했으면 그걸 mmap 으로
+        열고, 아니면 new_rows 는 delta 에, deleted_rows 는 tombstone 으로 (merge 는 쓰기 락을 가진 워커만 한다)."""
+        live = np.asarray(live, dtype="int64")
+        meta = self._saved_meta(self.store_dir, all_vecs.shape[0], live)
+        if meta is not None and meta.get("file") != self.saved_file:
+            try:
+                version = self._open_saved(self.store_dir, meta, all_vecs, live)
+            except (OSError, RuntimeError) as e:   # 그 사이 다음 파일로 교체돼 지워진 경우 → 다음 동기화에서
+                log.warning(f"vindex: follow {meta.get('file')} failed: {e}")
+            else:
+                with self._lock:
+                    self.rows = all_vecs.shape[0]
+                    self.version = version
+                return
+        new_rows = np.asarray(new_rows, dtype="int64")
+        new_rows = new_rows[np.isin(new_rows, live)]
+        self.add(all_vecs[new_rows], new_rows, merge=False)
+        self.remove(deleted_rows, merge=False)
+
+    def status(self) -> Dict:
+        v = self.version
+        nbytes = code_size(v.base)
+        return {"kind": self.kind, "storage": self.storage, "ntotal": v.ntotal,
+                "tombstones": len(v.deleted), "delta": v.n_delta, "merges": self.merges,
+                "rows": self.rows, "saved_rows": self.saved_rows, "shared": self.cfg.shared,
+                "bytes_per_vector": nbytes, "codes_mb": round(nbytes * v.base.ntotal / 2**20, 2),
+                "config": self.cfg.as_dict()}